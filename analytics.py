@@ -0,0 +1,189 @@
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+
+from repository import EVENT_TABLES
+
+logger = logging.getLogger(__name__)
+
+# ==================== ANALYTIQUE ====================
+# Téléchargements, likes et vues par jour, catégorie, type, auteur et gratuit/premium.
+# Les tables d'événements sont lues par lots d'ids croissants et agrégées dans un
+# cumul persistant (migrations/009) ; chaque lot avance le filigrane de sa table
+# dans la même transaction. Une mise à jour ne lit donc que les nouveaux événements,
+# et la mémoire reste bornée par la taille d'un lot quel que soit le volume total.
+# Les événements de moins de SAFETY_LAG secondes ne sont pas encore agrégés : des
+# insertions concurrentes peuvent valider un id plus petit après un plus grand, qui
+# serait sinon sauté pour toujours par le filigrane.
+
+EVENTS = tuple(EVENT_TABLES)  # 'downloads', 'likes', 'views'
+CHUNK_SIZE = 5000
+MAX_CHUNKS_PER_REFRESH = 20  # par table : le rattrapage d'un gros historique se fait en plusieurs fois
+ASSET_LOOKUP_BATCH = 500  # ids par requête `in`
+SAFETY_LAG = 60.0
+UNKNOWN_ASSET = {'category': '', 'asset_type': '', 'author': '', 'is_premium': False}
+
+
+class AssetAttributes:
+    """Catégorie, type, auteur et premium des assets, lus une fois par processus."""
+
+    def __init__(self, get_assets):
+        self._get_assets = get_assets
+        self._lock = threading.Lock()
+        self._attributes = {}
+
+    def lookup(self, asset_ids):
+        with self._lock:
+            missing = [asset_id for asset_id in set(asset_ids) if asset_id not in self._attributes]
+        found = {}
+        for start in range(0, len(missing), ASSET_LOOKUP_BATCH):
+            rows = self._get_assets(missing[start:start + ASSET_LOOKUP_BATCH], 'id,category,asset_type,author,is_premium')
+            found.update((row['id'], {
+                'category': row['category'] or '',
+                'asset_type': row['asset_type'] or '',
+                'author': row['author'] or '',
+                'is_premium': bool(row['is_premium']),
+            }) for row in rows)
+        with self._lock:
+            # Un asset supprimé depuis l'événement est compté sans attributs
+            for asset_id in missing:
+                self._attributes[asset_id] = found.get(asset_id, UNKNOWN_ASSET)
+            return {asset_id: self._attributes[asset_id] for asset_id in asset_ids}
+
+
+def aggregate_chunk(events, attributes):
+    """Lot d'événements -> deltas du cumul [{'day', 'category', ..., 'count'}]."""
+    assets = attributes.lookup([event['asset_id'] for event in events])
+    counts = Counter()
+    for event in events:
+        asset = assets[event['asset_id']]
+        # Jour UTC : les dates sont stockées en ISO 8601 UTC
+        key = (str(event['created_at'])[:10], asset['category'], asset['asset_type'], asset['author'], asset['is_premium'])
+        counts[key] += event['count']
+    return [{'day': day, 'category': category, 'asset_type': asset_type, 'author': author,
+             'is_premium': is_premium, 'count': count}
+            for (day, category, asset_type, author, is_premium), count in counts.items()]
+
+
+class RollupRefresher:
+    """Met le cumul à jour au plus une fois par `min_interval` secondes, pour tout le processus.
+
+    Entre processus, le filigrane comparé-puis-avancé de apply_analytics_chunk
+    garantit qu'un lot n'est ajouté qu'une fois.
+    """
+
+    def __init__(self, repo, min_interval=60.0, chunk_size=CHUNK_SIZE, max_chunks=MAX_CHUNKS_PER_REFRESH,
+                 safety_lag=SAFETY_LAG, clock=time.monotonic, now=lambda: datetime.now(timezone.utc)):
+        self._repo = repo
+        self.safety_lag = safety_lag
+        self._now = now
+        self.min_interval = min_interval
+        self.chunk_size = chunk_size
+        self.max_chunks = max_chunks
+        self._clock = clock
+        self._attributes = AssetAttributes(repo.get_assets)
+        self._lock = threading.Lock()
+        self._last_refresh = None
+        self.caught_up = True
+        self.processed = Counter()  # événements agrégés par ce processus, par table
+
+    def refresh(self, force=False):
+        """Agrège les nouveaux événements ; renvoie {table: nombre} pour cet appel."""
+        # Une seule mise à jour à la fois : les autres sessions lisent le cumul tel quel
+        if not self._lock.acquire(blocking=False):
+            return {}
+        try:
+            if not force and self._last_refresh is not None and self._clock() - self._last_refresh < self.min_interval:
+                return {}
+            processed = Counter()
+            caught_up = True
+            watermarks = self._repo.get_watermarks()
+            for source in EVENTS:
+                count, done = self._refresh_source(source, watermarks.get(source, 0))
+                processed[source] = count
+                caught_up = caught_up and done
+            self._last_refresh = self._clock()
+            self.caught_up = caught_up
+            self.processed.update(processed)
+            return dict(processed)
+        finally:
+            self._lock.release()
+
+    def _refresh_source(self, source, last_id):
+        # (événements agrégés, vrai si la table est entièrement rattrapée)
+        processed = 0
+        cutoff = self._now() - timedelta(seconds=self.safety_lag)
+        for _ in range(self.max_chunks):
+            events = self._repo.events_after(source, last_id, self.chunk_size)
+            # Le filigrane n'avance que sur des ids consécutifs tous plus vieux que `cutoff`
+            recent = next((i for i, event in enumerate(events) if _created_at(event) >= cutoff), None)
+            if recent is not None:
+                events = events[:recent]
+            if not events:
+                return processed, True
+            next_id = events[-1]['id']
+            if not self._repo.apply_analytics_chunk(source, last_id, next_id, aggregate_chunk(events, self._attributes)):
+                # Un autre processus a agrégé ce lot : on repart de son filigrane
+                logger.info("Filigrane %s avancé par un autre processus", source)
+                last_id = self._repo.get_watermarks().get(source, 0)
+                continue
+            processed += len(events)
+            last_id = next_id
+            if recent is not None or len(events) < self.chunk_size:
+                return processed, True
+        return processed, False
+
+
+def _created_at(event):
+    created_at = event['created_at']
+    if isinstance(created_at, str):
+        created_at = datetime.fromisoformat(created_at)
+    # Horodatage sans fuseau (SQLite ancien) : UTC
+    return created_at if created_at.tzinfo else created_at.replace(tzinfo=timezone.utc)
+
+
+def since_day(days, today=None):
+    # Jours du cumul en UTC, comme aggregate_chunk
+    return ((today or datetime.now(timezone.utc).date()) - timedelta(days=days - 1)).isoformat()
+
+
+def summarize(rows, top_authors=20):
+    """Lignes du cumul (itérables, lues une à une) -> tableaux du tableau de bord."""
+    by_day = defaultdict(Counter)
+    by_category = defaultdict(Counter)
+    by_type = defaultdict(Counter)
+    by_author = defaultdict(Counter)
+    by_tier = defaultdict(Counter)
+    for row in rows:
+        event, count = row['event'], row['count']
+        by_day[str(row['day'])][event] += count
+        by_category[row['category'] or '—'][event] += count
+        by_type[row['asset_type'] or '—'][event] += count
+        by_author[row['author'] or '—'][event] += count
+        by_tier[bool(row['is_premium'])][event] += count
+
+    def table(groups, label):
+        return [{label: key, **{event: counts[event] for event in EVENTS}} for key, counts in groups.items()]
+
+    def by_downloads(rows):
+        return sorted(rows, key=lambda row: (-row['downloads'], -row['views']))
+
+    conversion = []
+    for premium in (False, True):
+        counts = by_tier[premium]
+        conversion.append({
+            'offre': "Premium" if premium else "Gratuit",
+            **{event: counts[event] for event in EVENTS},
+            # Part des vues suivies d'un téléchargement (ou d'un like), en pourcentage
+            'téléchargements / vue': 100 * counts['downloads'] / counts['views'] if counts['views'] else 0.0,
+            'likes / vue': 100 * counts['likes'] / counts['views'] if counts['views'] else 0.0,
+        })
+    return {
+        'days': sorted(table(by_day, 'jour'), key=lambda row: row['jour']),
+        'categories': by_downloads(table(by_category, 'catégorie')),
+        'types': by_downloads(table(by_type, 'type')),
+        'authors': by_downloads(table(by_author, 'auteur'))[:top_authors],
+        'conversion': conversion,
+    }
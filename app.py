@@ -1,16 +1,28 @@
 import streamlit as st
 from datetime import datetime
 import base64
-from io import BytesIO
-from PIL import Image
-import pandas as pd
+import hashlib
+import logging
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FetchTimeout
 
-try:
-    from supabase import create_client, Client
-    SUPABASE_AVAILABLE = True
-except ImportError:
-    SUPABASE_AVAILABLE = False
-    st.error("⚠️ Supabase n'est pas installé. Utilisez: pip install supabase")
+from blob_store import make_blob_store, is_blob_ref, key_from_ref, content_type_for
+from images import build_derivatives, store_built_derivatives
+from perceptual import HashIndex
+from bulk_upload import collect_images, read_metadata, import_images, error_report_csv
+from analytics import RollupRefresher, since_day, summarize
+from events import EventAggregator
+from search import matches_query, tokenize
+from cache import MISS, QueryCache, ImageCache, LastGoodCache
+from repository import make_repository
+from instrumentation import REGISTRY as metrics, Instrumented
+from resilience import BackendUnavailable, ResilientRepository
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+logger = logging.getLogger(__name__)
 
 # Configuration de la page
 st.set_page_config(
@@ -23,61 +35,120 @@ st.set_page_config(
 # ==================== CONFIGURATION SUPABASE ====================
 # Configuration sécurisée via Streamlit Secrets
 
-try:
-    SUPABASE_URL = st.secrets["SUPABASE_URL"]
-    # Essayer d'abord SUPABASE_KEY, sinon SUPABASE_SERVICE_KEY
-    SUPABASE_KEY = st.secrets.get("SUPABASE_KEY", st.secrets.get("SUPABASE_SERVICE_KEY"))
-    
-    # Debug : Afficher les infos (masquer la clé)
-    st.sidebar.success("✅ Secrets chargés")
-    st.sidebar.text(f"URL: {SUPABASE_URL}")
-    st.sidebar.text(f"Key début: {SUPABASE_KEY[:30]}...")
-    st.sidebar.text(f"Key fin: ...{SUPABASE_KEY[-30:]}")
-    st.sidebar.text(f"Longueur clé: {len(SUPABASE_KEY)} caractères")
+def get_secret(name, default=None):
+    # Sans fichier secrets.toml (développement hors ligne), les variables d'environnement
+    # prennent le relais, puis la valeur par défaut
+    try:
+        return st.secrets.get(name, os.environ.get(name, default))
+    except FileNotFoundError:
+        return os.environ.get(name, default)
+
+# Backend de données : "supabase" (production) ou "sqlite" (fichier local ou
+# ":memory:", sans projet Supabase — développement hors ligne et benchmarks)
+DATA_BACKEND = get_secret("DATA_BACKEND", "supabase")
+SQLITE_PATH = get_secret("SQLITE_PATH", ":memory:")
+
+if DATA_BACKEND == "supabase":
+    try:
+        SUPABASE_URL = get_secret("SUPABASE_URL")
+        # Essayer d'abord SUPABASE_KEY, sinon SUPABASE_SERVICE_KEY
+        SUPABASE_KEY = get_secret("SUPABASE_KEY", get_secret("SUPABASE_SERVICE_KEY"))
+        for name, value in (("SUPABASE_URL", SUPABASE_URL), ("SUPABASE_KEY", SUPABASE_KEY)):
+            if not value:
+                raise KeyError(name)
     
-    # Détecter le type de clé
-    if SUPABASE_KEY.startswith("sb_secret_"):
-        st.sidebar.warning("⚠️ Utilise service_role key")
-    elif "anon" in SUPABASE_KEY or len(SUPABASE_KEY) > 200:
-        st.sidebar.info("ℹ️ Utilise anon key")
+        # Rien de la clé n'est affiché : le type est seulement signalé dans les logs du serveur
+        if SUPABASE_KEY.startswith("sb_secret_"):
+            logger.warning("Clé Supabase service_role utilisée par l'application publique")
     
-except KeyError as e:
-    st.error(f"❌ Clé manquante dans Secrets: {e}")
-    st.info("Allez dans Settings → Secrets et ajoutez:")
-    st.code("""
+    except KeyError as e:
+        st.error(f"❌ Clé manquante dans Secrets: {e}")
+        st.info("Allez dans Settings → Secrets et ajoutez:")
+        st.code("""
 SUPABASE_URL = "https://majdvgokkvwjvtuqhncd.supabase.co"
 SUPABASE_KEY = "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9..."
-    """)
-    st.stop()
-except Exception as e:
-    st.error(f"❌ Erreur lecture Secrets: {e}")
-    st.stop()
+        """)
+        st.stop()
+    except Exception as e:
+        st.error(f"❌ Erreur lecture Secrets: {e}")
+        st.stop()
+
+# Délai d'une requête HTTP vers Supabase (120 s par défaut dans le client)
+BACKEND_TIMEOUT = 3
 
 # Initialiser Supabase
 @st.cache_resource
 def init_supabase():
-    if not SUPABASE_AVAILABLE:
+    if DATA_BACKEND != "supabase":
         return None
+    # Importé seulement pour ce backend : le client pèse un tiers de seconde au démarrage
     try:
-        client = create_client(SUPABASE_URL, SUPABASE_KEY)
-        # Tester la connexion
-        test = client.table('users').select('id').limit(1).execute()
-        st.sidebar.success(f"✅ Connexion Supabase OK")
-        return client
-    except Exception as e:
-        st.sidebar.error(f"❌ Erreur connexion: {str(e)[:100]}")
-        # Essayer quand même de retourner le client
-        try:
-            return create_client(SUPABASE_URL, SUPABASE_KEY)
-        except:
-            return None
+        from supabase import ClientOptions, create_client
+    except ImportError:
+        st.error("⚠️ Supabase n'est pas installé. Utilisez: pip install supabase")
+        return None
+    # Pas de requête de test : la première vraie lecture signale une connexion impossible.
+    # Un seul client pour le processus : toutes les sessions partagent son pool de connexions HTTP.
+    try:
+        return create_client(SUPABASE_URL, SUPABASE_KEY, ClientOptions(
+            postgrest_client_timeout=BACKEND_TIMEOUT, storage_client_timeout=BACKEND_TIMEOUT))
+    except Exception:
+        logger.exception("Client Supabase impossible à créer")
+        return None
 
 supabase = init_supabase()
 
+# Stockage des images : "supabase" (Supabase Storage) ou "local" (disque)
+BLOB_BACKEND = get_secret("BLOB_BACKEND", "supabase" if DATA_BACKEND == "supabase" else "local")
+BLOB_BUCKET = get_secret("BLOB_BUCKET", "assets")
+BLOB_DIR = get_secret("BLOB_DIR", ".blobs")
+
+@st.cache_resource
+def init_blob_store():
+    try:
+        return Instrumented(make_blob_store(BLOB_BACKEND, client=supabase, bucket=BLOB_BUCKET, root=BLOB_DIR), "blob_store")
+    except Exception:
+        logger.exception("Initialisation du stockage d'images impossible")
+        return None
+
+blob_store = init_blob_store()
+
+# Recherche : "postgres" (plein texte indexé, migrations/006) ou "memory" (index inversé local).
+# Le backend SQLite utilise toujours l'index en mémoire.
+SEARCH_BACKEND = get_secret("SEARCH_BACKEND", "postgres")
+
+# Appels simultanés vers la base, toutes sessions confondues (voir resilience.py)
+BACKEND_MAX_CONCURRENT = 16
+# Plus aucune reprise d'une lecture ne commence après ce délai : une lecture dure au
+# plus BACKEND_READ_DEADLINE + BACKEND_TIMEOUT, moins que FETCH_TIMEOUT, si bien que
+# l'interface n'abandonne pas une lecture encore en cours de reprises.
+BACKEND_READ_DEADLINE = 1.5
+
+@st.cache_resource
+def init_repository():
+    try:
+        repo = make_repository(DATA_BACKEND, client=supabase, path=SQLITE_PATH, search_backend=SEARCH_BACKEND)
+        # Chaque tentative est mesurée (durée, lignes, octets) dans le registre de métriques ;
+        # la couche de résilience borne, retente et coupe les appels par-dessus
+        repo = ResilientRepository(Instrumented(repo, "repository"), max_concurrent=BACKEND_MAX_CONCURRENT,
+                                   deadline=BACKEND_READ_DEADLINE)
+        metrics.register_stats("backend", repo.stats)
+        return repo
+    except Exception:
+        logger.exception("Initialisation du backend de données impossible")
+        return None
+
+repo = init_repository()
+
+# Panneau d'instrumentation (traces des reruns, export des métriques) : réservé aux opérateurs
+DEBUG_PANEL = str(get_secret("DEBUG_PANEL", False)).lower() in ("1", "true")
+
 # ==================== SESSION STATE ====================
 
 if 'username' not in st.session_state:
     st.session_state.username = f"user_{datetime.now().timestamp()}"
+    # Ligne `users` créée au premier like ou téléchargement seulement (voir current_user_id)
+    st.session_state.user_id = None
 if 'is_admin' not in st.session_state:
     st.session_state.is_admin = False
 if 'dark_mode' not in st.session_state:
@@ -90,6 +161,31 @@ if 'selected_type' not in st.session_state:
     st.session_state.selected_type = "Tous"
 if 'show_premium_only' not in st.session_state:
     st.session_state.show_premium_only = False
+if 'sort_by' not in st.session_state:
+    st.session_state.sort_by = "Plus récent"
+if 'listing_key' not in st.session_state:
+    # Pages déjà chargées pour les filtres courants (voir load_more_assets)
+    st.session_state.listing_key = None
+    st.session_state.listing_rows = []
+    st.session_state.listing_cursor = None
+    st.session_state.listing_total = 0
+if 'liked_ids' not in st.session_state:
+    st.session_state.liked_ids = set()
+    st.session_state.like_checked_ids = set()
+if 'viewed_ids' not in st.session_state:
+    st.session_state.viewed_ids = set()
+if 'similar_open' not in st.session_state:
+    # Cartes dont le bandeau "images similaires" est ouvert
+    st.session_state.similar_open = set()
+if 'trace_session' not in st.session_state:
+    # Identifiant opaque qui relie les traces de la session (jamais le nom d'utilisateur)
+    st.session_state.trace_session = uuid.uuid4().hex
+
+# Trace du rerun complet ; les fragments relancés seuls ouvrent leur propre trace (voir phase)
+metrics.start_trace("page", st.session_state.trace_session)
+
+def phase(name):
+    return metrics.phase(name, st.session_state.trace_session)
 
 # CSS personnalisé
 if st.session_state.dark_mode:
@@ -158,26 +254,100 @@ else:
     </style>
     """, unsafe_allow_html=True)
 
-# ==================== FONCTIONS SUPABASE ====================
+# ==================== FONCTIONS DONNÉES ====================
 
 def get_user_id(username):
-    if not supabase:
-        return 1
+    if not repo:
+        return None
     try:
-        # Vérifier si l'utilisateur existe
-        result = supabase.table('users').select('id').eq('username', username).execute()
-        
-        if result.data:
-            return result.data[0]['id']
-        else:
-            # Créer nouvel utilisateur
-            new_user = supabase.table('users').insert({'username': username}).execute()
-            return new_user.data[0]['id']
+        return repo.get_or_create_user(username)
     except Exception as e:
         st.error(f"Erreur utilisateur: {e}")
-        return 1
+        return None
+
+def current_user_id():
+    # Une session qui ne fait que parcourir le catalogue n'écrit rien en base : le compte
+    # est créé à la première action qui en a besoin (like, téléchargement, publication)
+    if st.session_state.user_id is None:
+        st.session_state.user_id = get_user_id(st.session_state.username)
+    return st.session_state.user_id
+
+def store_image(derivatives):
+    # Miniature, aperçu et original (voir build_derivatives) : renvoie les colonnes
+    # image_url / preview_url / thumb_url et les empreintes perceptuelles
+    return store_built_derivatives(blob_store, derivatives)
+
+# Images décodées partagées par toutes les sessions, dans un budget d'octets
+IMAGE_CACHE_BYTES = 128 * 1024 * 1024
+
+@st.cache_resource
+def init_image_cache():
+    cache = ImageCache(max_bytes=IMAGE_CACHE_BYTES)
+    metrics.register_stats("image_cache", cache.stats)
+    return cache
+
+image_cache = init_image_cache()
+
+def image_cache_key(asset_id, image_url):
+    # Une référence contient déjà l'empreinte du contenu ; une ancienne ligne base64 est hachée
+    digest = key_from_ref(image_url) if is_blob_ref(image_url) else hashlib.sha256(image_url.encode()).hexdigest()
+    return (asset_id, digest)
+
+def read_image(image_url):
+    # Référence vers le magasin d'images, ou ancienne ligne encore en base64
+    if is_blob_ref(image_url):
+        return blob_store.get(image_url)
+    return base64.b64decode(image_url)
+
+def load_image(asset_id, image_url):
+    return image_cache.get_or_load(image_cache_key(asset_id, image_url), lambda: read_image(image_url))
+
+def image_extension(image_url):
+    # Les anciennes lignes base64 étaient toujours ré-encodées en PNG
+    return image_url.rsplit(".", 1)[-1] if is_blob_ref(image_url) else "png"
+
+def image_mime(image_url):
+    return content_type_for(image_url) if is_blob_ref(image_url) else "image/png"
 
-def add_asset(title, author, author_id, description, category, asset_type, is_premium, price, image_base64, tags):
+# Index de Hamming des empreintes perceptuelles (quasi-doublons, images similaires),
+# chargé au premier besoin : une session qui ne s'en sert pas n'en paie pas le coût
+SIMILAR_LIMIT = 4
+
+@st.cache_resource(show_spinner="Chargement de l'index des images...")
+def init_similarity_index():
+    index = HashIndex()
+    if repo:
+        for row in repo.iter_assets('id,phash,dhash,ahash'):
+            index.add_row(row)
+    return index
+
+def similarity_index():
+    # None si l'index ne peut pas être chargé (base indisponible) : retenté au prochain appel
+    try:
+        return init_similarity_index()
+    except Exception:
+        logger.exception("Index des images similaires indisponible")
+        return None
+
+def similar_assets(asset_id):
+    # None si la base ne répond pas
+    index = similarity_index()
+    if index is None:
+        return None
+    ids = index.similar(asset_id, limit=SIMILAR_LIMIT)
+    if not ids:
+        return []
+    try:
+        rows = {row['id']: row for row in repo.get_assets(ids, 'id,title,thumb_url,image_url')}
+    except Exception:
+        logger.exception("Images similaires illisibles : %s", ids)
+        return None
+    return [rows[i] for i in ids if i in rows]
+
+def toggle_similar(asset_id):
+    st.session_state.similar_open ^= {asset_id}
+
+def add_asset(title, author, author_id, description, category, asset_type, is_premium, price, images, tags):
     try:
         data = {
             'title': title,
@@ -188,330 +358,799 @@ def add_asset(title, author, author_id, description, category, asset_type, is_pr
             'asset_type': asset_type,
             'is_premium': is_premium,
             'price': float(price),
-            'image_url': image_base64,  # En production, utilisez Supabase Storage
-            'tags': tags
+            'tags': tags,
+            **images
         }
-        supabase.table('assets').insert(data).execute()
-        return True
+        asset = repo.insert_asset(data)
     except Exception as e:
         st.error(f"Erreur ajout asset: {e}")
         return False
+    invalidate_new_asset(asset)
+    # Index non chargé : il lira l'asset dans la base à son chargement
+    index = similarity_index()
+    if index:
+        index.add_row(asset)
+    return True
 
-def get_all_assets(search="", category="Tous", asset_type="Tous", premium_only=False):
-    if not supabase:
-        return []
+# Import en masse : dérivés calculés hors du thread de script, dans des processus
+# (spawn : pas de fork d'un serveur multi-thread)
+IMAGE_WORKERS = min(4, os.cpu_count() or 1)
+
+@st.cache_resource
+def init_image_pool():
+    return ProcessPoolExecutor(max_workers=IMAGE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+def insert_asset_batch(rows):
+    inserted = repo.insert_assets(rows)
+    index = similarity_index()
+    for asset in inserted:
+        invalidate_new_asset(asset)
+        if index:
+            index.add_row(asset)
+    return inserted
+
+def bulk_import(uploads, metadata_file, defaults, progress, reject_duplicates=True):
+    # Les fichiers envoyés (UploadedFile) sont passés tels quels : lus seulement au traitement
+    index = similarity_index() if reject_duplicates else None
+    if reject_duplicates and index is None:
+        raise ValueError("Détection des quasi-doublons indisponible pour le moment : réessayez, "
+                         "ou cochez « Importer aussi les quasi-doublons ».")
+    images, errors = collect_images((f.name, f) for f in uploads)
+    metadata = read_metadata(metadata_file.getvalue()) if metadata_file else {}
+    inserted, import_errors = import_images(
+        images, metadata, defaults, CATEGORIES[1:], TYPES[1:], blob_store, insert_asset_batch,
+        init_image_pool(), max_in_flight=2 * IMAGE_WORKERS, progress=progress,
+        duplicate_of=index.find_duplicate if index else None,
+    )
+    return inserted, errors + import_errors
+
+# Colonnes nécessaires à une carte de la grille (jamais la description ni les autres dérivés)
+ASSET_CARD_COLUMNS = 'id,title,author,tags,category,asset_type,is_premium,price,views,downloads,thumb_url,image_url,upload_date,popularity_score,trending_score'
+PAGE_SIZE = 24
+
+# Modes de tri -> colonne pré-calculée (triggers de migrations/007), toujours départagée par id
+SORT_COLUMNS = {
+    "Plus récent": 'upload_date',
+    "Plus populaire": 'popularity_score',
+    "Plus téléchargé": 'downloads',
+    "Tendance": 'trending_score',
+}
+
+# Cache de résultats partagé : clé = filtres normalisés + tri + curseur
+QUERY_CACHE_SIZE = 512
+QUERY_CACHE_TTL = 60
+
+@st.cache_resource
+def init_query_cache():
+    cache = QueryCache(max_entries=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL)
+    metrics.register_stats("query_cache", cache.stats)
+    return cache
+
+query_cache = init_query_cache()
+
+# Dernière réponse valide de chaque liste et des statistiques : pendant une panne
+# (disjoncteur ouvert, erreurs après reprises), elle est servie marquée comme ancienne
+# au lieu de relancer des requêtes ou d'afficher un catalogue vide.
+LAST_GOOD_SIZE = 512
+
+@st.cache_resource
+def init_last_good():
+    cache = LastGoodCache(max_entries=LAST_GOOD_SIZE)
+    metrics.register_stats("last_good", cache.stats)
+    return cache
+
+last_good = init_last_good()
+
+def read_or_stale(key, compute, label):
+    # (valeur, âge) : âge None pour une réponse fraîche, en secondes pour une réponse
+    # ancienne servie pendant une panne ; (None, None) si aucune n'est connue
     try:
-        query = supabase.table('assets').select('*')
-        
-        # Filtres
-        if category != "Tous":
-            query = query.eq('category', category)
-        
-        if asset_type != "Tous":
-            query = query.eq('asset_type', asset_type)
-        
-        if premium_only:
-            query = query.eq('is_premium', True)
-        
-        # Recherche textuelle - CORRECTION ICI
-        if search:
-            # Utiliser ilike pour chaque champ séparément
-            query = query.or_(f'title.ilike.%{search}%,author.ilike.%{search}%,tags.ilike.%{search}%')
-        
-        # Trier par date
-        query = query.order('upload_date', desc=True)
-        
-        result = query.execute()
-        st.sidebar.info(f"📊 {len(result.data)} assets trouvés")
-        return result.data
-    except Exception as e:
-        st.sidebar.error(f"Erreur get_all_assets: {str(e)[:200]}")
-        # Essayer une requête simple sans filtres
+        value = compute()
+    except BackendUnavailable as e:
+        logger.warning("Lecture non envoyée (%s) : %s", e, label)
+    except Exception:
+        logger.exception("Échec de la lecture : %s", label)
+    else:
+        last_good.put(key, value)
+        return value, None
+    return read_stale(key)
+
+def read_stale(key):
+    # (dernière valeur valide, âge), ou (None, None) si aucune n'est connue
+    stale = last_good.get(key)
+    return (None, None) if stale is MISS else stale
+
+# Les lectures indépendantes d'un rerun (stats, page, total, likes) partent en parallèle
+# sur un pool borné ; chacune a son délai et une valeur de repli, si bien qu'une lecture
+# lente ou en échec ne bloque pas le reste de la page.
+FETCH_WORKERS = 8
+FETCH_TIMEOUT = 5.0
+
+@st.cache_resource
+def init_fetch_pool():
+    return ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="fetch")
+
+fetch_pool = init_fetch_pool()
+
+def submit(fn, *args):
+    # Le contexte de la session (st.cache_data) et la trace en cours suivent la lecture
+    ctx = get_script_run_ctx()
+    task = metrics.propagate(fn)
+    def run():
+        thread = threading.current_thread()
+        add_script_run_ctx(thread, ctx)
         try:
-            simple_query = supabase.table('assets').select('*').limit(100).execute()
-            st.sidebar.warning(f"⚠️ Requête simplifiée: {len(simple_query.data)} assets")
-            return simple_query.data
-        except Exception as e2:
-            st.sidebar.error(f"Erreur simple query: {str(e2)[:200]}")
-            return []
+            return task(*args)
+        finally:
+            add_script_run_ctx(thread, None)
+    return fetch_pool.submit(run)
 
-def download_asset(user_id, asset_id):
+def await_result(future, default, label, timeout=FETCH_TIMEOUT, fallback=None):
+    # fallback() : valeur de repli (dernière réponse valide) quand la lecture échoue ou tarde
     try:
-        # Enregistrer le téléchargement
-        supabase.table('downloads').insert({
-            'user_id': user_id,
-            'asset_id': asset_id
-        }).execute()
-        
-        # Le trigger SQL incrémente automatiquement le compteur
-        return True
-    except Exception as e:
-        st.error(f"Erreur téléchargement: {e}")
+        return future.result(timeout=timeout)
+    except FetchTimeout:
+        logger.warning("Lecture abandonnée après %.1f s : %s", timeout, label)
+    except Exception:
+        logger.exception("Échec de la lecture : %s", label)
+    return fallback() if fallback else default
+
+def normalize_filters(search="", category="Tous", asset_type="Tous", premium_only=False):
+    return (" ".join(tokenize(search)), category, asset_type, bool(premium_only))
+
+def filters_match_asset(filters, asset):
+    search, category, asset_type, premium_only = filters
+    return (category in ("Tous", asset['category'])
+            and asset_type in ("Tous", asset['asset_type'])
+            and (asset['is_premium'] or not premium_only)
+            and matches_query(asset, search))
+
+def fetch_assets_page(search, category, asset_type, premium_only, sort_by, cursor, limit):
+    # Sans recherche, curseur sur (colonne de tri, id) ; avec recherche, les résultats
+    # sont classés par pertinence et le curseur est un décalage.
+    if search:
+        offset = cursor or 0
+        rows = repo.search_assets(search, category, asset_type, premium_only,
+                                  offset=offset, limit=limit + 1, columns=ASSET_CARD_COLUMNS)
+        if len(rows) > limit:
+            return rows[:limit], offset + limit
+        return rows, None
+    
+    # Une ligne de plus pour savoir s'il reste une page
+    column = SORT_COLUMNS[sort_by]
+    rows = repo.list_assets(category, asset_type, premium_only, sort_column=column,
+                            cursor=cursor, limit=limit + 1, columns=ASSET_CARD_COLUMNS)
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, (rows[-1][column], rows[-1]['id'])
+    return rows, None
+
+def list_assets(search="", category="Tous", asset_type="Tous", premium_only=False, sort_by="Plus récent", cursor=None, limit=PAGE_SIZE):
+    # Renvoie (lignes, curseur suivant ou None, âge si la page est ancienne), ou None si
+    # la base ne répond pas et qu'aucune page n'est connue : jamais une liste vide à tort
+    if not repo:
+        return [], None, None
+    filters = normalize_filters(search, category, asset_type, premium_only)
+    key = list_key(filters, sort_by, cursor, limit)
+    return page_result(*read_or_stale(key, lambda: query_cache.get_or_compute(
+        key,
+        lambda: fetch_assets_page(*filters, sort_by, cursor, limit),
+        tags=lambda page: [('asset', row['id']) for row in page[0]]
+    ), "liste d'assets"))
+
+def list_key(filters, sort_by, cursor, limit):
+    # Une recherche est toujours classée par pertinence
+    return ('list', filters, "Pertinence" if filters[0] else sort_by, cursor, limit)
+
+def page_result(page, age):
+    if page is None:
+        return None
+    rows, next_cursor = page
+    # Pas de page suivante sous une page ancienne : son curseur ne correspond plus à rien
+    return rows, None if age is not None else next_cursor, age
+
+def stale_first_page(search="", category="Tous", asset_type="Tous", premium_only=False, sort_by="Plus récent"):
+    # Repli de list_assets quand sa lecture tarde : dernière première page valide, ou None
+    filters = normalize_filters(search, category, asset_type, premium_only)
+    return page_result(*read_stale(list_key(filters, sort_by, None, PAGE_SIZE)))
+
+def fetch_assets_count(search, category, asset_type, premium_only):
+    if search:
+        return repo.count_search_assets(search, category, asset_type, premium_only)
+    return repo.count_assets(category, asset_type, premium_only)
+
+def count_assets(search="", category="Tous", asset_type="Tous", premium_only=False):
+    # None : total inconnu, affiché "—"
+    if not repo:
+        return 0
+    filters = normalize_filters(search, category, asset_type, premium_only)
+    key = ('count', filters)
+    count, _ = read_or_stale(key, lambda: query_cache.get_or_compute(key, lambda: fetch_assets_count(*filters)),
+                             "total d'assets")
+    return count
+
+def stale_count(search="", category="Tous", asset_type="Tous", premium_only=False):
+    return read_stale(('count', normalize_filters(search, category, asset_type, premium_only)))[0]
+
+# Tris dont l'ordre change après chaque type d'événement
+EVENT_SORTS = {
+    'download': {"Plus téléchargé", "Plus populaire", "Tendance"},
+    'like': {"Plus populaire", "Tendance"},
+}
+
+def invalidate_new_asset(asset):
+    # Toutes les pages et tous les totaux dont les filtres incluent le nouvel asset
+    query_cache.invalidate_where(lambda key: filters_match_asset(key[1], asset))
+
+# Colonnes nécessaires à filters_match_asset
+ASSET_FILTER_COLUMNS = 'id,title,author,tags,category,asset_type,is_premium'
+
+def invalidate_asset_event(asset, event):
+    # Toutes les listes triées par un score que l'événement modifie et dont les filtres
+    # incluent l'asset : qu'il y figure déjà ou non, il peut y entrer ou y changer de rang
+    sorts = EVENT_SORTS[event]
+    query_cache.invalidate_where(
+        lambda key: key[0] == 'list' and key[2] in sorts and filters_match_asset(key[1], asset))
+    if event == 'download':
+        # Le compteur affiché sur la carte change aussi
+        query_cache.invalidate_tags({('asset', asset['id'])})
+
+def flush_views(views):
+    repo.increment_views(views)
+
+def flush_downloads(downloads):
+    repo.record_downloads(downloads)
+    # Lot écrit : une erreur ici ne doit pas le faire réécrire par l'agrégateur
+    asset_ids = list({asset_id for _, asset_id in downloads})
+    try:
+        assets = repo.get_assets(asset_ids, ASSET_FILTER_COLUMNS)
+    except Exception:
+        logger.exception("Assets téléchargés illisibles : invalidation de toutes les listes concernées")
+        sorts = EVENT_SORTS['download']
+        query_cache.invalidate_where(lambda key: key[0] == 'list' and key[2] in sorts)
+        query_cache.invalidate_tags({('asset', asset_id) for asset_id in asset_ids})
+        return
+    for asset in assets:
+        invalidate_asset_event(asset, 'download')
+
+@st.cache_resource
+def init_event_aggregator():
+    if not repo:
+        return None
+    return EventAggregator(flush_views, flush_downloads)
+
+def download_asset(user_id, asset_id):
+    # Mis en tampon : écrit par lot depuis le thread de l'agrégateur
+    if not event_aggregator or user_id is None:
+        st.error("Erreur téléchargement: base indisponible")
         return False
+    event_aggregator.record_download(user_id, asset_id)
+    return True
 
 def increment_views(asset_id):
-    try:
-        # Récupérer les vues actuelles
-        result = supabase.table('assets').select('views').eq('id', asset_id).execute()
-        current_views = result.data[0]['views'] if result.data else 0
-        
-        # Incrémenter
-        supabase.table('assets').update({'views': current_views + 1}).eq('id', asset_id).execute()
-    except Exception as e:
-        pass
+    if event_aggregator:
+        event_aggregator.record_view(asset_id)
+
+event_aggregator = init_event_aggregator()
+
+STATS_KEYS = ('total_assets', 'free_assets', 'total_downloads', 'active_users')
+# Les compteurs sont tenus à jour par des triggers (migrations/004) ; une valeur
+# vieille de quelques secondes suffit pour le bandeau de statistiques.
+STATS_TTL = 30
+
+@st.cache_data(ttl=STATS_TTL, show_spinner=False)
+def fetch_counters():
+    # Partagé par toutes les sessions du processus ; les exceptions ne sont pas mises en cache
+    return repo.get_counters(STATS_KEYS)
+
+def read_counters():
+    return read_or_stale(('stats',), fetch_counters, "statistiques")
 
 def get_stats():
-    if not supabase:
-        return {'total_assets': 0, 'free_assets': 0, 'total_downloads': 0, 'active_users': 0}
-    try:
-        # Total assets
-        total = supabase.table('assets').select('id', count='exact').execute()
-        total_assets = total.count if total.count else 0
-        
-        # Assets gratuits
-        free = supabase.table('assets').select('id', count='exact').eq('is_premium', False).execute()
-        free_assets = free.count if free.count else 0
-        
-        # Total téléchargements
-        downloads = supabase.table('downloads').select('id', count='exact').execute()
-        total_downloads = downloads.count if downloads.count else 0
-        
-        # Utilisateurs actifs
-        users = supabase.table('users').select('id', count='exact').execute()
-        active_users = users.count if users.count else 0
-        
-        st.sidebar.success(f"📊 Stats OK: {total_assets} assets")
-        
-        return {
-            'total_assets': total_assets,
-            'free_assets': free_assets,
-            'total_downloads': total_downloads,
-            'active_users': active_users
-        }
-    except Exception as e:
-        st.sidebar.error(f"Erreur stats: {str(e)[:100]}")
-        return {'total_assets': 0, 'free_assets': 0, 'total_downloads': 0, 'active_users': 0}
+    # (statistiques, âge si elles sont anciennes) ; None : valeur indisponible, affichée "—"
+    stats = dict.fromkeys(STATS_KEYS)
+    if not repo:
+        return stats, None
+    # Lecture lancée en début de rerun complet, ou maintenant si le fragment se relance seul
+    future = st.session_state.pop('stats_prefetch', None) or submit(read_counters)
+    counters, age = await_result(future, (None, None), "statistiques", fallback=lambda: read_stale(('stats',)))
+    stats.update(counters or {})
+    return stats, age
+
+def format_count(value):
+    return "—" if value is None else f"{value:,}"
+
+def format_age(seconds):
+    if seconds < 90:
+        return f"{seconds:.0f} s"
+    if seconds < 90 * 60:
+        return f"{seconds / 60:.0f} min"
+    return f"{seconds / 3600:.0f} h"
 
-def like_asset(user_id, asset_id):
+def like_asset(user_id, asset, liked):
+    # Un seul appel : `liked` est l'état voulu, connu côté session
+    if user_id is None:
+        st.error("Erreur like: compte indisponible")
+        return False
     try:
-        # Vérifier si déjà liké
-        existing = supabase.table('likes').select('id').eq('user_id', user_id).eq('asset_id', asset_id).execute()
-        
-        if existing.data:
-            # Retirer le like
-            supabase.table('likes').delete().eq('user_id', user_id).eq('asset_id', asset_id).execute()
-            return False
-        else:
-            # Ajouter le like
-            supabase.table('likes').insert({'user_id': user_id, 'asset_id': asset_id}).execute()
-            return True
+        repo.set_like(user_id, asset['id'], liked)
+        invalidate_asset_event(asset, 'like')
+        return True
     except Exception as e:
         st.error(f"Erreur like: {e}")
         return False
 
-def is_liked(user_id, asset_id):
+def get_liked_ids(user_id, asset_ids):
+    # Une seule requête `in` pour toutes les cartes affichées
+    if not repo or not asset_ids:
+        return set()
+    # Une erreur remonte : await_result la journalise et sync_liked_ids retentera ces ids
+    return repo.liked_ids(user_id, asset_ids)
+
+def sync_liked_ids(asset_ids):
+    # Ne demande au serveur que les assets dont l'état n'est pas encore connu dans la session
+    unknown = [asset_id for asset_id in asset_ids if asset_id not in st.session_state.like_checked_ids]
+    if unknown and st.session_state.user_id is None:
+        # Sans compte, aucun like possible : rien à demander au serveur
+        st.session_state.like_checked_ids |= set(unknown)
+    elif unknown:
+        liked = await_result(submit(get_liked_ids, st.session_state.user_id, unknown), None, "likes")
+        if liked is not None:
+            st.session_state.liked_ids |= liked
+            st.session_state.like_checked_ids |= set(unknown)
+
+def toggle_like(asset):
+    # Mise à jour optimiste, annulée si l'écriture échoue
+    asset_id = asset['id']
+    liked = asset_id not in st.session_state.liked_ids
+    if liked:
+        st.session_state.liked_ids.add(asset_id)
+    else:
+        st.session_state.liked_ids.discard(asset_id)
+    if not like_asset(current_user_id(), asset, liked):
+        st.session_state.liked_ids ^= {asset_id}
+
+# Analytique des administrateurs : cumul persistant mis à jour par lots (analytics.py),
+# au plus une fois par minute pour tout le processus ; le tableau de bord ne lit que le cumul.
+ANALYTICS_REFRESH_INTERVAL = 60
+ANALYTICS_PERIODS = {"7 jours": 7, "30 jours": 30, "90 jours": 90, "1 an": 365}
+
+@st.cache_resource
+def init_analytics():
+    if not repo:
+        return None
+    refresher = RollupRefresher(repo, min_interval=ANALYTICS_REFRESH_INTERVAL)
+    metrics.register_stats("analytics", lambda: dict(refresher.processed))
+    return refresher
+
+@st.cache_data(ttl=ANALYTICS_REFRESH_INTERVAL, show_spinner=False)
+def analytics_summary(since, watermarks):
+    # `watermarks` fait partie de la clé : le résumé est recalculé dès que le cumul avance
+    return summarize(repo.iter_rollup(since))
+
+def load_analytics(days, force=False):
+    # (résumé, vrai si tous les événements sont agrégés) ; None si la base ne répond pas
     try:
-        result = supabase.table('likes').select('id').eq('user_id', user_id).eq('asset_id', asset_id).execute()
-        return len(result.data) > 0
-    except:
-        return False
+        analytics.refresh(force)
+        watermarks = tuple(sorted(repo.get_watermarks().items()))
+        return analytics_summary(since_day(days), watermarks), analytics.caught_up
+    except Exception:
+        logger.exception("Échec du chargement de l'analytique")
+        return None
 
-# Initialiser user_id
-if 'user_id' not in st.session_state:
-    st.session_state.user_id = get_user_id(st.session_state.username)
+analytics = init_analytics()
 
-# ==================== INTERFACE ====================
+def current_filters():
+    return (
+        st.session_state.search_query,
+        st.session_state.selected_category,
+        st.session_state.selected_type,
+        st.session_state.show_premium_only,
+        st.session_state.sort_by,
+    )
 
-# Header
-col1, col2, col3 = st.columns([2, 4, 2])
-
-with col1:
-    st.markdown("### 🎨 **PixelMarket**")
-
-with col2:
-    search_input = st.text_input("🔍 Rechercher des photos, vecteurs, icônes...", 
-                                  value=st.session_state.search_query,
-                                  key="search_main",
-                                  label_visibility="collapsed")
-    if search_input != st.session_state.search_query:
-        st.session_state.search_query = search_input
-        st.rerun()
-
-with col3:
-    col_btn1, col_btn2, col_btn3 = st.columns(3)
-    with col_btn1:
-        if st.button("🌓"):
-            st.session_state.dark_mode = not st.session_state.dark_mode
-            st.rerun()
-    with col_btn2:
-        if st.button("👤 Admin" if not st.session_state.is_admin else "👤 User"):
-            st.session_state.is_admin = not st.session_state.is_admin
-            st.rerun()
-    with col_btn3:
-        if st.button("⭐ Premium"):
-            st.info("Passez à Premium pour télécharger sans limites !")
-
-# Hero Section
-if not st.session_state.search_query and st.session_state.selected_category == "Tous":
-    st.markdown("""
-    <div class="hero-section">
-        <div class="hero-title">Millions de ressources graphiques gratuites</div>
-        <div class="hero-subtitle">Photos, Vecteurs, Icônes, PSD - Tout ce dont vous avez besoin pour vos projets créatifs</div>
-    </div>
-    """, unsafe_allow_html=True)
+def fetch_first_page(filters):
+    # Première page et total en parallèle : (future de (lignes, curseur), future du total)
+    return submit(list_assets, *filters), submit(count_assets, *filters[:4])
 
-st.markdown("---")
+def reset_listing():
+    st.session_state.listing_key = None
+
+def load_more_assets():
+    page = list_assets(*st.session_state.listing_key, cursor=st.session_state.listing_cursor)
+    if page is None:
+        st.warning("⏳ Le catalogue ne répond pas pour le moment, réessayez dans un instant.")
+        return
+    rows, cursor, _ = page
+    st.session_state.listing_rows = st.session_state.listing_rows + rows
+    st.session_state.listing_cursor = cursor
 
-# Filtres
-filter_cols = st.columns([2, 2, 2, 2, 2])
+# ==================== INTERFACE ====================
+# La page est découpée en fragments qui se ré-exécutent seuls : le bandeau de
+# statistiques, le catalogue (recherche, filtres, grille) et les boutons de chaque
+# carte. Seuls le mode sombre, le mode admin et la publication relancent toute la page.
 
 CATEGORIES = ["Tous", "Nature", "Business", "Technologie", "Art", "Nourriture", "Voyage", "Mode", "Sport", "Architecture"]
 TYPES = ["Tous", "Photo", "Vecteur", "Icône", "Illustration", "PSD"]
 
-with filter_cols[0]:
-    selected_cat = st.selectbox("📁 Catégorie", CATEGORIES, index=CATEGORIES.index(st.session_state.selected_category))
-    if selected_cat != st.session_state.selected_category:
-        st.session_state.selected_category = selected_cat
-        st.rerun()
-
-with filter_cols[1]:
-    selected_type = st.selectbox("🎨 Type", TYPES, index=TYPES.index(st.session_state.selected_type))
-    if selected_type != st.session_state.selected_type:
-        st.session_state.selected_type = selected_type
-        st.rerun()
-
-with filter_cols[2]:
-    premium_filter = st.checkbox("⭐ Premium uniquement", value=st.session_state.show_premium_only)
-    if premium_filter != st.session_state.show_premium_only:
-        st.session_state.show_premium_only = premium_filter
-        st.rerun()
-
-with filter_cols[3]:
-    sort_by = st.selectbox("🔽 Trier par", ["Plus récent", "Plus populaire", "Plus téléchargé"])
-
-with filter_cols[4]:
-    if st.button("🔄 Réinitialiser"):
-        st.session_state.search_query = ""
-        st.session_state.selected_category = "Tous"
-        st.session_state.selected_type = "Tous"
-        st.session_state.show_premium_only = False
-        st.rerun()
+def reset_filters():
+    st.session_state.search_query = ""
+    st.session_state.selected_category = "Tous"
+    st.session_state.selected_type = "Tous"
+    st.session_state.show_premium_only = False
+    st.session_state.sort_by = "Plus récent"
+    reset_listing()
+
+@st.fragment(run_every=STATS_TTL)
+def render_stats():
+    with phase("stats"):
+        stats, age = get_stats()
+        stat_cols = st.columns(4)
+        stat_cols[0].metric("📊 Ressources", format_count(stats['total_assets']))
+        stat_cols[1].metric("🆓 Gratuit", format_count(stats['free_assets']))
+        stat_cols[2].metric("📥 Téléchargements", format_count(stats['total_downloads']))
+        stat_cols[3].metric("👥 Utilisateurs", format_count(stats['active_users']))
+        if age is not None:
+            st.caption(f"⚠️ Base momentanément indisponible : statistiques d'il y a {format_age(age)}")
+
+@st.fragment
+def render_card_actions(asset):
+    # Un clic sur like ou download ne redessine que ces boutons
+    with phase("card_actions"):
+        btn_col1, btn_col2 = st.columns(2)
+    
+        with btn_col1:
+            liked = asset['id'] in st.session_state.liked_ids
+            st.button("❤️" if liked else "🤍", key=f"like_{asset['id']}",
+                      on_click=toggle_like, args=(asset,))
+    
+        with btn_col2:
+            if asset['is_premium']:
+                if st.button(f"💰 {asset['price']:.2f}€", key=f"buy_{asset['id']}"):
+                    st.info("Paiement bientôt disponible!")
+            else:
+                if st.button("⬇️ Download", key=f"dl_{asset['id']}"):
+                    if download_asset(current_user_id(), asset['id']):
+                        try:
+                            img_bytes = load_image(asset['id'], asset['image_url'])
+                            st.download_button(
+                                label="📥 Cliquez ici",
+                                data=img_bytes,
+                                file_name=f"{asset['title']}.{image_extension(asset['image_url'])}",
+                                mime=image_mime(asset['image_url']),
+                                key=f"actual_dl_{asset['id']}"
+                            )
+                            st.success("✅ Téléchargement!")
+                        except:
+                            st.error("Erreur téléchargement")
+        
+        # Bandeau "images similaires", ouvert à la demande (index des empreintes perceptuelles)
+        opened = asset['id'] in st.session_state.similar_open
+        st.button("🔎 Masquer les similaires" if opened else "🔎 Images similaires", key=f"sim_{asset['id']}",
+                  on_click=toggle_similar, args=(asset['id'],))
+        if opened:
+            similar = similar_assets(asset['id'])
+            if similar is None:
+                st.caption("Images similaires indisponibles")
+            elif similar:
+                st.image([load_image(row['id'], row['thumb_url'] or row['image_url']) for row in similar],
+                         caption=[row['title'] for row in similar], width=80)
+            else:
+                st.caption("Aucune image similaire")
+
+def render_card(asset):
+    with phase("card"):
+        st.markdown('<div class="photo-grid-item">', unsafe_allow_html=True)
+    
+        # Une vue par session et par asset
+        if asset['id'] not in st.session_state.viewed_ids:
+            st.session_state.viewed_ids.add(asset['id'])
+            increment_views(asset['id'])
+    
+        # Image : la grille n'affiche que la miniature
+        try:
+            img_data = load_image(asset['id'], asset.get('thumb_url') or asset['image_url'])
+            st.image(img_data, use_container_width=True)
+        except:
+            st.image("https://via.placeholder.com/400x300", use_container_width=True)
+    
+        # Info
+        st.markdown(f"**{asset['title']}**")
+        st.markdown(f"<small>Par {asset['author']}</small>", unsafe_allow_html=True)
+    
+        # Badges et stats
+        badge_col1, badge_col2 = st.columns(2)
+        with badge_col1:
+            if asset['is_premium']:
+                st.markdown('<span class="premium-badge">⭐ PREMIUM</span>', unsafe_allow_html=True)
+            else:
+                st.markdown('<span class="free-badge">🆓 GRATUIT</span>', unsafe_allow_html=True)
+    
+        with badge_col2:
+            st.markdown(f"<small>👁️ {asset.get('views', 0)} • ⬇️ {asset.get('downloads', 0)}</small>", unsafe_allow_html=True)
+    
+        # Boutons
+        render_card_actions(asset)
+    
+        st.markdown('</div>', unsafe_allow_html=True)
+        st.markdown("<br>", unsafe_allow_html=True)
+
+@st.fragment
+def render_catalogue():
+    # Les widgets sont liés directement au session_state : un changement de filtre
+    # ne relance que ce fragment, sans st.rerun() supplémentaire.
+    with phase("grid"):
+        st.text_input("🔍 Rechercher des photos, vecteurs, icônes...",
+                      key="search_query",
+                      label_visibility="collapsed")
+    
+        # Hero Section
+        if not st.session_state.search_query and st.session_state.selected_category == "Tous":
+            st.markdown("""
+            <div class="hero-section">
+                <div class="hero-title">Millions de ressources graphiques gratuites</div>
+                <div class="hero-subtitle">Photos, Vecteurs, Icônes, PSD - Tout ce dont vous avez besoin pour vos projets créatifs</div>
+            </div>
+            """, unsafe_allow_html=True)
+    
+        st.markdown("---")
+    
+        # Filtres
+        filter_cols = st.columns([2, 2, 2, 2, 2])
+    
+        with filter_cols[0]:
+            st.selectbox("📁 Catégorie", CATEGORIES, key="selected_category")
+    
+        with filter_cols[1]:
+            st.selectbox("🎨 Type", TYPES, key="selected_type")
+    
+        with filter_cols[2]:
+            st.checkbox("⭐ Premium uniquement", key="show_premium_only")
+    
+        with filter_cols[3]:
+            st.selectbox("🔽 Trier par", list(SORT_COLUMNS), key="sort_by")
+    
+        with filter_cols[4]:
+            st.button("🔄 Réinitialiser", on_click=reset_filters)
+    
+        st.markdown("---")
+    
+        # Grille de photos
+        # Seule la première page est chargée quand les filtres changent ; les suivantes via "Charger plus"
+        filters = current_filters()
+        total_future = None
+        if st.session_state.listing_key != filters:
+            prefetch = st.session_state.pop('listing_prefetch', None)
+            page_future, total_future = prefetch[1] if prefetch and prefetch[0] == filters else fetch_first_page(filters)
+            first_page = await_result(page_future, None, "liste d'assets",
+                                      fallback=lambda: stale_first_page(*filters))
+            if first_page is None:
+                # Rien n'est mémorisé : la page sera redemandée à la prochaine interaction
+                st.session_state.listing_key = None
+                st.session_state.listing_rows, st.session_state.listing_cursor = [], None
+                st.warning("⏳ Le catalogue ne répond pas pour le moment, réessayez dans un instant.")
+            else:
+                rows, cursor, age = first_page
+                # Une page ancienne est affichée mais pas mémorisée : redemandée à la prochaine interaction
+                st.session_state.listing_key = filters if age is None else None
+                st.session_state.listing_rows, st.session_state.listing_cursor = rows, cursor
+                if age is not None:
+                    st.warning(f"⚠️ Base momentanément indisponible : résultats d'il y a {format_age(age)}, "
+                               "qui ont pu changer depuis.")
+    
+        assets = st.session_state.listing_rows
+    
+        # Les likes sont lus pendant que le total est encore en cours
+        if assets:
+            sync_liked_ids([asset['id'] for asset in assets])
+        if total_future is not None:
+            st.session_state.listing_total = await_result(total_future, None, "total d'assets",
+                                                          fallback=lambda: stale_count(*filters[:4]))
+    
+        if assets:
+            st.markdown(f"### 🎨 {format_count(st.session_state.listing_total)} résultat(s)")
+            if tokenize(st.session_state.search_query):
+                st.caption("Résultats classés par pertinence")
+        
+            cols = st.columns(4)
+        
+            for idx, asset in enumerate(assets):
+                with cols[idx % 4]:
+                    render_card(asset)
+        
+            if st.session_state.listing_cursor:
+                st.button(f"⬇️ Charger plus ({len(assets)} / {format_count(st.session_state.listing_total)})",
+                          on_click=load_more_assets, use_container_width=True)
+        else:
+            st.info("🔍 Aucun résultat. Ajoutez des ressources en mode Admin!")
+
+# Lectures du rerun complet lancées avant tout rendu : le bandeau et la grille les
+# attendent chacun de leur côté (un fragment relancé seul lit directement).
+if repo:
+    st.session_state.stats_prefetch = submit(read_counters)
+    if st.session_state.listing_key != current_filters():
+        st.session_state.listing_prefetch = (current_filters(), fetch_first_page(current_filters()))
+
+# Header
+with phase("header"):
+    col1, col2 = st.columns([6, 2])
+
+    with col1:
+        st.markdown("### 🎨 **PixelMarket**")
+
+    with col2:
+        col_btn1, col_btn2, col_btn3 = st.columns(3)
+        with col_btn1:
+            if st.button("🌓"):
+                st.session_state.dark_mode = not st.session_state.dark_mode
+                st.rerun()
+        with col_btn2:
+            if st.button("👤 Admin" if not st.session_state.is_admin else "👤 User"):
+                st.session_state.is_admin = not st.session_state.is_admin
+                st.rerun()
+        with col_btn3:
+            if st.button("⭐ Premium"):
+                st.info("Passez à Premium pour télécharger sans limites !")
+
+# Statistiques : emplacement réservé ici, rempli après la grille pour qu'une lecture
+# lente des compteurs ne retarde pas le catalogue
+stats_slot = st.container()
 
 st.markdown("---")
 
 # Admin Upload
 if st.session_state.is_admin:
+    cache_stats = query_cache.stats()
+    st.sidebar.caption(
+        f"🗄️ Cache requêtes : {cache_stats['hits']} hits / {cache_stats['misses']} misses "
+        f"({cache_stats['hit_rate']:.0%}), {cache_stats['entries']} entrées"
+    )
+    image_stats = image_cache.stats()
+    st.sidebar.caption(
+        f"🖼️ Cache images : {image_stats['hit_rate']:.0%} de hits, {image_stats['entries']} images, "
+        f"{image_stats['resident_bytes'] / 1024 / 1024:.1f} / {image_stats['max_bytes'] / 1024 / 1024:.0f} Mo"
+    )
+
     with st.expander("➕ Ajouter une nouvelle ressource"):
         col1, col2 = st.columns(2)
-        
+    
         with col1:
             upload_file = st.file_uploader("📤 Télécharger", type=['jpg', 'jpeg', 'png'])
             title = st.text_input("📝 Titre*")
             author = st.text_input("👤 Auteur*")
             description = st.text_area("📄 Description")
-        
+    
         with col2:
             category = st.selectbox("📁 Catégorie*", CATEGORIES[1:])
             asset_type = st.selectbox("🎨 Type*", TYPES[1:])
             tags = st.text_input("🏷️ Tags (séparés par virgules)")
             is_premium = st.checkbox("⭐ Premium")
             price = st.number_input("💰 Prix (€)", min_value=0.0, value=0.0 if not is_premium else 10.0)
-        
+            allow_duplicate = st.checkbox("♻️ Publier même si l'image existe déjà")
+    
         if st.button("✅ Publier", type="primary"):
             if upload_file and title and author:
-                image = Image.open(upload_file)
-                buffered = BytesIO()
-                image.save(buffered, format="PNG")
-                img_base64 = base64.b64encode(buffered.getvalue()).decode()
+                images = None
+                try:
+                    derivatives = build_derivatives(upload_file.getvalue())
+                except Exception as e:
+                    st.error(f"Image illisible: {e}")
+                    derivatives = None
                 
-                if add_asset(title, author, st.session_state.user_id, description, category, asset_type, is_premium, price, img_base64, tags):
+                # Quasi-doublon (empreinte perceptuelle) : refusé sauf confirmation explicite
+                index = similarity_index() if derivatives and not allow_duplicate else None
+                duplicate = index and index.find_duplicate(derivatives['hashes'])
+                if derivatives and not allow_duplicate and index is None:
+                    st.warning("⚠️ Vérification des quasi-doublons indisponible pour le moment. "
+                               "Réessayez, ou cochez la case pour publier sans vérification.")
+                elif duplicate:
+                    try:
+                        existing = repo.get_assets([duplicate], 'id,title')
+                    except Exception:
+                        logger.exception("Titre du quasi-doublon illisible : %s", duplicate)
+                        existing = None
+                    label = f"« {existing[0]['title']} »" if existing else f"#{duplicate}"
+                    st.warning(f"⚠️ Cette image est quasi identique à {label}. Cochez la case pour la publier quand même.")
+                elif derivatives:
+                    try:
+                        images = store_image(derivatives)
+                    except Exception as e:
+                        st.error(f"Erreur stockage image: {e}")
+            
+                if images and add_asset(title, author, current_user_id(), description, category, asset_type, is_premium, price, images, tags):
                     st.success("✅ Ressource publiée!")
+                    reset_listing()
                     st.rerun()
             else:
                 st.error("⚠️ Remplissez tous les champs obligatoires")
+    
+    with st.expander("📦 Import en masse"):
+        st.caption("Plusieurs images ou des archives ZIP, avec un CSV facultatif "
+                   "(filename, title, author, category, type, tags, premium, price). "
+                   "Les valeurs ci-dessous complètent les colonnes absentes ou vides.")
+        bulk_files = st.file_uploader("📤 Images ou ZIP", type=['jpg', 'jpeg', 'png', 'zip'],
+                                      accept_multiple_files=True, key="bulk_files")
+        bulk_csv = st.file_uploader("🧾 Métadonnées (CSV)", type=['csv'], key="bulk_csv")
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            bulk_author = st.text_input("👤 Auteur par défaut", key="bulk_author")
+            bulk_category = st.selectbox("📁 Catégorie par défaut", CATEGORIES[1:], key="bulk_category")
+            bulk_type = st.selectbox("🎨 Type par défaut", TYPES[1:], key="bulk_type")
+        with col2:
+            bulk_tags = st.text_input("🏷️ Tags par défaut", key="bulk_tags")
+            bulk_premium = st.checkbox("⭐ Premium par défaut", key="bulk_premium")
+            bulk_price = st.number_input("💰 Prix par défaut (€)", min_value=0.0,
+                                         value=10.0 if bulk_premium else 0.0, key="bulk_price")
+        bulk_allow_duplicates = st.checkbox("♻️ Importer aussi les quasi-doublons", key="bulk_allow_duplicates")
+        
+        if st.button("🚀 Importer", type="primary", disabled=not bulk_files):
+            progress_bar = st.progress(0.0, text="Préparation...")
+            def show_progress(done, total, name):
+                progress_bar.progress(done / total, text=f"{done} / {total} — {name}")
+            defaults = {
+                'author': bulk_author, 'author_id': current_user_id(), 'category': bulk_category,
+                'asset_type': bulk_type, 'tags': bulk_tags, 'is_premium': bulk_premium, 'price': bulk_price,
+            }
+            try:
+                inserted, errors = bulk_import(bulk_files, bulk_csv, defaults, show_progress,
+                                               reject_duplicates=not bulk_allow_duplicates)
+            except ValueError as e:
+                st.error(f"⚠️ {e}")
+            else:
+                progress_bar.progress(1.0, text="Terminé")
+                st.success(f"✅ {len(inserted)} ressource(s) publiée(s)")
+                if errors:
+                    st.warning(f"⚠️ {len(errors)} fichier(s) en erreur")
+                    st.dataframe([{'fichier': name, 'erreur': error} for name, error in errors], hide_index=True)
+                    st.download_button("📄 Rapport d'erreurs (CSV)", error_report_csv(errors),
+                                       file_name="import-erreurs.csv", mime="text/csv")
+                reset_listing()
 
-# Statistiques
-stats = get_stats()
-stat_cols = st.columns(4)
-stat_cols[0].metric("📊 Ressources", f"{stats['total_assets']:,}")
-stat_cols[1].metric("🆓 Gratuit", f"{stats['free_assets']:,}")
-stat_cols[2].metric("📥 Téléchargements", f"{stats['total_downloads']:,}")
-stat_cols[3].metric("👥 Utilisateurs", f"{stats['active_users']:,}")
+@st.fragment
+def render_analytics():
+    # Changer de période ou actualiser ne relance que ce tableau de bord
+    with phase("analytics"):
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            period = st.selectbox("📅 Période", list(ANALYTICS_PERIODS), index=1, key="analytics_period")
+        with col2:
+            force = st.button("🔄 Actualiser", key="analytics_refresh")
+        loaded = load_analytics(ANALYTICS_PERIODS[period], force)
+        if loaded is None:
+            st.warning("⏳ Analytique indisponible pour le moment, réessayez dans un instant.")
+            return
+        summary, caught_up = loaded
+        if not caught_up:
+            st.caption("⏳ Rattrapage de l'historique en cours : les chiffres se complètent à chaque actualisation.")
+        if not summary['days']:
+            st.info("Aucun événement sur la période.")
+            return
+        st.caption("Par jour (UTC)")
+        st.line_chart(summary['days'], x='jour', y=['downloads', 'likes', 'views'])
+        st.caption("Gratuit / Premium")
+        st.dataframe(summary['conversion'], hide_index=True,
+                     column_config={'téléchargements / vue': st.column_config.NumberColumn(format="%.1f %%"),
+                                    'likes / vue': st.column_config.NumberColumn(format="%.1f %%")})
+        col1, col2 = st.columns(2)
+        with col1:
+            st.caption("Par catégorie")
+            st.dataframe(summary['categories'], hide_index=True)
+        with col2:
+            st.caption("Par type")
+            st.dataframe(summary['types'], hide_index=True)
+        st.caption("Auteurs les plus téléchargés")
+        st.dataframe(summary['authors'], hide_index=True)
 
-st.markdown("---")
+if st.session_state.is_admin and analytics:
+    with st.expander("📈 Analytique"):
+        render_analytics()
 
-# Grille de photos
-assets = get_all_assets(
-    search=st.session_state.search_query,
-    category=st.session_state.selected_category,
-    asset_type=st.session_state.selected_type,
-    premium_only=st.session_state.show_premium_only
-)
+# Catalogue
+render_catalogue()
 
-if assets:
-    st.markdown(f"### 🎨 {len(assets)} résultat(s)")
-    
-    cols = st.columns(4)
-    
-    for idx, asset in enumerate(assets):
-        with cols[idx % 4]:
-            st.markdown('<div class="photo-grid-item">', unsafe_allow_html=True)
-            
-            # Image
-            try:
-                img_data = base64.b64decode(asset['image_url'])
-                st.image(img_data, use_container_width=True)
-            except:
-                st.image("https://via.placeholder.com/400x300", use_container_width=True)
-            
-            # Info
-            st.markdown(f"**{asset['title']}**")
-            st.markdown(f"<small>Par {asset['author']}</small>", unsafe_allow_html=True)
-            
-            # Badges et stats
-            badge_col1, badge_col2 = st.columns(2)
-            with badge_col1:
-                if asset['is_premium']:
-                    st.markdown('<span class="premium-badge">⭐ PREMIUM</span>', unsafe_allow_html=True)
-                else:
-                    st.markdown('<span class="free-badge">🆓 GRATUIT</span>', unsafe_allow_html=True)
-            
-            with badge_col2:
-                st.markdown(f"<small>👁️ {asset.get('views', 0)} • ⬇️ {asset.get('downloads', 0)}</small>", unsafe_allow_html=True)
-            
-            # Boutons
-            btn_col1, btn_col2 = st.columns(2)
-            
-            with btn_col1:
-                liked = is_liked(st.session_state.user_id, asset['id'])
-                if st.button("❤️" if liked else "🤍", key=f"like_{asset['id']}"):
-                    like_asset(st.session_state.user_id, asset['id'])
-                    st.rerun()
-            
-            with btn_col2:
-                if asset['is_premium']:
-                    if st.button(f"💰 {asset['price']:.2f}€", key=f"buy_{asset['id']}"):
-                        st.info("Paiement bientôt disponible!")
-                else:
-                    if st.button("⬇️ Download", key=f"dl_{asset['id']}"):
-                        if download_asset(st.session_state.user_id, asset['id']):
-                            try:
-                                img_bytes = base64.b64decode(asset['image_url'])
-                                st.download_button(
-                                    label="📥 Cliquez ici",
-                                    data=img_bytes,
-                                    file_name=f"{asset['title']}.png",
-                                    mime="image/png",
-                                    key=f"actual_dl_{asset['id']}"
-                                )
-                                st.success("✅ Téléchargement!")
-                            except:
-                                st.error("Erreur téléchargement")
-            
-            st.markdown('</div>', unsafe_allow_html=True)
-            st.markdown("<br>", unsafe_allow_html=True)
-else:
-    st.info("🔍 Aucun résultat. Ajoutez des ressources en mode Admin!")
+with stats_slot:
+    render_stats()
 
 # Footer
 st.markdown("---")
@@ -522,3 +1161,38 @@ st.markdown("""
     <p style='margin-top: 20px; color: #9ca3af;'>© 2025 PixelMarket. Tous droits réservés.</p>
 </div>
 """, unsafe_allow_html=True)
+
+# Fin du rerun complet : la trace est close avant d'être affichée
+metrics.finish_trace()
+
+@st.fragment
+def render_debug_panel():
+    # Opt-in (secret DEBUG_PANEL) : traces de la session, coût cumulé des appels, export
+    with st.sidebar.expander("🛠️ Instrumentation", expanded=True):
+        st.button("🔄 Actualiser", key="debug_refresh")
+        traces = metrics.recent_traces(st.session_state.trace_session, limit=10)
+        if traces:
+            last = traces[-1]
+            st.caption(f"Dernier rerun ({last.kind}) : {last.duration * 1000:.0f} ms")
+            st.dataframe(last.spans, hide_index=True)
+            st.caption("Reruns récents de la session")
+            st.dataframe([{'rerun': t.kind, 'ms': round(t.duration * 1000, 1), 'spans': len(t.spans)}
+                          for t in reversed(traces)], hide_index=True)
+        st.caption("Appels au backend (processus), par temps cumulé")
+        st.dataframe(metrics.call_summary(), hide_index=True)
+        st.caption("Phases de rendu (processus)")
+        st.dataframe(metrics.phase_summary(), hide_index=True)
+        st.caption("Caches (processus)")
+        st.dataframe([{'cache': 'requêtes', **query_cache.stats()}, {'cache': 'images', **image_cache.stats()},
+                      {'cache': 'dernières réponses', **last_good.stats()}],
+                     hide_index=True)
+        if repo:
+            st.caption("Backend (disjoncteur, reprises, appels en vol)")
+            st.dataframe([repo.stats()], hide_index=True)
+        st.download_button("📈 Métriques Prometheus", metrics.prometheus_text(),
+                           file_name="pixelmarket.prom", mime="text/plain")
+        st.download_button("🧾 Traces JSON lines", metrics.json_lines(),
+                           file_name="pixelmarket-traces.jsonl", mime="application/x-ndjson")
+
+if DEBUG_PANEL:
+    render_debug_panel()
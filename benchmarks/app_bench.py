@@ -0,0 +1,276 @@
+"""Benchmark de bout en bout de app.py : latence des reruns sous sessions simulées.
+
+Usage :
+    python benchmarks/app_bench.py [--sizes 1000,10000,100000] [--sessions 4] [--processes 2]
+                                   [--rounds 3] [--baseline benchmarks/baseline.json]
+                                   [--save-baseline] [--tolerance 0.25]
+
+L'application tourne sans navigateur via streamlit.testing (AppTest) contre le
+backend SQLite, sur un catalogue généré de la taille demandée. Chaque processus
+fait tourner `--sessions` sessions entrelacées, qui partagent les caches comme
+sur un vrai serveur. Les `--processes` processus tournent en parallèle sur la
+même base. Chaque session enchaîne un parcours réaliste : navigation, « Charger
+plus », frappe d'une recherche, filtres, tri, like, téléchargement.
+
+Par scénario : latence p50/p95/p99 des reruns, appels au backend et octets
+renvoyés par rerun, mémoire résidente maximale. Les résultats sont comparés à
+la référence enregistrée ; le code de sortie vaut 1 en cas de régression.
+Les latences dépendent de la machine : régénérer la référence (--save-baseline)
+sur la machine qui exécute la comparaison.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+APP_PATH = os.path.join(ROOT, "app.py")
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "baseline.json")
+
+CATEGORIES = ["Nature", "Business", "Technologie", "Art", "Nourriture", "Voyage", "Mode", "Sport", "Architecture"]
+TYPES = ["Photo", "Vecteur", "Icône", "Illustration", "PSD"]
+WORDS = ["soleil", "plage", "montagne", "bureau", "équipe", "café", "forêt", "ville", "nuit", "été",
+         "hiver", "marché", "désert", "océan", "portrait", "cuisine", "voiture", "fleur", "pont", "musée"]
+AUTHORS = ["Amine", "Léa", "Karim", "Sofia", "Yacine", "Inès", "Nassim", "Chloé"]
+
+# (étape, action) ; chaque action provoque exactement un rerun
+FLOW = [
+    ("browse", lambda at: at.run()),
+    ("load_more", lambda at: _click(at, "Charger plus")),
+    ("search", lambda at: at.text_input[0].input("sol").run()),
+    ("search", lambda at: at.text_input[0].input("soleil plage").run()),
+    ("filter", lambda at: at.selectbox[0].select("Nature").run()),
+    ("filter", lambda at: at.selectbox[1].select("Photo").run()),
+    ("reset", lambda at: _click(at, "Réinitialiser")),
+    ("sort", lambda at: at.selectbox[2].select("Plus populaire").run()),
+    ("like", lambda at: _click_key(at, "like_")),
+    ("download", lambda at: _click_key(at, "dl_")),
+    ("reset", lambda at: _click(at, "Réinitialiser")),
+]
+
+
+def _click(at, label):
+    for button in at.button:
+        if label in button.label:
+            return button.click().run()
+    return at.run()
+
+
+def _click_key(at, prefix):
+    for button in at.button:
+        if button.key and button.key.startswith(prefix):
+            return button.click().run()
+    return at.run()
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    k = (len(values) - 1) * p / 100
+    low, high = int(k), min(int(k) + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (k - low)
+
+
+# ==================== CATALOGUE ====================
+
+def seed_catalogue(path, blob_dir, size, seed=42):
+    from PIL import Image
+    from blob_store import LocalBlobStore
+    from images import store_derivatives
+    from repository import SQLiteRepository
+
+    rng = random.Random(seed)
+    repo = SQLiteRepository(path)
+    buffered = io.BytesIO()
+    Image.new("RGB", (1600, 1200), (90, 140, 200)).save(buffered, format="JPEG")
+    images = store_derivatives(LocalBlobStore(blob_dir), buffered.getvalue())
+
+    batch = []
+    for i in range(size):
+        words = rng.sample(WORDS, 3)
+        batch.append({
+            'title': f"{words[0].capitalize()} {words[1]} #{i}",
+            'author': rng.choice(AUTHORS),
+            'category': rng.choice(CATEGORIES),
+            'asset_type': rng.choice(TYPES),
+            'is_premium': rng.random() < 0.3,
+            'price': 10.0,
+            'tags': ", ".join(rng.sample(WORDS, 3)),
+            **images,
+        })
+        if len(batch) == 5000:
+            repo.insert_assets(batch)
+            batch = []
+    if batch:
+        repo.insert_assets(batch)
+    repo.conn.close()
+
+
+# ==================== MESURE DU BACKEND ====================
+
+def backend_totals(registry):
+    # Appels et octets du backend de données, mesurés par le proxy de app.py (instrumentation)
+    summary = registry.call_summary(backend="repository")
+    return sum(row['calls'] for row in summary), sum(row['bytes'] for row in summary)
+
+
+def run_worker(args):
+    from instrumentation import REGISTRY
+    from streamlit.testing.v1 import AppTest
+
+    sessions = []
+    for _ in range(args.sessions):
+        at = AppTest.from_file(APP_PATH, default_timeout=120)
+        at.secrets["DATA_BACKEND"] = "sqlite"
+        at.secrets["SQLITE_PATH"] = args.db
+        at.secrets["BLOB_DIR"] = args.blob_dir
+        sessions.append(at)
+
+    latencies = []
+    calls = 0
+    transferred = 0
+    errors = 0
+    for _ in range(args.rounds):
+        for _, action in FLOW:
+            # Les sessions avancent à tour de rôle, comme des visiteurs simultanés
+            for at in sessions:
+                before_calls, before_bytes = backend_totals(REGISTRY)
+                start = time.perf_counter()
+                action(at)
+                latencies.append(time.perf_counter() - start)
+                after_calls, after_bytes = backend_totals(REGISTRY)
+                calls += after_calls - before_calls
+                transferred += after_bytes - before_bytes
+                errors += len(at.exception)
+
+    json.dump({
+        'latencies': latencies,
+        'calls': calls,
+        'bytes': transferred,
+        'errors': errors,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }, sys.stdout)
+
+
+# ==================== ORCHESTRATION ====================
+
+def run_scenario(size, args):
+    db = os.path.join(args.data_dir, f"catalogue_{size}.db")
+    blob_dir = os.path.join(args.data_dir, "blobs")
+    if not os.path.exists(db):
+        print(f"Génération du catalogue de {size} assets...", file=sys.stderr)
+        seed_catalogue(db + ".tmp", blob_dir, size)
+        os.replace(db + ".tmp", db)
+
+    # Copie de travail : chaque scénario part du même catalogue, sans les likes des runs précédents
+    work_db = os.path.join(args.data_dir, f"run_{size}_{os.getpid()}.db")
+    shutil.copyfile(db, work_db)
+    try:
+        return _run_workers(work_db, blob_dir, args)
+    finally:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(work_db + suffix):
+                os.remove(work_db + suffix)
+
+
+def _run_workers(db, blob_dir, args):
+    command = [sys.executable, os.path.abspath(__file__), "--worker", "--db", db, "--blob-dir", blob_dir,
+               "--sessions", str(args.sessions), "--rounds", str(args.rounds)]
+    workers = [subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, cwd=ROOT)
+               for _ in range(args.processes)]
+    results = []
+    for worker in workers:
+        out, _ = worker.communicate()
+        if worker.returncode != 0:
+            raise RuntimeError(f"Le processus de benchmark a échoué (code {worker.returncode})")
+        results.append(json.loads(out))
+
+    latencies = [l for r in results for l in r['latencies']]
+    reruns = len(latencies) or 1
+    return {
+        'reruns': len(latencies),
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'calls_per_rerun': sum(r['calls'] for r in results) / reruns,
+        'kb_per_rerun': sum(r['bytes'] for r in results) / reruns / 1024,
+        'peak_rss_mb': max(r['peak_rss_mb'] for r in results),
+        'errors': sum(r['errors'] for r in results),
+    }
+
+
+# Métriques comparées à la référence (plus petit = meilleur)
+COMPARED = ('p50_ms', 'p95_ms', 'p99_ms', 'calls_per_rerun', 'kb_per_rerun', 'peak_rss_mb')
+
+
+def compare(results, baseline, tolerance, metrics=COMPARED):
+    regressions = []
+    for scenario, values in results.items():
+        reference = baseline.get(scenario)
+        if not reference:
+            continue
+        for name in metrics:
+            if name in reference and values[name] > reference[name] * (1 + tolerance) + 1e-9:
+                regressions.append(f"{scenario} {name}: {values[name]:.2f} > {reference[name]:.2f} (+{tolerance:.0%})")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--sessions", type=int, default=4)
+    parser.add_argument("--processes", type=int, default=2)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "pixelmarket-bench"))
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--db", help=argparse.SUPPRESS)
+    parser.add_argument("--blob-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        run_worker(args)
+        return 0
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    results = {}
+    print(f"{'scénario':<28}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'appels':>8}{'Ko':>9}{'RSS Mo':>9}")
+    for size in [int(s) for s in args.sizes.split(",")]:
+        scenario = f"{size}-assets/{args.sessions}x{args.processes}"
+        metrics = run_scenario(size, args)
+        results[scenario] = metrics
+        print(f"{scenario:<28}{metrics['p50_ms']:>9.1f}{metrics['p95_ms']:>9.1f}{metrics['p99_ms']:>9.1f}"
+              f"{metrics['calls_per_rerun']:>8.2f}{metrics['kb_per_rerun']:>9.1f}{metrics['peak_rss_mb']:>9.0f}")
+        if metrics['errors']:
+            print(f"  ⚠️ {metrics['errors']} exception(s) dans l'application", file=sys.stderr)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Référence enregistrée dans {args.baseline}")
+        return 0
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"RÉGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
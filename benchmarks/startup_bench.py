@@ -0,0 +1,155 @@
+"""Benchmark de démarrage de app.py : coût d'un processus neuf et d'une nouvelle session.
+
+Usage :
+    python benchmarks/startup_bench.py [--size 1000] [--repeat 5] [--sessions 5]
+                                       [--baseline benchmarks/startup_baseline.json]
+                                       [--save-baseline] [--tolerance 0.25]
+
+Chaque répétition lance un interpréteur neuf, comme un worker qui démarre :
+  - import_ms       : imports de premier niveau de app.py (lus dans le fichier) ;
+  - first_run_ms    : premier rendu de la première session (initialisation des ressources) ;
+  - session_run_ms  : premier rendu d'une nouvelle session, ressources déjà chaudes ;
+  - session_calls   : appels au backend pendant ce premier rendu ;
+  - session_writes  : écritures en base par session anonyme (navigation sans like ni
+                      téléchargement), qui doivent rester à zéro.
+Les valeurs rapportées sont des médianes ; comparaison à la référence comme app_bench.py.
+"""
+import argparse
+import ast
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from app_bench import ROOT, APP_PATH, compare, seed_catalogue
+
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "startup_baseline.json")
+# Métriques comparées à la référence (plus petit = meilleur)
+COMPARED = ('import_ms', 'first_run_ms', 'session_run_ms', 'session_calls', 'session_writes')
+
+# Méthodes du Repository qui écrivent en base pour le compte d'une session. Les vues sont
+# agrégées pour tout le processus (events.py) et écrites par lots, hors de la session.
+WRITE_METHODS = {'get_or_create_user', 'insert_asset', 'insert_assets', 'set_like', 'record_downloads'}
+
+
+def app_imports():
+    # Modules importés au premier niveau de app.py, dans l'ordre du fichier
+    modules = []
+    for node in ast.parse(open(APP_PATH).read()).body:
+        if isinstance(node, ast.Import):
+            modules.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            modules.append(node.module)
+    return list(dict.fromkeys(modules))
+
+
+def run_worker(args):
+    start = time.perf_counter()
+    for module in app_imports():
+        try:
+            __import__(module)
+        except ImportError:
+            pass
+    import_ms = (time.perf_counter() - start) * 1000
+
+    from instrumentation import REGISTRY
+    from streamlit.testing.v1 import AppTest
+
+    def new_session():
+        at = AppTest.from_file(APP_PATH, default_timeout=120)
+        at.secrets["DATA_BACKEND"] = "sqlite"
+        at.secrets["SQLITE_PATH"] = args.db
+        at.secrets["BLOB_DIR"] = args.blob_dir
+        return at
+
+    def backend_calls(methods=None):
+        return sum(row['calls'] for row in REGISTRY.call_summary(backend="repository")
+                   if methods is None or row['method'] in methods)
+
+    start = time.perf_counter()
+    new_session().run()
+    first_run_ms = (time.perf_counter() - start) * 1000
+
+    session_ms, session_calls, session_writes = [], [], []
+    for _ in range(args.sessions):
+        at = new_session()
+        calls, writes = backend_calls(), backend_calls(WRITE_METHODS)
+        start = time.perf_counter()
+        at.run()
+        session_ms.append((time.perf_counter() - start) * 1000)
+        session_calls.append(backend_calls() - calls)
+        # Navigation anonyme : recherche et filtre, sans like ni téléchargement
+        at.text_input[0].input("soleil").run()
+        at.selectbox[0].select("Nature").run()
+        session_writes.append(backend_calls(WRITE_METHODS) - writes)
+
+    json.dump({
+        'import_ms': import_ms,
+        'first_run_ms': first_run_ms,
+        'session_run_ms': statistics.median(session_ms),
+        'session_calls': statistics.median(session_calls),
+        'session_writes': statistics.median(session_writes),
+    }, sys.stdout)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--sessions", type=int, default=5)
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "pixelmarket-bench"))
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--db", help=argparse.SUPPRESS)
+    parser.add_argument("--blob-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        run_worker(args)
+        return 0
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    db = os.path.join(args.data_dir, f"catalogue_{args.size}.db")
+    blob_dir = os.path.join(args.data_dir, "blobs")
+    if not os.path.exists(db):
+        print(f"Génération du catalogue de {args.size} assets...", file=sys.stderr)
+        seed_catalogue(db + ".tmp", blob_dir, args.size)
+        os.replace(db + ".tmp", db)
+
+    command = [sys.executable, os.path.abspath(__file__), "--worker", "--db", db, "--blob-dir", blob_dir,
+               "--sessions", str(args.sessions)]
+    runs = []
+    for _ in range(args.repeat):
+        # Un interpréteur neuf par répétition : imports et ressources à froid
+        out = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, cwd=ROOT, check=True).stdout
+        runs.append(json.loads(out))
+
+    scenario = f"startup/{args.size}-assets"
+    metrics = {name: statistics.median(run[name] for run in runs) for name in runs[0]}
+    print(f"{'scénario':<24}{'import ms':>11}{'1er rendu':>11}{'session ms':>12}{'appels':>8}{'écritures':>11}")
+    print(f"{scenario:<24}{metrics['import_ms']:>11.0f}{metrics['first_run_ms']:>11.0f}"
+          f"{metrics['session_run_ms']:>12.0f}{metrics['session_calls']:>8.0f}{metrics['session_writes']:>11.0f}")
+
+    results = {scenario: metrics}
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Référence enregistrée dans {args.baseline}")
+        return 0
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance, metrics=COMPARED)
+        for line in regressions:
+            print(f"RÉGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
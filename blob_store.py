@@ -0,0 +1,123 @@
+import hashlib
+import os
+import tempfile
+
+# ==================== STOCKAGE DES IMAGES ====================
+# Les octets des images ne vivent plus dans la table `assets` : chaque fichier
+# est rangé dans un magasin adressé par son contenu (sha256) et la ligne ne
+# garde qu'une référence de la forme "blob:<clé>".
+
+BLOB_PREFIX = "blob:"
+
+CONTENT_TYPES = {
+    "png": "image/png",
+    "jpg": "image/jpeg",
+    "jpeg": "image/jpeg",
+    "webp": "image/webp",
+    "gif": "image/gif",
+}
+
+
+def is_blob_ref(value):
+    return isinstance(value, str) and value.startswith(BLOB_PREFIX)
+
+
+def blob_key(data, ext):
+    digest = hashlib.sha256(data).hexdigest()
+    # Deux niveaux de répertoires pour ne pas avoir des milliers de fichiers au même endroit
+    return f"{digest[:2]}/{digest[2:4]}/{digest}.{ext.lower().lstrip('.')}"
+
+
+def key_from_ref(ref):
+    return ref[len(BLOB_PREFIX):] if is_blob_ref(ref) else ref
+
+
+def content_type_for(ref):
+    ext = key_from_ref(ref).rsplit(".", 1)[-1].lower()
+    return CONTENT_TYPES.get(ext, "application/octet-stream")
+
+
+class BlobStore:
+    """Interface commune : put() renvoie une référence, get() renvoie les octets."""
+
+    def put(self, data, ext="png"):
+        key = blob_key(data, ext)
+        if not self.exists(key):
+            self._write(key, data)
+        return BLOB_PREFIX + key
+
+    def get(self, ref):
+        return self._read(key_from_ref(ref))
+
+    def exists(self, key):
+        raise NotImplementedError
+
+    def _write(self, key, data):
+        raise NotImplementedError
+
+    def _read(self, key):
+        raise NotImplementedError
+
+
+class LocalBlobStore(BlobStore):
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.root, *key.split("/"))
+
+    def exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def _write(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Écriture atomique : un lecteur concurrent ne voit jamais un fichier à moitié écrit.
+        # Fichier temporaire unique par écriture : deux sessions (threads du même processus)
+        # peuvent ranger le même contenu en même temps.
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def _read(self, key):
+        with open(self._path(key), "rb") as f:
+            return f.read()
+
+
+class SupabaseBlobStore(BlobStore):
+    def __init__(self, client, bucket="assets"):
+        self.client = client
+        self.bucket = bucket
+
+    def _bucket(self):
+        return self.client.storage.from_(self.bucket)
+
+    def exists(self, key):
+        # Le contenu est adressé par son hash : on laisse l'upsert gérer les doublons
+        return False
+
+    def _write(self, key, data):
+        self._bucket().upload(key, data, {
+            "content-type": content_type_for(key),
+            "cache-control": "31536000",
+            "upsert": "true",
+        })
+
+    def _read(self, key):
+        return self._bucket().download(key)
+
+
+def make_blob_store(backend, client=None, bucket="assets", root=".blobs"):
+    if backend == "local":
+        return LocalBlobStore(root)
+    if backend == "supabase":
+        if client is None:
+            raise ValueError("Le stockage Supabase nécessite un client")
+        return SupabaseBlobStore(client, bucket)
+    raise ValueError(f"Backend de stockage inconnu: {backend}")
@@ -0,0 +1,250 @@
+import csv
+import io
+import logging
+import os
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from PIL import UnidentifiedImageError
+
+from images import build_derivatives, store_built_derivatives
+from perceptual import HashIndex
+from search import fold
+
+logger = logging.getLogger(__name__)
+
+# ==================== IMPORT EN MASSE ====================
+# Un portfolio complet (fichiers ou archives ZIP, CSV de métadonnées facultatif) :
+# décodage, validation et redimensionnement dans un pool de processus, rangement
+# dans le magasin d'images, puis insertion par lots. Un fichier en échec est
+# rapporté avec sa cause sans interrompre les autres. Les membres d'une archive ne
+# sont décompressés qu'au moment de partir vers le pool : seules les images en
+# cours de traitement sont en mémoire, en plus des fichiers envoyés.
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+MAX_FILES = 10000
+MAX_ARCHIVE_BYTES = 1024 ** 3  # taille décompressée cumulée des archives
+MAX_IMAGE_BYTES = 50 * 1024 ** 2  # taille décompressée d'une image d'archive
+INSERT_BATCH_SIZE = 200
+
+# En-têtes de CSV acceptés -> colonne de `assets`
+CSV_COLUMNS = {
+    "filename": "filename", "file": "filename", "fichier": "filename",
+    "title": "title", "titre": "title",
+    "author": "author", "auteur": "author",
+    "category": "category", "categorie": "category",
+    "type": "asset_type", "asset_type": "asset_type",
+    "tags": "tags",
+    "premium": "is_premium", "is_premium": "is_premium",
+    "price": "price", "prix": "price",
+}
+TRUE_VALUES = {"1", "true", "vrai", "oui", "yes", "x"}
+
+
+def _reader(archive, info):
+    return lambda: archive.read(info)
+
+
+def _loader(data):
+    # Octets déjà en mémoire, ou fichier envoyé (UploadedFile) lu au moment du traitement
+    return (lambda: data) if isinstance(data, bytes) else data.getvalue
+
+
+def collect_images(uploads):
+    """`uploads` : (nom, octets ou fichier) d'images ou d'archives ZIP. Renvoie (images, erreurs).
+
+    Chaque image est (nom, lecture) : `lecture()` renvoie ses octets, décompressés à la
+    demande pour un membre d'archive (l'archive reste ouverte sur le fichier envoyé).
+    """
+    images, errors = [], []
+    archive_bytes = 0
+    for name, data in uploads:
+        if name.lower().endswith(".zip"):
+            try:
+                archive = zipfile.ZipFile(io.BytesIO(data) if isinstance(data, bytes) else data)
+            except zipfile.BadZipFile:
+                errors.append((name, "archive ZIP illisible"))
+                continue
+            for info in archive.infolist():
+                member = info.filename
+                base = os.path.basename(member)
+                # Dossiers et fichiers système glissés par macOS ou Windows
+                if info.is_dir() or member.startswith("__MACOSX/") or base.startswith(".") or not base:
+                    continue
+                if not base.lower().endswith(IMAGE_EXTENSIONS):
+                    errors.append((f"{name}/{member}", "extension non supportée"))
+                    continue
+                if info.file_size > MAX_IMAGE_BYTES:
+                    errors.append((f"{name}/{member}", "image trop volumineuse une fois décompressée"))
+                    continue
+                archive_bytes += info.file_size
+                if archive_bytes > MAX_ARCHIVE_BYTES:
+                    errors.append((name, "archive trop volumineuse une fois décompressée"))
+                    break
+                images.append((member, _reader(archive, info)))
+        elif name.lower().endswith(IMAGE_EXTENSIONS):
+            images.append((name, _loader(data)))
+        else:
+            errors.append((name, "extension non supportée"))
+    if len(images) > MAX_FILES:
+        errors.extend((member, f"au-delà de {MAX_FILES} images par import") for member, _ in images[MAX_FILES:])
+        images = images[:MAX_FILES]
+    return images, errors
+
+
+def read_metadata(data):
+    """CSV (séparateur , ou ;) -> {nom de fichier en minuscules: {colonne: valeur}}."""
+    text = data.decode("utf-8-sig")
+    try:
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=",;")
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.DictReader(io.StringIO(text), dialect=dialect)
+    columns = {header: CSV_COLUMNS.get(fold(header).strip()) for header in reader.fieldnames or ()}
+    if "filename" not in columns.values():
+        raise ValueError("Le CSV doit contenir une colonne « filename »")
+    metadata = {}
+    for record in reader:
+        row = {columns[h]: (v or "").strip() for h, v in record.items() if columns.get(h)}
+        if row.get("filename"):
+            metadata[os.path.basename(row.pop("filename")).lower()] = row
+    return metadata
+
+
+def _choice(value, choices, error):
+    # "technologie" ou "icone" -> "Technologie", "Icône"
+    for choice in choices:
+        if fold(choice) == fold(value):
+            return choice
+    raise ValueError(f"{error} : {value}")
+
+
+def asset_row(name, meta, defaults, categories, types):
+    """Ligne `assets` (sans les images) d'après le CSV, complétée par les valeurs par défaut."""
+    values = {**defaults, **{k: v for k, v in meta.items() if v != ""}}
+    title = values.get("title") or os.path.splitext(os.path.basename(name))[0].replace("_", " ").replace("-", " ")
+    if not values.get("author"):
+        raise ValueError("auteur manquant")
+    is_premium = values.get("is_premium", False)
+    if isinstance(is_premium, str):
+        is_premium = fold(is_premium) in TRUE_VALUES
+    try:
+        price = float(str(values.get("price") or 0).replace(",", "."))
+    except ValueError:
+        raise ValueError(f"prix invalide : {values.get('price')}") from None
+    if price < 0:
+        raise ValueError(f"prix invalide : {price}")
+    return {
+        'title': title.strip(),
+        'author': values["author"],
+        'author_id': values.get("author_id"),
+        'description': values.get("description", ""),
+        'category': _choice(values.get("category", ""), categories, "catégorie inconnue"),
+        'asset_type': _choice(values.get("asset_type", ""), types, "type inconnu"),
+        'is_premium': bool(is_premium),
+        'price': price,
+        'tags': values.get("tags", ""),
+    }
+
+
+def import_images(images, metadata, defaults, categories, types, store, insert_rows, pool,
+                  max_in_flight=8, batch_size=INSERT_BATCH_SIZE, progress=None, duplicate_of=None):
+    """Traite `images` [(nom, lecture)] (voir collect_images) et renvoie (lignes insérées, erreurs [(nom, cause)]).
+
+    Les dérivés sont calculés dans `pool` (ProcessPoolExecutor) ; le rangement dans
+    `store` et `insert_rows(lignes)` restent dans le processus appelant. Au plus
+    `max_in_flight` images sont lues et envoyées au pool à la fois. Si `duplicate_of(empreintes)`
+    est fourni (HashIndex.find_duplicate), les quasi-doublons du catalogue et ceux
+    internes à l'import sont refusés avant d'être rangés.
+    """
+    inserted, errors = [], []
+    metadata = metadata or {}
+    seen = set()
+    pending = []  # (nom, ligne, lecture) dont les métadonnées sont valides
+    for name, read in images:
+        base = os.path.basename(name).lower()
+        seen.add(base)
+        try:
+            pending.append((name, asset_row(name, metadata.get(base, {}), defaults, categories, types), read))
+        except ValueError as e:
+            errors.append((name, str(e)))
+    errors.extend((filename, "présent dans le CSV mais absent de l'envoi") for filename in metadata if filename not in seen)
+
+    total = len(pending)
+    done = 0
+    batch = []  # (nom, ligne complète) en attente d'insertion
+
+    def flush():
+        try:
+            inserted.extend(insert_rows([row for _, row in batch]))
+        except Exception as e:
+            logger.exception("Échec de l'insertion d'un lot de %d assets", len(batch))
+            errors.extend((name, f"insertion : {e}") for name, _ in batch)
+        batch.clear()
+
+    imported_hashes = HashIndex()  # fichiers déjà traités de cet import
+
+    def duplicate_problem(name, hashes):
+        # Cause du refus si l'image double un asset du catalogue ou un autre fichier de l'import
+        existing = duplicate_of(hashes)
+        twin = imported_hashes.find_duplicate(hashes)
+        imported_hashes.add(name, hashes['phash'], hashes['dhash'], hashes['ahash'])
+        if existing is not None:
+            return f"quasi-doublon de l'asset #{existing}"
+        if twin is not None:
+            return f"quasi-doublon de {twin}"
+        return None
+
+    queue = iter(pending)
+    running = {}
+    while True:
+        for name, row, read in queue:
+            try:
+                data = read()
+            except Exception as e:
+                # Membre d'archive corrompu (CRC, compression inconnue...)
+                errors.append((name, f"lecture de l'archive : {e}"))
+                done += 1
+                if progress:
+                    progress(done, total, name)
+                continue
+            running[pool.submit(build_derivatives, data)] = (name, row)
+            if len(running) >= max_in_flight:
+                break
+        if not running:
+            break
+        finished, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in finished:
+            name, row = running.pop(future)
+            try:
+                derivatives = future.result()
+            except UnidentifiedImageError:
+                errors.append((name, "image illisible ou format non reconnu"))
+            except Exception as e:
+                errors.append((name, f"image invalide : {e}"))
+            else:
+                problem = duplicate_problem(name, derivatives['hashes']) if duplicate_of is not None else None
+                if problem:
+                    errors.append((name, problem))
+                else:
+                    try:
+                        batch.append((name, {**row, **store_built_derivatives(store, derivatives)}))
+                    except Exception as e:
+                        logger.exception("Échec du stockage de %s", name)
+                        errors.append((name, f"stockage : {e}"))
+            done += 1
+            if progress:
+                progress(done, total, name)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return inserted, errors
+
+
+def error_report_csv(errors):
+    buffered = io.StringIO()
+    writer = csv.writer(buffered)
+    writer.writerow(["fichier", "erreur"])
+    writer.writerows(errors)
+    return buffered.getvalue().encode("utf-8-sig")
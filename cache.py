@@ -0,0 +1,199 @@
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+# ==================== CACHE DE REQUÊTES ====================
+# Cache LRU borné avec TTL, partagé par toutes les sessions du processus.
+# Chaque entrée porte des étiquettes (asset affiché, famille de pages...) qui
+# permettent d'invalider exactement les entrées touchées par une écriture.
+
+MISS = object()
+
+
+class QueryCache:
+    def __init__(self, max_entries=256, ttl=60.0, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # clé -> (expiration, valeur, étiquettes)
+        self._tags = defaultdict(set)  # étiquette -> clés
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= self._clock():
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return MISS
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value, tags=()):
+        tags = frozenset(tags)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (self._clock() + self.ttl, value, tags)
+            for tag in tags:
+                self._tags[tag].add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute, tags=()):
+        # `tags` peut être une fonction de la valeur calculée (ex. ids des lignes)
+        value = self.get(key)
+        if value is MISS:
+            value = compute()
+            self.put(key, value, tags(value) if callable(tags) else tags)
+        return value
+
+    def keys_tagged(self, tag):
+        with self._lock:
+            return set(self._tags.get(tag, ()))
+
+    def invalidate_tags(self, tags):
+        with self._lock:
+            keys = set()
+            for tag in tags:
+                keys |= self._tags.get(tag, set())
+            for key in keys:
+                self._drop(key)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def invalidate_where(self, predicate):
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                self._drop(key)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    def _drop(self, key):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': len(self._entries),
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+# ==================== CACHE D'IMAGES ====================
+# Octets des images décodées, partagés par toutes les sessions : la grille et le
+# téléchargement servent la même copie. Budget en octets plutôt qu'en entrées,
+# les originaux pesant cent fois plus que les miniatures.
+
+
+class ImageCache:
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # clé -> octets
+        self.resident_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_load(self, key, load):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return data
+            self.misses += 1
+        # Chargé hors du verrou : deux sessions peuvent charger la même image en même temps,
+        # la seconde copie remplace simplement la première
+        data = load()
+        if len(data) <= self.max_bytes:
+            with self._lock:
+                previous = self._entries.pop(key, None)
+                if previous is not None:
+                    self.resident_bytes -= len(previous)
+                self._entries[key] = data
+                self.resident_bytes += len(data)
+                while self.resident_bytes > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self.resident_bytes -= len(evicted)
+                    self.evictions += 1
+        return data
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.resident_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': len(self._entries),
+                'resident_bytes': self.resident_bytes,
+                'max_bytes': self.max_bytes,
+                'evictions': self.evictions,
+            }
+
+
+# ==================== DERNIÈRES RÉPONSES VALIDES ====================
+# Copie des dernières listes et statistiques obtenues, sans TTL ni invalidation :
+# servies, marquées comme anciennes, quand la base ne répond plus (voir resilience.py).
+
+
+class LastGoodCache:
+    def __init__(self, max_entries=256, clock=time.time):
+        self.max_entries = max_entries
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # clé -> (date d'obtention, valeur)
+        self.served = 0
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (self._clock(), value)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key):
+        """(valeur, âge en secondes) ou MISS."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISS
+            self._entries.move_to_end(key)
+            self.served += 1
+            stored_at, value = entry
+            return value, self._clock() - stored_at
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'served': self.served}
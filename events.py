@@ -0,0 +1,123 @@
+import atexit
+import logging
+import threading
+from collections import Counter
+
+from resilience import BackendUnavailable, is_row_error, is_transient
+
+logger = logging.getLogger(__name__)
+
+# ==================== AGRÉGATION DES ÉVÉNEMENTS ====================
+# Les vues et téléchargements sont mis en mémoire puis écrits par lots depuis un
+# thread de fond : aucun aller-retour vers la base pendant le rendu d'une carte.
+# Un lot en échec est retenté au flush suivant. Seul un lot dont la base refuse les
+# données (valeur invalide, contrainte violée) est coupé en deux jusqu'à isoler les
+# lignes fautives, seules perdues, pour ne pas bloquer tout le tampon derrière elles :
+# une panne, même mal classée, ne fait jamais perdre d'événements.
+
+
+def _split(batch):
+    if isinstance(batch, Counter):
+        items = list(batch.items())
+        return Counter(dict(items[:len(items) // 2])), Counter(dict(items[len(items) // 2:]))
+    return batch[:len(batch) // 2], batch[len(batch) // 2:]
+
+
+def write_batch(write, batch, label):
+    """Écrit `batch` (Counter ou liste) ; renvoie la partie à retenter (même type) ou None."""
+    try:
+        write(batch)
+        return None
+    except Exception as e:
+        if isinstance(e, BackendUnavailable) or is_transient(e):
+            logger.warning("Écriture de %d %s reportée : %s", len(batch), label, e)
+            return batch
+        if not is_row_error(e):
+            logger.exception("Écriture de %d %s reportée", len(batch), label)
+            return batch
+        if len(batch) == 1:
+            logger.exception("%s rejeté par la base, abandonné : %r", label, batch)
+            return None
+    retry = [part for part in (write_batch(write, half, label) for half in _split(batch)) if part]
+    if not retry:
+        return None
+    if isinstance(batch, Counter):
+        return sum(retry, Counter())
+    return [row for part in retry for row in part]
+
+
+class EventAggregator:
+    def __init__(self, flush_views, flush_downloads, max_pending=200, flush_interval=5.0, max_buffered=20000):
+        # flush_views(Counter{asset_id: n}) et flush_downloads([(user_id, asset_id), ...])
+        # doivent appliquer le lot de façon atomique côté base.
+        self._flush_views = flush_views
+        self._flush_downloads = flush_downloads
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._views = Counter()
+        self._downloads = []
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="event-aggregator", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def record_view(self, asset_id):
+        with self._lock:
+            self._views[asset_id] += 1
+            full = self._pending() >= self.max_pending
+        if full:
+            self._wakeup.set()
+
+    def record_download(self, user_id, asset_id):
+        with self._lock:
+            self._downloads.append((user_id, asset_id))
+            full = self._pending() >= self.max_pending
+        if full:
+            self._wakeup.set()
+
+    def pending(self):
+        with self._lock:
+            return self._pending()
+
+    def _pending(self):
+        return len(self._views) + len(self._downloads)
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                views, self._views = self._views, Counter()
+                downloads, self._downloads = self._downloads, []
+            if views:
+                self._requeue(views=write_batch(self._flush_views, views, "compteur(s) de vues"))
+            if downloads:
+                self._requeue(downloads=write_batch(self._flush_downloads, downloads, "téléchargement(s)"))
+
+    def _requeue(self, views=None, downloads=None):
+        # Le lot sera retenté au prochain flush, sans laisser le tampon grossir sans limite
+        with self._lock:
+            if views and len(self._views) + len(views) <= self.max_buffered:
+                self._views.update(views)
+            elif views:
+                logger.error("Tampon plein : %d compteur(s) de vues perdus", len(views))
+            if downloads and len(self._downloads) + len(downloads) <= self.max_buffered:
+                self._downloads[:0] = downloads
+            elif downloads:
+                logger.error("Tampon plein : %d téléchargement(s) perdus", len(downloads))
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def close(self):
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        self._wakeup.set()
+        self._thread.join(timeout=self.flush_interval)
+        self.flush()
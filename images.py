@@ -0,0 +1,65 @@
+from io import BytesIO
+
+from PIL import Image, ImageOps, features
+
+from perceptual import image_hashes, to_signed
+
+# ==================== DÉRIVÉS D'IMAGES ====================
+# Chaque upload produit une miniature (grille), un aperçu et l'original intact
+# (téléchargement). Les dérivés sont redressés selon l'orientation EXIF.
+# Les empreintes perceptuelles (perceptual.py) sont calculées au même moment.
+
+THUMBNAIL_SIZE = 400
+PREVIEW_SIZE = 1200
+DERIVATIVE_QUALITY = 80
+
+# Pillow ouvre en "MPO" les JPEG de nombreux téléphones et appareils photo (image
+# principale suivie d'aperçus) : ce sont des .jpg lisibles partout
+FORMAT_EXTENSIONS = {"JPEG": "jpg", "MPO": "jpg", "PNG": "png", "WEBP": "webp", "GIF": "gif"}
+
+DERIVATIVE_FORMAT = "WEBP" if features.check("webp") else "JPEG"
+
+
+def _encode(image, max_size):
+    image = image.copy()
+    image.thumbnail((max_size, max_size), Image.LANCZOS)
+    if DERIVATIVE_FORMAT == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    elif image.mode not in ("RGB", "RGBA", "L"):
+        image = image.convert("RGBA")
+    buffered = BytesIO()
+    if DERIVATIVE_FORMAT == "WEBP":
+        image.save(buffered, format="WEBP", quality=DERIVATIVE_QUALITY, method=4)
+    else:
+        image.save(buffered, format="JPEG", quality=DERIVATIVE_QUALITY, optimize=True)
+    return buffered.getvalue(), FORMAT_EXTENSIONS[DERIVATIVE_FORMAT]
+
+
+def build_derivatives(data):
+    """Renvoie {'original', 'preview', 'thumbnail'} -> (octets, extension), et 'hashes'."""
+    image = Image.open(BytesIO(data))
+    original_ext = FORMAT_EXTENSIONS.get(image.format)
+    if original_ext is None:
+        raise ValueError(f"Format d'image non supporté: {image.format}")
+    image = ImageOps.exif_transpose(image)
+    return {
+        'original': (data, original_ext),
+        'preview': _encode(image, PREVIEW_SIZE),
+        'thumbnail': _encode(image, THUMBNAIL_SIZE),
+        'hashes': image_hashes(image),
+    }
+
+
+def store_derivatives(store, data):
+    """Range les trois versions dans le magasin et renvoie les colonnes de la ligne `assets`."""
+    return store_built_derivatives(store, build_derivatives(data))
+
+
+def store_built_derivatives(store, derivatives):
+    # Dérivés déjà calculés par build_derivatives, éventuellement dans un autre processus
+    return {
+        'image_url': store.put(*derivatives['original']),
+        'preview_url': store.put(*derivatives['preview']),
+        'thumb_url': store.put(*derivatives['thumbnail']),
+        **{column: to_signed(value) for column, value in derivatives['hashes'].items()},
+    }
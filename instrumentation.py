@@ -0,0 +1,291 @@
+import bisect
+import functools
+import json
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict, deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# ==================== INSTRUMENTATION ====================
+# Registre de métriques du processus : durée, lignes et octets de chaque appel au
+# backend, durée des phases de rendu (en-tête, stats, grille, cartes). Chaque rerun
+# produit aussi une trace détaillée pour le panneau de debug. Export au format
+# texte Prometheus ou en JSON lines (une trace par ligne).
+
+METRIC_PREFIX = "pixelmarket"
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # dernier compartiment : +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            yield bound, total
+
+
+class Trace:
+    """Déroulé d'un rerun (page complète ou fragment) : phases et appels, dans l'ordre de fin."""
+
+    def __init__(self, kind, session=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.session = session
+        self.started = time.time()
+        self.duration = None
+        self.spans = []
+        self._start = time.perf_counter()
+        self._phases = []  # pile des phases ouvertes
+
+    @property
+    def current_phase(self):
+        return self._phases[-1] if self._phases else None
+
+    def to_dict(self):
+        return {
+            'trace': self.id,
+            'kind': self.kind,
+            'started': datetime.fromtimestamp(self.started, timezone.utc).isoformat(),
+            'ms': round((self.duration or 0.0) * 1000, 3),
+            'spans': self.spans,
+        }
+
+
+def measure(result):
+    # (lignes, octets) d'un résultat ; les octets approchent la taille de la réponse JSON
+    if result is None or hasattr(result, '__next__'):
+        return 0, 0
+    if isinstance(result, (bytes, bytearray)):
+        return 0, len(result)
+    if isinstance(result, (set, frozenset)):
+        result = list(result)
+    rows = len(result) if isinstance(result, (list, tuple, dict)) else 1
+    return rows, len(json.dumps(result, default=str))
+
+
+class MetricsRegistry:
+    def __init__(self, max_traces=200):
+        self._lock = threading.Lock()
+        self._local = threading.local()  # trace en cours, par thread de script
+        self._calls = defaultdict(Histogram)  # (backend, méthode) -> durées
+        self._rows = Counter()
+        self._bytes = Counter()
+        self._errors = Counter()
+        self._phases = defaultdict(Histogram)  # phase -> durées
+        self._reruns = defaultdict(Histogram)  # type de rerun -> durées
+        self._traces = deque(maxlen=max_traces)
+        self._collectors = {}  # nom -> fonction renvoyant un dict de nombres
+
+    # ---------- traces ----------
+
+    def current_trace(self):
+        trace = getattr(self._local, 'trace', None)
+        return trace if trace is not None and trace.duration is None else None
+
+    def start_trace(self, kind, session=None):
+        # Remplace une éventuelle trace restée ouverte (script interrompu par st.rerun)
+        trace = Trace(kind, session)
+        self._local.trace = trace
+        return trace
+
+    def finish_trace(self, trace=None):
+        trace = trace or self.current_trace()
+        if trace is None or trace.duration is not None:
+            return None
+        trace.duration = time.perf_counter() - trace._start
+        if getattr(self._local, 'trace', None) is trace:
+            self._local.trace = None
+        with self._lock:
+            self._reruns[trace.kind].observe(trace.duration)
+            self._traces.append(trace)
+        return trace
+
+    @contextmanager
+    def phase(self, name, session=None):
+        # Hors d'une trace (rerun d'un fragment seul), la phase ouvre sa propre trace
+        trace = self.current_trace()
+        owned = trace is None
+        if owned:
+            trace = self.start_trace(name, session)
+        trace._phases.append(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            trace._phases.pop()
+            trace.spans.append({'type': 'phase', 'name': name, 'phase': trace.current_phase,
+                                'ms': round(elapsed * 1000, 3)})
+            with self._lock:
+                self._phases[name].observe(elapsed)
+            if owned:
+                self.finish_trace(trace)
+
+    def propagate(self, fn):
+        """Rattache les appels faits par `fn` dans un autre thread à la trace et à la phase courantes."""
+        trace = self.current_trace()
+        phase = trace.current_phase if trace else None
+
+        @functools.wraps(fn)
+        def run(*args, **kwargs):
+            self._local.trace, self._local.origin = trace, (phase,)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._local.trace = self._local.origin = None
+        return run
+
+    def recent_traces(self, session=None, limit=None):
+        with self._lock:
+            traces = [t for t in self._traces if session is None or t.session == session]
+        return traces[-limit:] if limit else traces
+
+    # ---------- appels au backend ----------
+
+    def record_call(self, backend, method, seconds, rows=0, nbytes=0, error=False):
+        key = (backend, method)
+        with self._lock:
+            self._calls[key].observe(seconds)
+            self._rows[key] += rows
+            self._bytes[key] += nbytes
+            if error:
+                self._errors[key] += 1
+        trace = self.current_trace()
+        if trace is not None:
+            # Dans un thread de lecture, la phase est celle du lancement, pas celle du script
+            origin = getattr(self._local, 'origin', None)
+            phase = origin[0] if origin else trace.current_phase
+            span = {'type': 'call', 'name': f"{backend}.{method}", 'phase': phase,
+                    'ms': round(seconds * 1000, 3), 'rows': rows, 'bytes': nbytes}
+            if error:
+                span['error'] = True
+            trace.spans.append(span)
+
+    def call_summary(self, backend=None):
+        """Une ligne par (backend, méthode), la plus coûteuse en temps cumulé d'abord."""
+        with self._lock:
+            summary = [{
+                'backend': b,
+                'method': m,
+                'calls': h.count,
+                'errors': self._errors[(b, m)],
+                'total_ms': h.sum * 1000,
+                'mean_ms': h.sum * 1000 / h.count if h.count else 0.0,
+                'rows': self._rows[(b, m)],
+                'bytes': self._bytes[(b, m)],
+            } for (b, m), h in self._calls.items() if backend in (None, b)]
+        return sorted(summary, key=lambda row: -row['total_ms'])
+
+    def phase_summary(self):
+        with self._lock:
+            summary = [{'phase': name, 'count': h.count, 'total_ms': h.sum * 1000,
+                        'mean_ms': h.sum * 1000 / h.count if h.count else 0.0}
+                       for name, h in self._phases.items()]
+        return sorted(summary, key=lambda row: -row['total_ms'])
+
+    def register_stats(self, name, stats):
+        """`stats()` renvoie un dict de nombres, exportés comme jauges `<name>_<clé>`."""
+        with self._lock:
+            self._collectors[name] = stats
+
+    def reset(self):
+        with self._lock:
+            for store in (self._calls, self._rows, self._bytes, self._errors, self._phases, self._reruns, self._traces):
+                store.clear()
+
+    # ---------- export ----------
+
+    def prometheus_text(self):
+        with self._lock:
+            collectors = list(self._collectors.items())
+        # Lus hors du verrou : chaque composant protège ses propres compteurs
+        gauges = [(name, stats()) for name, stats in collectors]
+        with self._lock:
+            lines = []
+            _histogram(lines, "backend_call_seconds", "Durée des appels au backend",
+                       {_labels(backend=b, method=m): h for (b, m), h in self._calls.items()})
+            for name, help_text, counter in (
+                ("backend_rows_total", "Lignes renvoyées par le backend", self._rows),
+                ("backend_response_bytes_total", "Taille JSON des réponses du backend", self._bytes),
+                ("backend_errors_total", "Appels au backend en erreur", self._errors),
+            ):
+                lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+                lines.append(f"# TYPE {METRIC_PREFIX}_{name} counter")
+                for (b, m), value in sorted(counter.items()):
+                    lines.append(f"{METRIC_PREFIX}_{name}{{{_labels(backend=b, method=m)}}} {value}")
+            _histogram(lines, "render_phase_seconds", "Durée des phases de rendu",
+                       {_labels(phase=name): h for name, h in self._phases.items()})
+            _histogram(lines, "rerun_seconds", "Durée des reruns (page ou fragment)",
+                       {_labels(kind=kind): h for kind, h in self._reruns.items()})
+        for name, values in gauges:
+            for key, value in values.items():
+                metric = f"{METRIC_PREFIX}_{name}_{key}"
+                lines.append(f"# TYPE {metric} gauge")
+                lines.append(f"{metric} {float(value)}")
+        return "\n".join(lines) + "\n"
+
+    def json_lines(self, traces=None):
+        traces = self.recent_traces() if traces is None else traces
+        return "".join(json.dumps(trace.to_dict(), ensure_ascii=False) + "\n" for trace in traces)
+
+
+def _labels(**labels):
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in labels.values())
+    return ",".join(f'{k}="{v}"' for k, v in zip(labels, escaped))
+
+
+def _histogram(lines, name, help_text, series):
+    name = f"{METRIC_PREFIX}_{name}"
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for labels, histogram in sorted(series.items()):
+        for bound, count in histogram.cumulative():
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f'{name}_bucket{{{labels},le="{le}"}} {count}')
+        lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+        lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+
+
+# Registre partagé par toutes les sessions du processus
+REGISTRY = MetricsRegistry()
+
+
+class Instrumented:
+    """Proxy qui mesure chaque méthode publique de `inner` (durée, lignes, octets, erreurs)."""
+
+    def __init__(self, inner, backend, registry=REGISTRY):
+        self._inner = inner
+        self._backend = backend
+        self._registry = registry
+
+    def __getattr__(self, name):
+        attr = getattr(self._inner, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        def call(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = attr(*args, **kwargs)
+            except Exception:
+                self._registry.record_call(self._backend, name, time.perf_counter() - start, error=True)
+                raise
+            elapsed = time.perf_counter() - start
+            rows, nbytes = measure(result)
+            self._registry.record_call(self._backend, name, elapsed, rows, nbytes)
+            return result
+        return call
@@ -0,0 +1,143 @@
+"""Déplace les images encore stockées en base64 dans `assets.image_url` vers le magasin d'images.
+
+Usage :
+    python migrate_images.py [--batch-size 20] [--dry-run] [--derivatives] [--hashes]
+
+--derivatives génère aussi la miniature et l'aperçu des lignes qui n'en ont pas.
+--hashes calcule les empreintes perceptuelles (migrations/008) des lignes qui n'en ont pas.
+
+Les identifiants sont lus dans .streamlit/secrets.toml (mêmes clés que l'application).
+"""
+import argparse
+import base64
+import sys
+from io import BytesIO
+
+import streamlit as st
+from PIL import Image, ImageOps
+from supabase import create_client
+
+from blob_store import BLOB_PREFIX, make_blob_store
+from images import store_derivatives
+from perceptual import image_hashes, to_signed
+
+
+def _iter_rows(client, batch_size, where):
+    """Lignes `assets` (id, image_url) retenues par `where(requête)`, par id croissant.
+
+    Pagination par id : on ne charge jamais plus de `batch_size` images en mémoire.
+    """
+    last_id = 0
+    while True:
+        rows = where(
+            client.table('assets')
+            .select('id,image_url')
+            .gt('id', last_id)
+        ).order('id').limit(batch_size).execute().data
+        if not rows:
+            return
+        last_id = rows[-1]['id']
+        yield from rows
+
+
+def _load_image(store, row):
+    # Original déjà dans le magasin, ou encore en base64 dans la ligne
+    if row['image_url'].startswith(BLOB_PREFIX):
+        return store.get(row['image_url'])
+    return base64.b64decode(row['image_url'])
+
+
+def migrate(client, store, batch_size=20, dry_run=False):
+    moved = 0
+    failed = 0
+    for row in _iter_rows(client, batch_size, lambda query: query.not_.like('image_url', f'{BLOB_PREFIX}%')):
+        if not row['image_url']:
+            continue
+        try:
+            data = base64.b64decode(row['image_url'])
+            if dry_run:
+                print(f"[dry-run] asset {row['id']}: {len(data)} octets")
+            else:
+                ref = store.put(data, "png")
+                client.table('assets').update({'image_url': ref}).eq('id', row['id']).execute()
+                print(f"asset {row['id']} -> {ref}")
+            moved += 1
+        except Exception as e:
+            failed += 1
+            print(f"asset {row['id']}: échec ({e})", file=sys.stderr)
+    return moved, failed
+
+
+def backfill_derivatives(client, store, batch_size=20, dry_run=False):
+    done = 0
+    failed = 0
+    for row in _iter_rows(client, batch_size, lambda query: query.is_('thumb_url', 'null')):
+        try:
+            data = _load_image(store, row)
+            if dry_run:
+                print(f"[dry-run] dérivés pour asset {row['id']}")
+            else:
+                images = store_derivatives(store, data)
+                # L'original reste celui déjà référencé par la ligne
+                images.pop('image_url')
+                client.table('assets').update(images).eq('id', row['id']).execute()
+                print(f"asset {row['id']} -> {images['thumb_url']}")
+            done += 1
+        except Exception as e:
+            failed += 1
+            print(f"asset {row['id']}: échec dérivés ({e})", file=sys.stderr)
+    return done, failed
+
+
+def backfill_hashes(client, store, batch_size=20, dry_run=False):
+    done = 0
+    failed = 0
+    for row in _iter_rows(client, batch_size, lambda query: query.is_('phash', 'null')):
+        try:
+            # Même entrée qu'à l'upload : l'original redressé selon l'EXIF
+            hashes = image_hashes(ImageOps.exif_transpose(Image.open(BytesIO(_load_image(store, row)))))
+            if dry_run:
+                print(f"[dry-run] empreintes pour asset {row['id']}")
+            else:
+                client.table('assets').update({k: to_signed(v) for k, v in hashes.items()}).eq('id', row['id']).execute()
+                print(f"asset {row['id']} -> phash {hashes['phash']:016x}")
+            done += 1
+        except Exception as e:
+            failed += 1
+            print(f"asset {row['id']}: échec empreintes ({e})", file=sys.stderr)
+    return done, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--derivatives", action="store_true")
+    parser.add_argument("--hashes", action="store_true")
+    args = parser.parse_args(argv)
+
+    url = st.secrets["SUPABASE_URL"]
+    key = st.secrets.get("SUPABASE_KEY", st.secrets.get("SUPABASE_SERVICE_KEY"))
+    client = create_client(url, key)
+    store = make_blob_store(
+        st.secrets.get("BLOB_BACKEND", "supabase"),
+        client=client,
+        bucket=st.secrets.get("BLOB_BUCKET", "assets"),
+        root=st.secrets.get("BLOB_DIR", ".blobs"),
+    )
+
+    moved, failed = migrate(client, store, args.batch_size, args.dry_run)
+    print(f"{moved} image(s) migrée(s), {failed} échec(s)")
+    if args.derivatives:
+        done, derivative_failures = backfill_derivatives(client, store, args.batch_size, args.dry_run)
+        print(f"{done} dérivé(s) générés, {derivative_failures} échec(s)")
+        failed += derivative_failures
+    if args.hashes:
+        done, hash_failures = backfill_hashes(client, store, args.batch_size, args.dry_run)
+        print(f"{done} empreinte(s) calculée(s), {hash_failures} échec(s)")
+        failed += hash_failures
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
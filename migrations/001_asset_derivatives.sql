@@ -0,0 +1,3 @@
+-- Dérivés d'images : la grille lit la miniature, le téléchargement sert l'original (image_url)
+alter table assets add column if not exists thumb_url text;
+alter table assets add column if not exists preview_url text;
@@ -0,0 +1,4 @@
+-- Pagination par curseur (upload_date, id) : la grille lit une page par index, sans tri ni OFFSET
+create index if not exists assets_upload_date_id_idx on assets (upload_date desc, id desc);
+create index if not exists assets_category_upload_date_id_idx on assets (category, upload_date desc, id desc);
+create index if not exists assets_type_upload_date_id_idx on assets (asset_type, upload_date desc, id desc);
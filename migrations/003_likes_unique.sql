@@ -0,0 +1,5 @@
+-- Un like par (utilisateur, asset) : permet l'upsert sans lecture préalable
+-- et sert la requête `user_id = ? and asset_id in (...)` de la grille.
+delete from likes a using likes b
+where a.user_id = b.user_id and a.asset_id = b.asset_id and a.id > b.id;
+create unique index if not exists likes_user_asset_idx on likes (user_id, asset_id);
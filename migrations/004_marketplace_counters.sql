@@ -0,0 +1,61 @@
+-- Compteurs du bandeau de statistiques, maintenus par triggers à chaque écriture
+-- au lieu de quatre count(*) exacts à chaque rerun.
+create table if not exists marketplace_counters (
+    name text primary key,
+    value bigint not null default 0
+);
+
+create or replace function bump_counter(counter_name text, delta bigint)
+returns void language sql as $$
+    insert into marketplace_counters (name, value) values (counter_name, delta)
+    on conflict (name) do update set value = marketplace_counters.value + excluded.value;
+$$;
+
+create or replace function assets_counters_trigger()
+returns trigger language plpgsql as $$
+begin
+    if tg_op = 'INSERT' then
+        perform bump_counter('total_assets', 1);
+        if not new.is_premium then perform bump_counter('free_assets', 1); end if;
+    elsif tg_op = 'DELETE' then
+        perform bump_counter('total_assets', -1);
+        if not old.is_premium then perform bump_counter('free_assets', -1); end if;
+    elsif new.is_premium is distinct from old.is_premium then
+        perform bump_counter('free_assets', case when new.is_premium then -1 else 1 end);
+    end if;
+    return null;
+end;
+$$;
+
+create or replace function row_counter_trigger()
+returns trigger language plpgsql as $$
+begin
+    -- tg_argv[0] : nom du compteur
+    if tg_op = 'INSERT' then
+        perform bump_counter(tg_argv[0], 1);
+    else
+        perform bump_counter(tg_argv[0], -1);
+    end if;
+    return null;
+end;
+$$;
+
+drop trigger if exists assets_counters on assets;
+create trigger assets_counters after insert or delete or update of is_premium on assets
+    for each row execute function assets_counters_trigger();
+
+drop trigger if exists downloads_counter on downloads;
+create trigger downloads_counter after insert or delete on downloads
+    for each row execute function row_counter_trigger('total_downloads');
+
+drop trigger if exists users_counter on users;
+create trigger users_counter after insert or delete on users
+    for each row execute function row_counter_trigger('active_users');
+
+-- Valeurs initiales
+insert into marketplace_counters (name, value) values
+    ('total_assets', (select count(*) from assets)),
+    ('free_assets', (select count(*) from assets where not is_premium)),
+    ('total_downloads', (select count(*) from downloads)),
+    ('active_users', (select count(*) from users))
+on conflict (name) do update set value = excluded.value;
@@ -0,0 +1,9 @@
+-- Incréments de vues groupés, appliqués atomiquement (views = views + n)
+-- increments : [{"asset_id": 1, "views": 3}, ...]
+create or replace function increment_asset_views(increments jsonb)
+returns void language sql as $$
+    update assets a
+    set views = coalesce(a.views, 0) + (x->>'views')::int
+    from jsonb_array_elements(increments) x
+    where a.id = (x->>'asset_id')::bigint;
+$$;
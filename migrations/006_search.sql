@@ -0,0 +1,70 @@
+-- Recherche plein texte classée, insensible aux accents, à la place de ilike '%q%'.
+-- La normalisation (minuscules, sans accents, mots vides retirés) est faite côté
+-- application par search.tokenize ; la configuration 'simple' ne fait ensuite que découper.
+create extension if not exists unaccent;
+create extension if not exists pg_trgm;
+
+-- unaccent() n'est pas IMMUTABLE : enveloppe nécessaire pour les colonnes générées et les index
+create or replace function immutable_unaccent(text)
+returns text language sql immutable parallel safe strict as $$
+    select public.unaccent('public.unaccent'::regdictionary, $1);
+$$;
+
+alter table assets add column if not exists search_vector tsvector generated always as (
+    setweight(to_tsvector('simple', immutable_unaccent(lower(coalesce(tags, '')))), 'A') ||
+    setweight(to_tsvector('simple', immutable_unaccent(lower(coalesce(title, '')))), 'B') ||
+    setweight(to_tsvector('simple', immutable_unaccent(lower(coalesce(author, '')))), 'C')
+) stored;
+
+alter table assets add column if not exists search_text text generated always as (
+    immutable_unaccent(lower(coalesce(title, '') || ' ' || coalesce(author, '') || ' ' || coalesce(tags, '')))
+) stored;
+
+create index if not exists assets_search_vector_idx on assets using gin (search_vector);
+create index if not exists assets_search_text_trgm_idx on assets using gin (search_text gin_trgm_ops);
+
+-- Correspondance plein texte (préfixe sur le dernier mot) ou, à défaut, par trigrammes
+-- (fautes de frappe). La requête est comparée mot à mot au texte (word_similarity,
+-- opérateur <%, seuil pg_trgm.word_similarity_threshold) : similarity() sur tout le
+-- titre + auteur + étiquettes reste loin du seuil même pour un mot exact.
+-- Classement : ts_rank_cd pondéré (étiquettes > titre > auteur).
+create or replace function search_assets(
+    q_tsquery text,
+    q_text text,
+    p_category text default null,
+    p_asset_type text default null,
+    p_premium_only boolean default false,
+    p_offset int default 0,
+    p_limit int default 24
+)
+returns setof assets language sql stable as $$
+    select a.*
+    from assets a,
+         to_tsquery('simple', q_tsquery) q
+    where (a.search_vector @@ q or q_text <% a.search_text)
+      and (p_category is null or a.category = p_category)
+      and (p_asset_type is null or a.asset_type = p_asset_type)
+      and (not p_premium_only or a.is_premium)
+    order by ts_rank_cd('{0.2, 0.4, 0.6, 1.0}', a.search_vector, q)
+             + 0.3 * word_similarity(q_text, a.search_text) desc,
+             a.id desc
+    offset p_offset
+    limit p_limit;
+$$;
+
+create or replace function count_search_assets(
+    q_tsquery text,
+    q_text text,
+    p_category text default null,
+    p_asset_type text default null,
+    p_premium_only boolean default false
+)
+returns bigint language sql stable as $$
+    select count(*)
+    from assets a,
+         to_tsquery('simple', q_tsquery) q
+    where (a.search_vector @@ q or q_text <% a.search_text)
+      and (p_category is null or a.category = p_category)
+      and (p_asset_type is null or a.asset_type = p_asset_type)
+      and (not p_premium_only or a.is_premium);
+$$;
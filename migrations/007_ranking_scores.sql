@@ -0,0 +1,103 @@
+-- Scores de classement pré-calculés pour "Plus populaire" et "Tendance",
+-- mis à jour par triggers à chaque like / téléchargement / lot de vues.
+--
+-- popularity_score = 1 * vues + 3 * likes + 5 * téléchargements
+--
+-- trending_score = ln(1 + somme des poids * exp(lambda * (t_événement - t0)))
+-- Chaque événement ajoute exp(lambda * (t - t0)) : les événements récents pèsent
+-- plus, avec une demi-vie de 48 h. Le score est stocké en logarithme
+-- (log-sum-exp), donc il ne déborde jamais et se met à jour en O(1) sans
+-- jamais recalculer toute la table. L'ordre obtenu est celui du score décroissant.
+
+alter table assets add column if not exists likes_count integer not null default 0;
+alter table assets add column if not exists popularity_score double precision not null default 0;
+alter table assets add column if not exists trending_score double precision not null default 0;
+
+create or replace function trending_event(weight double precision, at timestamptz)
+returns double precision language sql immutable parallel safe as $$
+    -- ln(weight) + lambda * (at - t0), lambda = ln 2 / 48 h
+    select ln(weight) + ln(2) / (48 * 3600) * extract(epoch from at - timestamptz '2025-01-01 00:00:00+00');
+$$;
+
+create or replace function log_add_exp(a double precision, b double precision)
+returns double precision language sql immutable parallel safe as $$
+    select greatest(a, b) + ln(1 + exp(-abs(a - b)));
+$$;
+
+create or replace function bump_asset_scores(p_asset_id bigint, weight double precision)
+returns void language sql as $$
+    update assets
+    set popularity_score = popularity_score + weight,
+        trending_score = case when weight > 0
+                              then log_add_exp(trending_score, trending_event(weight, now()))
+                              else trending_score end
+    where id = p_asset_id;
+$$;
+
+create or replace function likes_scores_trigger()
+returns trigger language plpgsql as $$
+begin
+    if tg_op = 'INSERT' then
+        update assets set likes_count = likes_count + 1 where id = new.asset_id;
+        perform bump_asset_scores(new.asset_id, 3);
+    else
+        -- Retirer un like baisse la popularité ; la tendance, elle, s'estompe d'elle-même
+        update assets set likes_count = greatest(likes_count - 1, 0) where id = old.asset_id;
+        perform bump_asset_scores(old.asset_id, -3);
+    end if;
+    return null;
+end;
+$$;
+
+create or replace function downloads_scores_trigger()
+returns trigger language plpgsql as $$
+begin
+    perform bump_asset_scores(new.asset_id, 5);
+    return null;
+end;
+$$;
+
+create or replace function assets_initial_trending()
+returns trigger language plpgsql as $$
+begin
+    -- La mise en ligne compte comme un événement : une nouveauté apparaît dans "Tendance"
+    new.trending_score := log_add_exp(0, trending_event(1, coalesce(new.upload_date, now())));
+    return new;
+end;
+$$;
+
+drop trigger if exists likes_scores on likes;
+create trigger likes_scores after insert or delete on likes
+    for each row execute function likes_scores_trigger();
+
+drop trigger if exists downloads_scores on downloads;
+create trigger downloads_scores after insert on downloads
+    for each row execute function downloads_scores_trigger();
+
+drop trigger if exists assets_trending on assets;
+create trigger assets_trending before insert on assets
+    for each row execute function assets_initial_trending();
+
+-- Les lots de vues (migrations/005) alimentent aussi les scores
+create or replace function increment_asset_views(increments jsonb)
+returns void language sql as $$
+    update assets a
+    set views = coalesce(a.views, 0) + (x->>'views')::int,
+        popularity_score = a.popularity_score + (x->>'views')::int,
+        trending_score = log_add_exp(a.trending_score, trending_event((x->>'views')::int, now()))
+    from jsonb_array_elements(increments) x
+    where a.id = (x->>'asset_id')::bigint;
+$$;
+
+-- Valeurs initiales
+update assets a
+set likes_count = coalesce(l.n, 0),
+    popularity_score = coalesce(a.views, 0) + 3 * coalesce(l.n, 0) + 5 * coalesce(a.downloads, 0),
+    trending_score = log_add_exp(0, trending_event(1, a.upload_date))
+from assets a2
+left join (select asset_id, count(*) as n from likes group by asset_id) l on l.asset_id = a2.id
+where a2.id = a.id;
+
+create index if not exists assets_popularity_id_idx on assets (popularity_score desc, id desc);
+create index if not exists assets_downloads_id_idx on assets (downloads desc, id desc);
+create index if not exists assets_trending_id_idx on assets (trending_score desc, id desc);
@@ -0,0 +1,5 @@
+-- Empreintes perceptuelles 64 bits (perceptual.py), stockées signées en bigint.
+-- L'index de Hamming vit en mémoire dans l'application : aucune requête ne filtre sur ces colonnes.
+alter table assets add column if not exists ahash bigint;
+alter table assets add column if not exists dhash bigint;
+alter table assets add column if not exists phash bigint;
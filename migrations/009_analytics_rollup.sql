@@ -0,0 +1,71 @@
+-- Analytique des administrateurs (analytics.py) : agrégats par jour, événement,
+-- catégorie, type, auteur et gratuit/premium, alimentés par lots depuis les tables
+-- d'événements. Un filigrane (dernier id traité) par table : chaque mise à jour ne
+-- lit que les nouveaux événements.
+
+-- Journal des vues : une ligne par asset et par lot écrit par l'agrégateur (events.py),
+-- pour compter les vues par jour comme les likes et les téléchargements
+create table if not exists views (
+    id bigint generated by default as identity primary key,
+    asset_id bigint not null,
+    views int not null,
+    created_at timestamptz not null default now()
+);
+
+create or replace function increment_asset_views(increments jsonb)
+returns void language sql as $$
+    update assets a
+    set views = coalesce(a.views, 0) + (x->>'views')::int,
+        popularity_score = a.popularity_score + (x->>'views')::int,
+        trending_score = log_add_exp(a.trending_score, trending_event((x->>'views')::int, now()))
+    from jsonb_array_elements(increments) x
+    where a.id = (x->>'asset_id')::bigint;
+
+    insert into views (asset_id, views)
+    select (x->>'asset_id')::bigint, (x->>'views')::int
+    from jsonb_array_elements(increments) x;
+$$;
+
+create table if not exists analytics_rollup (
+    day date not null,
+    event text not null,  -- 'downloads', 'likes' ou 'views'
+    category text not null default '',
+    asset_type text not null default '',
+    author text not null default '',
+    is_premium boolean not null default false,
+    count bigint not null default 0,
+    primary key (day, event, category, asset_type, author, is_premium)
+);
+
+create table if not exists analytics_watermarks (
+    source text primary key,
+    last_id bigint not null default 0,
+    updated_at timestamptz not null default now()
+);
+
+-- Ajoute les agrégats d'un lot et avance le filigrane dans la même transaction.
+-- Renvoie false, sans rien écrire, si un autre processus a déjà avancé le filigrane :
+-- un même événement n'est jamais compté deux fois.
+-- deltas : [{"day": "2025-01-31", "category": ..., "asset_type": ..., "author": ...,
+--            "is_premium": false, "count": 3}, ...]
+create or replace function apply_analytics_chunk(source_name text, previous_id bigint, next_id bigint, deltas jsonb)
+returns boolean language plpgsql as $$
+begin
+    insert into analytics_watermarks (source, last_id) values (source_name, 0)
+    on conflict (source) do nothing;
+
+    update analytics_watermarks set last_id = next_id, updated_at = now()
+    where source = source_name and last_id = previous_id;
+    if not found then
+        return false;
+    end if;
+
+    insert into analytics_rollup (day, event, category, asset_type, author, is_premium, count)
+    select (x->>'day')::date, source_name, x->>'category', x->>'asset_type', x->>'author',
+           (x->>'is_premium')::boolean, (x->>'count')::bigint
+    from jsonb_array_elements(deltas) x
+    on conflict (day, event, category, asset_type, author, is_premium)
+    do update set count = analytics_rollup.count + excluded.count;
+    return true;
+end;
+$$;
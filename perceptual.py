@@ -0,0 +1,161 @@
+import threading
+from functools import lru_cache
+from itertools import combinations
+
+import numpy as np
+from PIL import Image
+
+# ==================== EMPREINTES PERCEPTUELLES ====================
+# aHash, dHash et pHash (64 bits) : deux images visuellement proches ont des
+# empreintes à faible distance de Hamming, même après recompression ou
+# redimensionnement. L'index permet de trouver en quelques microsecondes les
+# quasi-doublons à l'import et les images similaires d'un asset.
+
+HASH_BITS = 64
+HASH_COLUMNS = ('ahash', 'dhash', 'phash')
+DUPLICATE_DISTANCE = 4  # pHash : au-delà, deux images sont différentes
+SIMILAR_DISTANCE = 14
+
+_HASH_INPUT_SIZE = 256
+_DCT_SIZE = 32
+# Matrice de la DCT-II orthonormée 32x32, calculée une fois
+_k = np.arange(_DCT_SIZE)
+_DCT = np.sqrt(2 / _DCT_SIZE) * np.cos(np.pi * (2 * _k[None, :] + 1) * _k[:, None] / (2 * _DCT_SIZE))
+_DCT[0] /= np.sqrt(2)
+
+
+def _bits_to_int(bits):
+    return int.from_bytes(np.packbits(bits.astype(np.uint8).ravel()).tobytes(), "big")
+
+
+def _gray(image, size):
+    return np.asarray(image.resize(size, Image.LANCZOS), dtype=np.float64)
+
+
+def image_hashes(image):
+    """Renvoie {'ahash', 'dhash', 'phash'} -> entier non signé de 64 bits."""
+    gray = image.convert("L")
+    # Réduction préalable : les empreintes ne regardent que les basses fréquences
+    gray.thumbnail((_HASH_INPUT_SIZE, _HASH_INPUT_SIZE), Image.BILINEAR)
+    pixels = _gray(gray, (8, 8))
+    wide = _gray(gray, (9, 8))
+    coefficients = _DCT @ _gray(gray, (_DCT_SIZE, _DCT_SIZE)) @ _DCT.T
+    low = coefficients[:8, :8]
+    return {
+        'ahash': _bits_to_int(pixels > pixels.mean()),
+        'dhash': _bits_to_int(wide[:, 1:] > wide[:, :-1]),
+        'phash': _bits_to_int(low > np.median(low)),
+    }
+
+
+def to_signed(value):
+    # Les colonnes bigint (Postgres) et integer (SQLite) sont signées
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+def to_unsigned(value):
+    return value + (1 << HASH_BITS) if value < 0 else value
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+@lru_cache(maxsize=None)
+def _flip_masks(width, radius):
+    # Tous les masques de `width` bits ayant au plus `radius` bits à 1
+    masks = []
+    for r in range(radius + 1):
+        for positions in combinations(range(width), r):
+            masks.append(sum(1 << p for p in positions))
+    return tuple(masks)
+
+
+class HashIndex:
+    """Index de Hamming par multi-index hashing sur le pHash.
+
+    L'empreinte est découpée en `chunks` morceaux. Si deux empreintes sont à
+    distance <= r, au moins un morceau est à distance <= r // chunks : on ne
+    compare que les candidats trouvés en sondant ces voisinages, au lieu de
+    parcourir tout le catalogue.
+    """
+
+    def __init__(self, chunks=5):
+        self._lock = threading.Lock()
+        bounds = [HASH_BITS * i // chunks for i in range(chunks + 1)]
+        self._chunks = [(start, end - start) for start, end in zip(bounds, bounds[1:])]
+        self._tables = [{} for _ in self._chunks]  # morceau -> {valeur: {asset_id}}
+        self._hashes = {}  # asset_id -> (phash, dhash, ahash)
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def _parts(self, phash):
+        return [(phash >> start) & ((1 << width) - 1) for start, width in self._chunks]
+
+    def add(self, asset_id, phash, dhash=0, ahash=0):
+        with self._lock:
+            self._remove(asset_id)
+            self._hashes[asset_id] = (phash, dhash, ahash)
+            for table, part in zip(self._tables, self._parts(phash)):
+                table.setdefault(part, set()).add(asset_id)
+
+    def remove(self, asset_id):
+        with self._lock:
+            self._remove(asset_id)
+
+    def _remove(self, asset_id):
+        hashes = self._hashes.pop(asset_id, None)
+        if hashes is None:
+            return
+        for table, part in zip(self._tables, self._parts(hashes[0])):
+            bucket = table[part]
+            bucket.discard(asset_id)
+            if not bucket:
+                del table[part]
+
+    def hashes_of(self, asset_id):
+        with self._lock:
+            return self._hashes.get(asset_id)
+
+    def query(self, phash, radius, dhash=None, ahash=None):
+        """[(distance pHash, asset_id)] à distance <= radius, les plus proches d'abord.
+
+        À distance pHash égale, dHash puis aHash départagent quand ils sont fournis.
+        """
+        probe_radius = radius // len(self._chunks)
+        with self._lock:
+            candidates = set()
+            for table, part, (_, width) in zip(self._tables, self._parts(phash), self._chunks):
+                for mask in _flip_masks(width, probe_radius):
+                    bucket = table.get(part ^ mask)
+                    if bucket:
+                        candidates |= bucket
+            matches = []
+            for asset_id in candidates:
+                other = self._hashes[asset_id]
+                distance = hamming(phash, other[0])
+                if distance <= radius:
+                    tie_break = ((hamming(dhash, other[1]) if dhash is not None else 0)
+                                 + (hamming(ahash, other[2]) if ahash is not None else 0))
+                    matches.append((distance, tie_break, asset_id))
+        matches.sort()
+        return [(distance, asset_id) for distance, _, asset_id in matches]
+
+    def find_duplicate(self, hashes, radius=DUPLICATE_DISTANCE):
+        """asset_id le plus proche si `hashes` (voir image_hashes) désigne un quasi-doublon, sinon None."""
+        matches = self.query(hashes['phash'], radius, hashes['dhash'], hashes['ahash'])
+        return matches[0][1] if matches else None
+
+    def similar(self, asset_id, limit=4, radius=SIMILAR_DISTANCE):
+        hashes = self.hashes_of(asset_id)
+        if hashes is None:
+            return []
+        phash, dhash, ahash = hashes
+        return [other for _, other in self.query(phash, radius, dhash, ahash) if other != asset_id][:limit]
+
+    def add_row(self, row):
+        # Ligne `assets` (colonnes signées) ; ignorée tant que ses empreintes ne sont pas calculées
+        if row.get('phash') is None:
+            return
+        self.add(row['id'], *(to_unsigned(row.get(column) or 0) for column in ('phash', 'dhash', 'ahash')))
@@ -0,0 +1,592 @@
+import math
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+from search import MemorySearch, PostgresSearch
+
+# ==================== ACCÈS AUX DONNÉES ====================
+# Une seule interface pour les utilisateurs, assets, likes et téléchargements :
+#   - SupabaseRepository : la production (PostgREST + fonctions SQL de migrations/)
+#   - SQLiteRepository   : fichier local ou ":memory:", mêmes règles (triggers de
+#     compteurs et de scores), pour travailler hors ligne et pour les benchmarks.
+# Les méthodes lèvent leurs exceptions ; l'application décide comment les afficher.
+
+ASSET_COLUMNS = (
+    'id', 'title', 'author', 'author_id', 'description', 'category', 'asset_type',
+    'is_premium', 'price', 'image_url', 'thumb_url', 'preview_url', 'tags', 'views',
+    'downloads', 'likes_count', 'popularity_score', 'trending_score', 'upload_date',
+    'ahash', 'dhash', 'phash',
+)
+SORTABLE_COLUMNS = ('upload_date', 'popularity_score', 'downloads', 'trending_score')
+SEARCH_DOCUMENT_COLUMNS = 'id,title,author,tags,category,asset_type,is_premium'
+
+# Tables d'événements lues par l'analytique -> colonne du nombre d'événements par ligne
+# (None : une ligne = un événement). Voir migrations/009 et analytics.py.
+EVENT_TABLES = {'downloads': None, 'likes': None, 'views': 'views'}
+ROLLUP_COLUMNS = ('day', 'event', 'category', 'asset_type', 'author', 'is_premium', 'count')
+
+# Mêmes constantes que migrations/007_ranking_scores.sql
+TRENDING_HALF_LIFE = 48 * 3600
+TRENDING_EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def utc_now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def trending_event(weight, at):
+    if isinstance(at, str):
+        at = datetime.fromisoformat(at)
+    return math.log(weight) + math.log(2) / TRENDING_HALF_LIFE * (at - TRENDING_EPOCH).total_seconds()
+
+
+def log_add_exp(a, b):
+    return max(a, b) + math.log1p(math.exp(-abs(a - b)))
+
+
+class Repository:
+    """Interface commune. `columns` est une liste de colonnes séparées par des virgules."""
+
+    # Utilisateurs
+    def get_or_create_user(self, username):
+        raise NotImplementedError
+
+    # Assets
+    def insert_asset(self, data):
+        return self.insert_assets([data])[0]
+
+    def insert_assets(self, rows):
+        # Insertion groupée ; renvoie les lignes créées (avec id et valeurs par défaut)
+        raise NotImplementedError
+
+    def list_assets(self, category="Tous", asset_type="Tous", premium_only=False,
+                    sort_column='upload_date', cursor=None, limit=24, columns='*'):
+        # Pagination par curseur (valeur de tri, id), ordre décroissant
+        raise NotImplementedError
+
+    def count_assets(self, category="Tous", asset_type="Tous", premium_only=False):
+        raise NotImplementedError
+
+    def get_assets(self, asset_ids, columns='*'):
+        raise NotImplementedError
+
+    def iter_assets(self, columns='*', batch_size=1000):
+        last_id = 0
+        while True:
+            rows = self._assets_after(last_id, columns, batch_size)
+            yield from rows
+            if len(rows) < batch_size:
+                break
+            last_id = rows[-1]['id']
+
+    def _assets_after(self, last_id, columns, limit):
+        raise NotImplementedError
+
+    def search_assets(self, query, category="Tous", asset_type="Tous", premium_only=False,
+                      offset=0, limit=24, columns='*'):
+        return self.search.search(query, category, asset_type, premium_only,
+                                  offset=offset, limit=limit, columns=columns)
+
+    def count_search_assets(self, query, category="Tous", asset_type="Tous", premium_only=False):
+        return self.search.count(query, category, asset_type, premium_only)
+
+    # Likes
+    def liked_ids(self, user_id, asset_ids):
+        raise NotImplementedError
+
+    def set_like(self, user_id, asset_id, liked):
+        raise NotImplementedError
+
+    # Événements groupés (voir events.EventAggregator)
+    def record_downloads(self, downloads):
+        raise NotImplementedError
+
+    def increment_views(self, views):
+        raise NotImplementedError
+
+    # Compteurs du bandeau de statistiques
+    def get_counters(self, names):
+        raise NotImplementedError
+
+    # Analytique (voir analytics.py)
+    def events_after(self, source, last_id, limit):
+        # Événements de `source` (clé de EVENT_TABLES) d'id > last_id, par id croissant :
+        # [{'id', 'asset_id', 'created_at', 'count'}]
+        raise NotImplementedError
+
+    def get_watermarks(self):
+        # {source: dernier id agrégé}
+        raise NotImplementedError
+
+    def apply_analytics_chunk(self, source, previous_id, next_id, deltas):
+        # Ajoute `deltas` (lignes de ROLLUP_COLUMNS sans 'event') au cumul et avance le
+        # filigrane, atomiquement ; False si le filigrane n'était plus `previous_id`
+        raise NotImplementedError
+
+    def iter_rollup(self, since_day, batch_size=1000):
+        # Lignes du cumul à partir du jour `since_day` (AAAA-MM-JJ)
+        raise NotImplementedError
+
+
+class SupabaseRepository(Repository):
+    def __init__(self, client, search_backend="postgres"):
+        self.client = client
+        if search_backend == "memory":
+            self.search = MemorySearch(self.get_assets, self.iter_assets(SEARCH_DOCUMENT_COLUMNS))
+        else:
+            self.search = PostgresSearch(client)
+
+    def _filter(self, query, category, asset_type, premium_only):
+        if category != "Tous":
+            query = query.eq('category', category)
+        if asset_type != "Tous":
+            query = query.eq('asset_type', asset_type)
+        if premium_only:
+            query = query.eq('is_premium', True)
+        return query
+
+    def get_or_create_user(self, username):
+        result = self.client.table('users').select('id').eq('username', username).execute()
+        if result.data:
+            return result.data[0]['id']
+        new_user = self.client.table('users').insert({'username': username}).execute()
+        return new_user.data[0]['id']
+
+    def insert_assets(self, rows):
+        inserted = self.client.table('assets').insert(list(rows)).execute().data
+        for row in inserted:
+            self.search.add(row)
+        return inserted
+
+    def list_assets(self, category="Tous", asset_type="Tous", premium_only=False,
+                    sort_column='upload_date', cursor=None, limit=24, columns='*'):
+        query = self._filter(self.client.table('assets').select(columns), category, asset_type, premium_only)
+        if cursor:
+            value, asset_id = cursor
+            query = query.or_(f'{sort_column}.lt."{value}",and({sort_column}.eq."{value}",id.lt.{asset_id})')
+        return query.order(sort_column, desc=True).order('id', desc=True).limit(limit).execute().data
+
+    def count_assets(self, category="Tous", asset_type="Tous", premium_only=False):
+        query = self._filter(self.client.table('assets').select('id', count='exact', head=True),
+                             category, asset_type, premium_only)
+        return query.execute().count or 0
+
+    def get_assets(self, asset_ids, columns='*'):
+        return self.client.table('assets').select(columns).in_('id', list(asset_ids)).execute().data
+
+    def _assets_after(self, last_id, columns, limit):
+        return self.client.table('assets').select(columns).gt('id', last_id).order('id').limit(limit).execute().data
+
+    def liked_ids(self, user_id, asset_ids):
+        result = self.client.table('likes').select('asset_id').eq('user_id', user_id).in_('asset_id', list(asset_ids)).execute()
+        return {row['asset_id'] for row in result.data}
+
+    def set_like(self, user_id, asset_id, liked):
+        if liked:
+            self.client.table('likes').upsert(
+                {'user_id': user_id, 'asset_id': asset_id},
+                on_conflict='user_id,asset_id',
+                ignore_duplicates=True
+            ).execute()
+        else:
+            self.client.table('likes').delete().eq('user_id', user_id).eq('asset_id', asset_id).execute()
+
+    def record_downloads(self, downloads):
+        # Insertion groupée ; le trigger SQL incrémente le compteur de chaque asset
+        self.client.table('downloads').insert([
+            {'user_id': user_id, 'asset_id': asset_id} for user_id, asset_id in downloads
+        ]).execute()
+
+    def increment_views(self, views):
+        # Incrément atomique côté base (views = views + n), un seul appel par lot
+        increments = [{'asset_id': asset_id, 'views': count} for asset_id, count in views.items()]
+        self.client.rpc('increment_asset_views', {'increments': increments}).execute()
+
+    def get_counters(self, names):
+        result = self.client.table('marketplace_counters').select('name,value').in_('name', list(names)).execute()
+        return {row['name']: row['value'] for row in result.data}
+
+    def events_after(self, source, last_id, limit):
+        weight = EVENT_TABLES[source]
+        columns = 'id,asset_id,created_at' + (f',{weight}' if weight else '')
+        rows = self.client.table(source).select(columns).gt('id', last_id).order('id').limit(limit).execute().data
+        return [{'id': row['id'], 'asset_id': row['asset_id'], 'created_at': row['created_at'],
+                 'count': row[weight] if weight else 1} for row in rows]
+
+    def get_watermarks(self):
+        rows = self.client.table('analytics_watermarks').select('source,last_id').execute().data
+        return {row['source']: row['last_id'] for row in rows}
+
+    def apply_analytics_chunk(self, source, previous_id, next_id, deltas):
+        return bool(self.client.rpc('apply_analytics_chunk', {
+            'source_name': source, 'previous_id': previous_id, 'next_id': next_id, 'deltas': list(deltas),
+        }).execute().data)
+
+    def iter_rollup(self, since_day, batch_size=1000):
+        # Pagination par plage sur la clé primaire : le cumul n'a pas d'id
+        offset = 0
+        while True:
+            rows = (
+                self.client.table('analytics_rollup')
+                .select(','.join(ROLLUP_COLUMNS))
+                .gte('day', since_day)
+                .order('day').order('event').order('category').order('asset_type').order('author').order('is_premium')
+                .range(offset, offset + batch_size - 1)
+                .execute()
+            ).data
+            yield from rows
+            if len(rows) < batch_size:
+                break
+            offset += batch_size
+
+
+SQLITE_SCHEMA = """
+create table if not exists users (
+    id integer primary key autoincrement,
+    username text not null unique,
+    created_at text not null default (utc_now())
+);
+
+create table if not exists assets (
+    id integer primary key autoincrement,
+    title text,
+    author text,
+    author_id integer,
+    description text,
+    category text,
+    asset_type text,
+    is_premium integer not null default 0,
+    price real not null default 0,
+    image_url text,
+    thumb_url text,
+    preview_url text,
+    tags text,
+    views integer not null default 0,
+    downloads integer not null default 0,
+    likes_count integer not null default 0,
+    popularity_score real not null default 0,
+    trending_score real not null default 0,
+    upload_date text not null default (utc_now()),
+    ahash integer,
+    dhash integer,
+    phash integer
+);
+create index if not exists assets_upload_date_id_idx on assets (upload_date desc, id desc);
+create index if not exists assets_popularity_id_idx on assets (popularity_score desc, id desc);
+create index if not exists assets_downloads_id_idx on assets (downloads desc, id desc);
+create index if not exists assets_trending_id_idx on assets (trending_score desc, id desc);
+
+create table if not exists likes (
+    id integer primary key autoincrement,
+    user_id integer not null,
+    asset_id integer not null,
+    created_at text not null default (utc_now()),
+    unique (user_id, asset_id)
+);
+
+create table if not exists downloads (
+    id integer primary key autoincrement,
+    user_id integer,
+    asset_id integer not null,
+    created_at text not null default (utc_now())
+);
+
+create table if not exists views (
+    id integer primary key autoincrement,
+    asset_id integer not null,
+    views integer not null,
+    created_at text not null default (utc_now())
+);
+
+-- Analytique (migrations/009)
+create table if not exists analytics_rollup (
+    day text not null,
+    event text not null,
+    category text not null default '',
+    asset_type text not null default '',
+    author text not null default '',
+    is_premium integer not null default 0,
+    count integer not null default 0,
+    primary key (day, event, category, asset_type, author, is_premium)
+);
+create table if not exists analytics_watermarks (
+    source text primary key,
+    last_id integer not null default 0,
+    updated_at text not null default (utc_now())
+);
+
+create table if not exists marketplace_counters (
+    name text primary key,
+    value integer not null default 0
+);
+insert or ignore into marketplace_counters (name, value) values
+    ('total_assets', 0), ('free_assets', 0), ('total_downloads', 0), ('active_users', 0);
+
+-- Compteurs (migrations/004)
+create trigger if not exists assets_counters_insert after insert on assets begin
+    update marketplace_counters set value = value + 1 where name = 'total_assets';
+    update marketplace_counters set value = value + 1 where name = 'free_assets' and not new.is_premium;
+    -- La mise en ligne compte comme un événement de tendance (migrations/007)
+    update assets set trending_score = log_add_exp(0, trending_event(1, new.upload_date)) where id = new.id;
+end;
+create trigger if not exists assets_counters_delete after delete on assets begin
+    update marketplace_counters set value = value - 1 where name = 'total_assets';
+    update marketplace_counters set value = value - 1 where name = 'free_assets' and not old.is_premium;
+end;
+create trigger if not exists assets_counters_premium after update of is_premium on assets
+when new.is_premium is not old.is_premium begin
+    update marketplace_counters set value = value + (case when new.is_premium then -1 else 1 end)
+    where name = 'free_assets';
+end;
+create trigger if not exists users_counter_insert after insert on users begin
+    update marketplace_counters set value = value + 1 where name = 'active_users';
+end;
+
+-- Téléchargements : compteur de l'asset, total et scores (migrations/004 et 007)
+create trigger if not exists downloads_insert after insert on downloads begin
+    update assets
+    set downloads = downloads + 1,
+        popularity_score = popularity_score + 5,
+        trending_score = log_add_exp(trending_score, trending_event(5, new.created_at))
+    where id = new.asset_id;
+    update marketplace_counters set value = value + 1 where name = 'total_downloads';
+end;
+
+-- Likes (migrations/007)
+create trigger if not exists likes_insert after insert on likes begin
+    update assets
+    set likes_count = likes_count + 1,
+        popularity_score = popularity_score + 3,
+        trending_score = log_add_exp(trending_score, trending_event(3, new.created_at))
+    where id = new.asset_id;
+end;
+create trigger if not exists likes_delete after delete on likes begin
+    update assets
+    set likes_count = max(likes_count - 1, 0),
+        popularity_score = popularity_score - 3
+    where id = old.asset_id;
+end;
+"""
+
+
+class SQLiteRepository(Repository):
+    def __init__(self, path=":memory:"):
+        # Une connexion partagée par les sessions et le thread de l'agrégateur, sérialisée par un verrou
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.create_function("utc_now", 0, utc_now)
+        self.conn.create_function("trending_event", 2, trending_event, deterministic=True)
+        self.conn.create_function("log_add_exp", 2, log_add_exp, deterministic=True)
+        if path != ":memory:":
+            self.conn.execute("pragma journal_mode = wal")
+        self.conn.executescript(SQLITE_SCHEMA)
+        self._add_missing_columns()
+        self.search = MemorySearch(self.get_assets, self.iter_assets(SEARCH_DOCUMENT_COLUMNS))
+
+    def _add_missing_columns(self):
+        # Bases créées avant l'ajout d'une colonne (create table if not exists ne la crée pas)
+        existing = {row['name'] for row in self.conn.execute("pragma table_info(assets)")}
+        for name in ('ahash', 'dhash', 'phash'):
+            if name not in existing:
+                self.conn.execute(f"alter table assets add column {name} integer")
+
+    def _columns(self, columns):
+        if columns == '*':
+            return ', '.join(ASSET_COLUMNS)
+        names = [name.strip() for name in columns.split(',')]
+        unknown = set(names) - set(ASSET_COLUMNS)
+        if unknown:
+            raise ValueError(f"Colonnes inconnues: {', '.join(sorted(unknown))}")
+        return ', '.join(names)
+
+    def _rows(self, sql, params=()):
+        with self._lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        result = []
+        for row in rows:
+            row = dict(row)
+            if 'is_premium' in row:
+                row['is_premium'] = bool(row['is_premium'])
+            result.append(row)
+        return result
+
+    def _filter(self, category, asset_type, premium_only):
+        clauses, params = [], []
+        if category != "Tous":
+            clauses.append("category = ?")
+            params.append(category)
+        if asset_type != "Tous":
+            clauses.append("asset_type = ?")
+            params.append(asset_type)
+        if premium_only:
+            clauses.append("is_premium")
+        return clauses, params
+
+    def get_or_create_user(self, username):
+        with self._lock:
+            self.conn.execute("insert or ignore into users (username) values (?)", (username,))
+            return self.conn.execute("select id from users where username = ?", (username,)).fetchone()[0]
+
+    def insert_assets(self, rows):
+        inserted = []
+        with self._lock:
+            self.conn.execute("begin")
+            try:
+                for data in rows:
+                    names = [name for name in data if name in ASSET_COLUMNS and name != 'id']
+                    cursor = self.conn.execute(
+                        f"insert into assets ({', '.join(names)}) values ({', '.join('?' * len(names))})",
+                        [data[name] for name in names],
+                    )
+                    inserted.append(cursor.lastrowid)
+                self.conn.execute("commit")
+            except Exception:
+                self.conn.execute("rollback")
+                raise
+        result = self.get_assets(inserted)
+        for row in result:
+            self.search.add(row)
+        return result
+
+    def list_assets(self, category="Tous", asset_type="Tous", premium_only=False,
+                    sort_column='upload_date', cursor=None, limit=24, columns='*'):
+        if sort_column not in SORTABLE_COLUMNS:
+            raise ValueError(f"Tri inconnu: {sort_column}")
+        clauses, params = self._filter(category, asset_type, premium_only)
+        if cursor:
+            value, asset_id = cursor
+            clauses.append(f"({sort_column} < ? or ({sort_column} = ? and id < ?))")
+            params += [value, value, asset_id]
+        where = f"where {' and '.join(clauses)}" if clauses else ""
+        return self._rows(
+            f"select {self._columns(columns)} from assets {where} "
+            f"order by {sort_column} desc, id desc limit ?",
+            params + [limit],
+        )
+
+    def count_assets(self, category="Tous", asset_type="Tous", premium_only=False):
+        clauses, params = self._filter(category, asset_type, premium_only)
+        where = f"where {' and '.join(clauses)}" if clauses else ""
+        with self._lock:
+            return self.conn.execute(f"select count(*) from assets {where}", params).fetchone()[0]
+
+    def get_assets(self, asset_ids, columns='*'):
+        asset_ids = list(asset_ids)
+        if not asset_ids:
+            return []
+        return self._rows(
+            f"select {self._columns(columns)} from assets where id in ({', '.join('?' * len(asset_ids))})",
+            asset_ids,
+        )
+
+    def _assets_after(self, last_id, columns, limit):
+        return self._rows(
+            f"select {self._columns(columns)} from assets where id > ? order by id limit ?",
+            (last_id, limit),
+        )
+
+    def liked_ids(self, user_id, asset_ids):
+        asset_ids = list(asset_ids)
+        if not asset_ids:
+            return set()
+        rows = self._rows(
+            f"select asset_id from likes where user_id = ? and asset_id in ({', '.join('?' * len(asset_ids))})",
+            [user_id] + asset_ids,
+        )
+        return {row['asset_id'] for row in rows}
+
+    def set_like(self, user_id, asset_id, liked):
+        with self._lock:
+            if liked:
+                self.conn.execute("insert or ignore into likes (user_id, asset_id) values (?, ?)", (user_id, asset_id))
+            else:
+                self.conn.execute("delete from likes where user_id = ? and asset_id = ?", (user_id, asset_id))
+
+    def record_downloads(self, downloads):
+        with self._lock:
+            self.conn.execute("begin")
+            try:
+                self.conn.executemany("insert into downloads (user_id, asset_id) values (?, ?)", list(downloads))
+                self.conn.execute("commit")
+            except Exception:
+                self.conn.execute("rollback")
+                raise
+
+    def increment_views(self, views):
+        now = utc_now()
+        with self._lock:
+            self.conn.execute("begin")
+            try:
+                self.conn.executemany(
+                    "update assets set views = views + ?, popularity_score = popularity_score + ?, "
+                    "trending_score = log_add_exp(trending_score, trending_event(?, ?)) where id = ?",
+                    [(count, count, count, now, asset_id) for asset_id, count in views.items()],
+                )
+                self.conn.executemany(
+                    "insert into views (asset_id, views, created_at) values (?, ?, ?)",
+                    [(asset_id, count, now) for asset_id, count in views.items()],
+                )
+                self.conn.execute("commit")
+            except Exception:
+                self.conn.execute("rollback")
+                raise
+
+    def get_counters(self, names):
+        names = list(names)
+        rows = self._rows(
+            f"select name, value from marketplace_counters where name in ({', '.join('?' * len(names))})",
+            names,
+        )
+        return {row['name']: row['value'] for row in rows}
+
+    def events_after(self, source, last_id, limit):
+        weight = EVENT_TABLES[source] or '1'
+        return self._rows(
+            f"select id, asset_id, created_at, {weight} as count from {source} where id > ? order by id limit ?",
+            (last_id, limit),
+        )
+
+    def get_watermarks(self):
+        return {row['source']: row['last_id'] for row in self._rows("select source, last_id from analytics_watermarks")}
+
+    def apply_analytics_chunk(self, source, previous_id, next_id, deltas):
+        with self._lock:
+            self.conn.execute("begin immediate")
+            try:
+                self.conn.execute("insert or ignore into analytics_watermarks (source, last_id) values (?, 0)", (source,))
+                updated = self.conn.execute(
+                    "update analytics_watermarks set last_id = ?, updated_at = utc_now() where source = ? and last_id = ?",
+                    (next_id, source, previous_id),
+                ).rowcount
+                if updated:
+                    self.conn.executemany(
+                        "insert into analytics_rollup (day, event, category, asset_type, author, is_premium, count) "
+                        "values (?, ?, ?, ?, ?, ?, ?) "
+                        "on conflict (day, event, category, asset_type, author, is_premium) "
+                        "do update set count = count + excluded.count",
+                        [(d['day'], source, d['category'], d['asset_type'], d['author'], d['is_premium'], d['count'])
+                         for d in deltas],
+                    )
+                self.conn.execute("commit")
+            except Exception:
+                self.conn.execute("rollback")
+                raise
+        return bool(updated)
+
+    def iter_rollup(self, since_day, batch_size=1000):
+        yield from self._rows(
+            f"select {', '.join(ROLLUP_COLUMNS)} from analytics_rollup where day >= ? order by day",
+            (since_day,),
+        )
+
+
+def make_repository(backend, client=None, path=":memory:", search_backend="postgres"):
+    if backend == "sqlite":
+        return SQLiteRepository(path)
+    if backend == "supabase":
+        if client is None:
+            raise ValueError("Le backend Supabase nécessite un client")
+        return SupabaseRepository(client, search_backend)
+    raise ValueError(f"Backend de données inconnu: {backend}")
@@ -0,0 +1,250 @@
+import functools
+import random
+import sqlite3
+import threading
+import time
+
+# ==================== RÉSILIENCE DU BACKEND ====================
+# Couche partagée par toutes les sessions du processus, autour du Repository :
+#   - concurrence bornée : au plus `max_concurrent` appels en vol vers la base ;
+#   - lectures (idempotentes) retentées avec un délai exponentiel à gigue complète,
+#     tant que le délai total `deadline` n'est pas écoulé ;
+#   - disjoncteur : après `failure_threshold` échecs transitoires d'affilée, plus
+#     aucun appel pendant `reset_timeout` secondes, puis un seul appel d'essai.
+# Les écritures ne sont jamais retentées ici (un like ou une insertion rejoués en
+# double) ; elles échouent tout de suite quand le disjoncteur est ouvert.
+
+READ_METHODS = frozenset({
+    'list_assets', 'count_assets', 'get_assets', 'search_assets', 'count_search_assets',
+    'liked_ids', 'get_counters', 'events_after', 'get_watermarks',
+})
+WRITE_METHODS = frozenset({
+    'get_or_create_user', 'insert_asset', 'insert_assets', 'set_like', 'record_downloads', 'increment_views',
+    'apply_analytics_chunk',
+})
+
+# Codes Postgres (via PostgREST) d'une erreur passagère : connexion (08xxx), requête
+# annulée par statement_timeout, conflit de sérialisation, interblocage, trop de connexions
+TRANSIENT_PG_CODES = {'57014', '40001', '40P01', '53300', '57P01', '57P03'}
+# Codes propres à PostgREST : base injoignable, erreur de connexion, cache de schéma
+# pas encore chargé, délai d'attente du pool de connexions dépassé
+TRANSIENT_PGRST_CODES = {'PGRST000', 'PGRST001', 'PGRST002', 'PGRST003'}
+
+
+class BackendUnavailable(Exception):
+    """Appel refusé sans contacter la base (disjoncteur ouvert ou trop d'appels en vol)."""
+
+
+class CircuitOpen(BackendUnavailable):
+    def __init__(self, retry_in):
+        self.retry_in = retry_in
+        super().__init__(f"base indisponible, nouvel essai dans {retry_in:.0f} s")
+
+
+class Overloaded(BackendUnavailable):
+    def __init__(self):
+        super().__init__("trop d'appels en cours vers la base")
+
+
+def is_transient(error):
+    """Vrai si l'erreur tient à l'état du backend (réseau, délai, surcharge) plutôt qu'à la requête."""
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    if isinstance(error, sqlite3.OperationalError):
+        # "database is locked" : un autre processus écrit
+        return "locked" in str(error) or "busy" in str(error)
+    # Exceptions httpx (réseau, délai) et postgrest.APIError, reconnues sans les importer
+    module = type(error).__module__.split('.')[0]
+    status = getattr(getattr(error, 'response', None), 'status_code', None)
+    if status is not None:
+        return status == 429 or status >= 500
+    if module in ('httpx', 'httpcore'):
+        return True
+    code = getattr(error, 'code', None)
+    if module != 'postgrest':
+        return False
+    # Réponse non JSON (page d'erreur d'une passerelle) : postgrest y met le statut HTTP
+    if isinstance(code, int):
+        return code == 429 or code >= 500
+    if isinstance(code, str):
+        return code in TRANSIENT_PG_CODES or code in TRANSIENT_PGRST_CODES or code.startswith('08')
+    return False
+
+
+def is_row_error(error):
+    """Vrai si la base a refusé les données elles-mêmes (valeur invalide, contrainte violée).
+
+    Seules ces erreurs justifient d'écarter des lignes : réessayer le même lot
+    échouerait de la même façon, quel que soit l'état du backend.
+    """
+    if isinstance(error, (sqlite3.IntegrityError, sqlite3.DataError)):
+        return True
+    # SQLSTATE classe 22 (donnée invalide) ou 23 (contrainte d'intégrité), via PostgREST
+    code = getattr(error, 'code', None)
+    return (type(error).__module__.split('.')[0] == 'postgrest' and isinstance(code, str)
+            and len(code) == 5 and code[:2] in ('22', '23'))
+
+
+class CircuitBreaker:
+    CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0  # échecs transitoires consécutifs
+        self._opened_at = 0.0
+        self._probing = False  # un appel d'essai est en cours (demi-ouvert)
+        self.opens = 0
+        self.rejected = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == self.OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._probing = False
+        return self._state
+
+    def allow(self):
+        """Lève CircuitOpen si l'appel ne doit pas partir ; en demi-ouvert, un seul appel passe."""
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return
+            if state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            self.rejected += 1
+            retry_in = max(0.0, self.reset_timeout - (self._clock() - self._opened_at))
+        raise CircuitOpen(retry_in)
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self.opens += 1
+                self._state = self.OPEN
+                self._opened_at = self._clock()
+                self._probing = False
+
+    def release(self):
+        # Appel d'essai terminé sans verdict (erreur non transitoire) : un autre pourra essayer
+        with self._lock:
+            self._probing = False
+
+    def stats(self):
+        with self._lock:
+            state = self._current_state()
+            return {
+                'open': 1 if state == self.OPEN else 0,
+                'half_open': 1 if state == self.HALF_OPEN else 0,
+                'consecutive_failures': self._failures,
+                'opens': self.opens,
+                'rejected': self.rejected,
+            }
+
+
+def backoff_delays(attempts, base_delay=0.1, max_delay=1.0, rng=random.random):
+    # « Full jitter » : délai uniforme dans [0, min(plafond, base * 2^n)], pour que les
+    # sessions qui échouent ensemble ne reviennent pas ensemble
+    return [rng() * min(max_delay, base_delay * 2 ** n) for n in range(attempts - 1)]
+
+
+class ResilientRepository:
+    """Proxy du Repository : concurrence bornée, reprises des lectures et disjoncteur.
+
+    Les méthodes absentes de READ_METHODS et WRITE_METHODS (générateurs comme
+    iter_assets, attributs) sont transmises telles quelles.
+
+    Aucune tentative (ni attente d'une place) ne commence plus de `deadline` secondes
+    après l'appel : un appel dure au plus `deadline` plus le délai d'une requête.
+    """
+
+    def __init__(self, inner, breaker=None, max_concurrent=16, acquire_timeout=5.0,
+                 attempts=3, base_delay=0.1, max_delay=1.0, deadline=None,
+                 sleep=time.sleep, clock=time.monotonic):
+        self._inner = inner
+        self.breaker = breaker or CircuitBreaker()
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._acquire_timeout = acquire_timeout
+        self._attempts = attempts
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._deadline = deadline
+        self._sleep = sleep
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.retries = 0
+        self.overloaded = 0
+        self.in_flight = 0
+
+    def __getattr__(self, name):
+        attr = getattr(self._inner, name)
+        if name not in READ_METHODS and name not in WRITE_METHODS:
+            return attr
+        attempts = self._attempts if name in READ_METHODS else 1
+
+        @functools.wraps(attr)
+        def call(*args, **kwargs):
+            delays = backoff_delays(attempts, self._base_delay, self._max_delay)
+            deadline = None if self._deadline is None else self._clock() + self._deadline
+            while True:
+                try:
+                    return self._call_once(attr, args, kwargs, deadline)
+                except BackendUnavailable:
+                    raise
+                except Exception as e:
+                    # Pas de nouvelle tentative qui commencerait après l'échéance
+                    if not delays or not is_transient(e) or (
+                            deadline is not None and self._clock() + delays[0] >= deadline):
+                        raise
+                with self._lock:
+                    self.retries += 1
+                self._sleep(delays.pop(0))
+        return call
+
+    def _call_once(self, attr, args, kwargs, deadline=None):
+        self.breaker.allow()
+        timeout = self._acquire_timeout
+        if deadline is not None:
+            timeout = max(0.0, min(timeout, deadline - self._clock()))
+        if not self._slots.acquire(timeout=timeout):
+            # Le disjoncteur nous a peut-être laissé passer comme appel d'essai
+            self.breaker.release()
+            with self._lock:
+                self.overloaded += 1
+            raise Overloaded()
+        with self._lock:
+            self.in_flight += 1
+        try:
+            result = attr(*args, **kwargs)
+        except Exception as e:
+            if is_transient(e):
+                self.breaker.record_failure()
+            else:
+                self.breaker.release()
+            raise
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._slots.release()
+        self.breaker.record_success()
+        return result
+
+    def stats(self):
+        with self._lock:
+            stats = {'retries': self.retries, 'overloaded': self.overloaded, 'in_flight': self.in_flight}
+        return {**stats, **self.breaker.stats()}
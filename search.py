@@ -0,0 +1,222 @@
+import bisect
+import math
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+
+# ==================== RECHERCHE ====================
+# Deux moteurs avec la même interface :
+#   - PostgresSearch : plein texte + trigrammes indexés (migrations/006)
+#   - MemorySearch   : index inversé en mémoire, pour le local et les tests
+# Les deux partagent la normalisation ci-dessous pour donner les mêmes résultats.
+
+STOPWORDS = {
+    "a", "au", "aux", "avec", "ce", "ces", "dans", "de", "des", "du", "en", "et", "la", "le",
+    "les", "l", "d", "un", "une", "ou", "par", "pour", "sur", "the", "of", "and",
+}
+
+# Poids des champs : une étiquette qui correspond compte plus qu'un mot du titre
+FIELD_WEIGHTS = {"tags": 3.0, "title": 2.0, "author": 1.0}
+EXACT_TAG_BONUS = 2.0
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Lettres que NFKD ne décompose pas, remplacées comme le fait unaccent côté Postgres
+_LIGATURES = str.maketrans({"œ": "oe", "æ": "ae", "ß": "ss", "ø": "o", "ł": "l", "đ": "d"})
+
+
+def fold(text):
+    # "Été à Montréal" -> "ete a montreal", "Œuvre" -> "oeuvre"
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower().translate(_LIGATURES)
+
+
+def tokenize(text):
+    return [t for t in _TOKEN_RE.findall(fold(text)) if t not in STOPWORDS]
+
+
+def split_tags(tags):
+    # Chaque étiquette normalisée comme une requête, pour la comparer telle quelle
+    return [" ".join(tokenize(tag)) for tag in (tags or "").split(",") if tokenize(tag)]
+
+
+def to_tsquery(tokens):
+    # Les jetons ne contiennent que [a-z0-9] : aucun caractère spécial à échapper.
+    # Le dernier mot est traité comme un préfixe (recherche pendant la frappe).
+    if not tokens:
+        return ""
+    return " & ".join(tokens[:-1] + [tokens[-1] + ":*"])
+
+
+def _matches_filters(doc, category, asset_type, premium_only):
+    if category != "Tous" and doc["category"] != category:
+        return False
+    if asset_type != "Tous" and doc["asset_type"] != asset_type:
+        return False
+    if premium_only and not doc["is_premium"]:
+        return False
+    return True
+
+
+class PostgresSearch:
+    """Délègue à la fonction SQL search_assets (tsvector + pg_trgm, classement ts_rank)."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def add(self, asset):
+        # Les colonnes générées et index GIN suivent les écritures d'elles-mêmes
+        pass
+
+    def remove(self, asset_id):
+        pass
+
+    def _params(self, query, category, asset_type, premium_only):
+        tokens = tokenize(query)
+        return {
+            "q_tsquery": to_tsquery(tokens),
+            "q_text": " ".join(tokens),
+            "p_category": None if category == "Tous" else category,
+            "p_asset_type": None if asset_type == "Tous" else asset_type,
+            "p_premium_only": premium_only,
+        }
+
+    def search(self, query, category="Tous", asset_type="Tous", premium_only=False, offset=0, limit=24, columns="*"):
+        params = self._params(query, category, asset_type, premium_only)
+        if not params["q_text"]:
+            return []
+        params.update({"p_offset": offset, "p_limit": limit})
+        return self.client.rpc("search_assets", params).select(columns).execute().data
+
+    def count(self, query, category="Tous", asset_type="Tous", premium_only=False):
+        params = self._params(query, category, asset_type, premium_only)
+        if not params["q_text"]:
+            return 0
+        return self.client.rpc("count_search_assets", params).execute().data or 0
+
+
+class InvertedIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings = defaultdict(dict)  # terme -> {asset_id: poids}
+        self._docs = {}  # asset_id -> champs filtrables + termes indexés
+        self._sorted_terms = None
+
+    def __len__(self):
+        return len(self._docs)
+
+    def add(self, asset):
+        weights = defaultdict(float)
+        for field, weight in FIELD_WEIGHTS.items():
+            for token in tokenize(asset.get(field)):
+                weights[token] += weight
+        with self._lock:
+            self.remove(asset["id"])
+            for term, weight in weights.items():
+                self._postings[term][asset["id"]] = weight
+            self._docs[asset["id"]] = {
+                "category": asset.get("category"),
+                "asset_type": asset.get("asset_type"),
+                "is_premium": bool(asset.get("is_premium")),
+                "tags": set(split_tags(asset.get("tags"))),
+                "terms": set(weights),
+            }
+            self._sorted_terms = None
+
+    def remove(self, asset_id):
+        with self._lock:
+            doc = self._docs.pop(asset_id, None)
+            if doc is None:
+                return
+            for term in doc["terms"]:
+                postings = self._postings[term]
+                postings.pop(asset_id, None)
+                if not postings:
+                    del self._postings[term]
+            self._sorted_terms = None
+
+    def _expand_prefix(self, prefix):
+        if self._sorted_terms is None:
+            self._sorted_terms = sorted(self._postings)
+        start = bisect.bisect_left(self._sorted_terms, prefix)
+        terms = []
+        for term in self._sorted_terms[start:]:
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+        return terms
+
+    def search(self, query, category="Tous", asset_type="Tous", premium_only=False):
+        """Renvoie les asset_id triés par pertinence décroissante (puis plus récent d'abord)."""
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        folded_query = " ".join(tokens)
+        with self._lock:
+            total = len(self._docs) or 1
+            scores = None
+            for position, token in enumerate(tokens):
+                # Tous les mots doivent correspondre ; le dernier peut n'être qu'un préfixe
+                terms = self._expand_prefix(token) if position == len(tokens) - 1 else [token]
+                token_scores = defaultdict(float)
+                for term in terms:
+                    postings = self._postings.get(term, {})
+                    idf = math.log(1 + total / len(postings)) if postings else 0.0
+                    # Un préfixe compte un peu moins qu'un mot complet
+                    factor = 1.0 if term == token else 0.7
+                    for asset_id, weight in postings.items():
+                        token_scores[asset_id] = max(token_scores[asset_id], factor * idf * weight / (weight + 1.0))
+                if scores is None:
+                    scores = dict(token_scores)
+                else:
+                    scores = {a: s + token_scores[a] for a, s in scores.items() if a in token_scores}
+                if not scores:
+                    return []
+            ranked = []
+            for asset_id, score in scores.items():
+                doc = self._docs[asset_id]
+                if not _matches_filters(doc, category, asset_type, premium_only):
+                    continue
+                if folded_query in doc["tags"]:
+                    score += EXACT_TAG_BONUS
+                ranked.append((score, asset_id))
+        ranked.sort(key=lambda item: (-item[0], -item[1]))
+        return [asset_id for _, asset_id in ranked]
+
+
+class MemorySearch:
+    """Index inversé en mémoire ; `fetch_rows(ids, columns)` charge les lignes d'une page."""
+
+    def __init__(self, fetch_rows, assets=()):
+        self.fetch_rows = fetch_rows
+        self.index = InvertedIndex()
+        for asset in assets:
+            self.index.add(asset)
+
+    def add(self, asset):
+        self.index.add(asset)
+
+    def remove(self, asset_id):
+        self.index.remove(asset_id)
+
+    def search(self, query, category="Tous", asset_type="Tous", premium_only=False, offset=0, limit=24, columns="*"):
+        ids = self.index.search(query, category, asset_type, premium_only)[offset:offset + limit]
+        if not ids:
+            return []
+        rows = {row["id"]: row for row in self.fetch_rows(ids, columns)}
+        return [rows[asset_id] for asset_id in ids if asset_id in rows]
+
+    def count(self, query, category="Tous", asset_type="Tous", premium_only=False):
+        return len(self.index.search(query, category, asset_type, premium_only))
+
+
+def matches_query(asset, query):
+    # Même règle que l'index : tous les mots présents, le dernier éventuellement en préfixe
+    tokens = tokenize(query)
+    if not tokens:
+        return True
+    terms = set()
+    for field in FIELD_WEIGHTS:
+        terms.update(tokenize(asset.get(field)))
+    return all(token in terms for token in tokens[:-1]) and any(term.startswith(tokens[-1]) for term in terms)
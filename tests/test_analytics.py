@@ -0,0 +1,87 @@
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from analytics import RollupRefresher, since_day, summarize
+from repository import SQLiteRepository
+
+NOW = datetime(2025, 3, 10, 12, 0, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def repo():
+    repo = SQLiteRepository()
+    repo.insert_assets([
+        {'title': "Forêt", 'author': "Marie", 'category': "Nature", 'asset_type': "Photo", 'is_premium': False},
+        {'title': "Logo", 'author': "Paul", 'category': "Business", 'asset_type': "Vecteur", 'is_premium': True},
+    ])
+    return repo
+
+
+def add_downloads(repo, *events):
+    # (asset_id, il y a combien de minutes)
+    repo.conn.executemany(
+        "insert into downloads (user_id, asset_id, created_at) values (1, ?, ?)",
+        [(asset_id, (NOW - timedelta(minutes=minutes)).isoformat()) for asset_id, minutes in events],
+    )
+
+
+def refresher(repo, **options):
+    return RollupRefresher(repo, min_interval=0, now=lambda: NOW, **options)
+
+
+def rollup_total(repo, event):
+    return sum(row['count'] for row in repo.iter_rollup('0000-00-00') if row['event'] == event)
+
+
+def test_refresh_only_reads_new_events(repo):
+    add_downloads(repo, (1, 90), (1, 80), (2, 70))
+    assert refresher(repo).refresh()['downloads'] == 3
+    add_downloads(repo, (2, 10))
+    assert refresher(repo).refresh() == {'downloads': 1, 'likes': 0, 'views': 0}
+    assert rollup_total(repo, 'downloads') == 4
+    assert repo.get_watermarks()['downloads'] == 4
+
+
+def test_chunks_and_catch_up(repo):
+    add_downloads(repo, *[(1, 100)] * 7)
+    slow = refresher(repo, chunk_size=2, max_chunks=2)
+    assert slow.refresh()['downloads'] == 4 and not slow.caught_up
+    assert slow.refresh()['downloads'] == 3 and slow.caught_up
+    assert rollup_total(repo, 'downloads') == 7
+
+
+def test_compare_and_set_rejects_a_stale_watermark(repo):
+    add_downloads(repo, (1, 90))
+    refresher(repo).refresh()
+    assert not repo.apply_analytics_chunk('downloads', 0, 1, [
+        {'day': '2025-03-10', 'category': 'Nature', 'asset_type': 'Photo', 'author': 'Marie', 'is_premium': False,
+         'count': 1}])
+    assert rollup_total(repo, 'downloads') == 1
+
+
+def test_recent_events_wait_for_the_safety_lag(repo):
+    # L'id 2 est trop récent : l'id 3, plus ancien, attend aussi pour ne jamais sauter un id
+    add_downloads(repo, (1, 90), (1, 0), (2, 90))
+    assert refresher(repo).refresh()['downloads'] == 1
+    assert repo.get_watermarks()['downloads'] == 1
+    later = RollupRefresher(repo, min_interval=0, now=lambda: NOW + timedelta(minutes=5))
+    assert later.refresh()['downloads'] == 2
+    assert rollup_total(repo, 'downloads') == 3
+
+
+def test_views_are_weighted_and_summarized(repo):
+    add_downloads(repo, (1, 90), (2, 90))
+    repo.increment_views(Counter({1: 4, 2: 2}))
+    RollupRefresher(repo, min_interval=0, now=lambda: datetime.now(timezone.utc) + timedelta(hours=1)).refresh()
+    summary = summarize(repo.iter_rollup('0000-00-00'))
+    free, premium = summary['conversion']
+    assert (free['downloads'], free['views'], free['téléchargements / vue']) == (1, 4, 25.0)
+    assert (premium['downloads'], premium['views'], premium['téléchargements / vue']) == (1, 2, 50.0)
+    assert {row['catégorie'] for row in summary['categories']} == {"Nature", "Business"}
+    assert summary['authors'][0]['downloads'] == 1
+
+
+def test_since_day_counts_today():
+    assert since_day(7, today=NOW.date()) == '2025-03-04'
@@ -0,0 +1,40 @@
+import os
+import threading
+
+from blob_store import BLOB_PREFIX, LocalBlobStore, blob_key, content_type_for
+
+
+def test_put_is_content_addressed(tmp_path):
+    store = LocalBlobStore(str(tmp_path))
+    ref = store.put(b"octets", "JPG")
+    assert ref == BLOB_PREFIX + blob_key(b"octets", "jpg") and ref.endswith(".jpg")
+    assert store.put(b"octets", "jpg") == ref
+    assert store.get(ref) == b"octets"
+    assert content_type_for(ref) == "image/jpeg"
+
+
+def test_concurrent_writes_of_the_same_content(tmp_path):
+    store = LocalBlobStore(str(tmp_path))
+    data = os.urandom(2 * 1024 * 1024)
+    key = blob_key(data, "png")
+    errors = []
+    start = threading.Barrier(8)
+
+    def write():
+        start.wait()
+        try:
+            for _ in range(5):
+                # Sans passer par exists() : toutes les écritures se chevauchent
+                store._write(key, data)
+                assert store.get(BLOB_PREFIX + key) == data
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    # Aucun fichier temporaire laissé à côté du blob
+    assert os.listdir(os.path.dirname(store._path(key))) == [os.path.basename(store._path(key))]
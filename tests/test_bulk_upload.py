@@ -0,0 +1,94 @@
+import io
+import zipfile
+
+import pytest
+
+import bulk_upload
+from bulk_upload import asset_row, collect_images, import_images, read_metadata
+
+CATEGORIES = ["Nature", "Technologie", "Architecture"]
+TYPES = ["Photo", "Vecteur", "Icône"]
+DEFAULTS = {'author': "Studio", 'category': "Nature", 'asset_type': "Photo", 'tags': "", 'is_premium': False, 'price': 0.0}
+
+
+def make_zip(members):
+    buffered = io.BytesIO()
+    with zipfile.ZipFile(buffered, "w") as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return buffered.getvalue()
+
+
+def test_collect_images_reads_archive_members_lazily():
+    archive = make_zip({
+        "photos/": b"", "photos/a.JPG": b"aaa", "photos/b.png": b"bb",
+        "notes.txt": b"...", "__MACOSX/photos/._a.JPG": b"", "photos/.DS_Store": b"",
+    })
+    images, errors = collect_images([("lot.zip", archive), ("c.jpeg", b"c"), ("d.gif", b"d"), ("cassé.zip", b"pas un zip")])
+    assert [name for name, _ in images] == ["photos/a.JPG", "photos/b.png", "c.jpeg"]
+    assert [read() for _, read in images] == [b"aaa", b"bb", b"c"]
+    assert errors == [("lot.zip/notes.txt", "extension non supportée"), ("d.gif", "extension non supportée"),
+                      ("cassé.zip", "archive ZIP illisible")]
+
+
+def test_collect_images_size_caps(monkeypatch):
+    monkeypatch.setattr(bulk_upload, "MAX_IMAGE_BYTES", 10)
+    monkeypatch.setattr(bulk_upload, "MAX_ARCHIVE_BYTES", 15)
+    archive = make_zip({"a.jpg": b"x" * 8, "grande.jpg": b"x" * 11, "b.jpg": b"x" * 8, "c.jpg": b"x"})
+    images, errors = collect_images([("lot.zip", archive)])
+    assert [name for name, _ in images] == ["a.jpg"]
+    assert errors == [("lot.zip/grande.jpg", "image trop volumineuse une fois décompressée"),
+                      ("lot.zip", "archive trop volumineuse une fois décompressée")]
+
+
+def test_collect_images_file_limit(monkeypatch):
+    monkeypatch.setattr(bulk_upload, "MAX_FILES", 2)
+    images, errors = collect_images([(f"{i}.png", b"") for i in range(3)])
+    assert [name for name, _ in images] == ["0.png", "1.png"]
+    assert errors == [("2.png", "au-delà de 2 images par import")]
+
+
+def test_read_metadata_sniffs_separator_and_french_headers():
+    data = "﻿Fichier;Titre;Catégorie;Prix\nphotos/Plage.JPG;Plage d'été;nature;4,50\n;sans fichier;;\n".encode("utf-8")
+    assert read_metadata(data) == {"plage.jpg": {'title': "Plage d'été", 'category': "nature", 'price': "4,50"}}
+    data = b"filename,author,colonne inconnue\na.png,Marie,ignoree\n"
+    assert read_metadata(data) == {"a.png": {'author': "Marie"}}
+
+
+def test_read_metadata_requires_filename():
+    with pytest.raises(ValueError, match="filename"):
+        read_metadata(b"title,author\nPlage,Marie\n")
+
+
+def test_asset_row_matches_choices_without_accents_or_case():
+    row = asset_row("dossier/coucher_de-soleil.jpg",
+                    {'category': "TECHNOLOGIE", 'asset_type': "icone", 'is_premium': "Oui", 'price': "12,5"},
+                    DEFAULTS, CATEGORIES, TYPES)
+    assert row['title'] == "coucher de soleil"
+    assert (row['category'], row['asset_type'], row['is_premium'], row['price']) == ("Technologie", "Icône", True, 12.5)
+    # Les cellules vides du CSV laissent place aux valeurs par défaut
+    row = asset_row("a.png", {'title': "Titre", 'author': "", 'category': ""}, DEFAULTS, CATEGORIES, TYPES)
+    assert (row['title'], row['author'], row['category'], row['price']) == ("Titre", "Studio", "Nature", 0.0)
+
+
+@pytest.mark.parametrize("meta, error", [
+    ({'author': ""}, "auteur manquant"),
+    ({'category': "Cuisine"}, "catégorie inconnue : Cuisine"),
+    ({'asset_type': "GIF"}, "type inconnu : GIF"),
+    ({'price': "gratuit"}, "prix invalide : gratuit"),
+    ({'price': "-1"}, "prix invalide : -1.0"),
+])
+def test_asset_row_rejections(meta, error):
+    defaults = {**DEFAULTS, 'author': ""} if 'author' in meta else DEFAULTS
+    with pytest.raises(ValueError, match=error):
+        asset_row("a.png", meta, defaults, CATEGORIES, TYPES)
+
+
+def test_metadata_rows_without_upload_are_reported():
+    metadata = {"a.png": {'author': ""}, "absente.jpg": {'title': "Absente"}}
+    images = [("dossier/A.png", lambda: pytest.fail("image sans métadonnées valides lue"))]
+    inserted, errors = import_images(images, metadata, {**DEFAULTS, 'author': ""}, CATEGORIES, TYPES,
+                                     store=None, insert_rows=None, pool=None)
+    assert inserted == []
+    assert errors == [("dossier/A.png", "auteur manquant"),
+                      ("absente.jpg", "présent dans le CSV mais absent de l'envoi")]
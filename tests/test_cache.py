@@ -0,0 +1,81 @@
+from cache import MISS, ImageCache, LastGoodCache, QueryCache
+
+
+def test_get_or_compute_caches_until_ttl(clock):
+    cache = QueryCache(ttl=10, clock=clock)
+    calls = []
+    compute = lambda: calls.append(1) or len(calls)
+    assert cache.get_or_compute('k', compute) == 1
+    assert cache.get_or_compute('k', compute) == 1
+    clock.now = 10
+    assert cache.get_or_compute('k', compute) == 2
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 2
+
+
+def test_lru_eviction():
+    cache = QueryCache(max_entries=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)
+    assert cache.get('b') is MISS
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    assert cache.stats()['evictions'] == 1
+
+
+def test_invalidate_tags_drops_only_tagged_entries():
+    cache = QueryCache()
+    cache.put('page1', [1, 2], tags=[('asset', 1), ('asset', 2)])
+    cache.put('page2', [3], tags=[('asset', 3)])
+    assert cache.invalidate_tags({('asset', 2)}) == 1
+    assert cache.get('page1') is MISS
+    assert cache.get('page2') == [3]
+    assert cache.keys_tagged(('asset', 1)) == set()
+    # Les étiquettes d'une entrée remplacée ne survivent pas
+    cache.put('page2', [4], tags=[('asset', 4)])
+    assert cache.invalidate_tags({('asset', 3)}) == 0
+    assert cache.get('page2') == [4]
+
+
+def test_tags_can_be_computed_from_the_value():
+    cache = QueryCache()
+    cache.get_or_compute('page', lambda: ([{'id': 7}], None), tags=lambda page: [('asset', row['id']) for row in page[0]])
+    assert cache.keys_tagged(('asset', 7)) == {'page'}
+
+
+def test_invalidate_where_reaches_pages_without_the_asset():
+    # Comme app.invalidate_asset_event : un téléchargement peut faire entrer un asset dans
+    # une page "Plus téléchargé" où il ne figure pas encore
+    cache = QueryCache()
+    cache.put(('list', ('', 'Nature', 'Tous', False), "Plus téléchargé", None, 24), [1], tags=[('asset', 1)])
+    cache.put(('list', ('', 'Art', 'Tous', False), "Plus téléchargé", None, 24), [2], tags=[('asset', 2)])
+    cache.put(('list', ('', 'Nature', 'Tous', False), "Plus récent", None, 24), [1], tags=[('asset', 1)])
+    cache.put(('count', ('', 'Nature', 'Tous', False)), 10)
+    asset = {'id': 99, 'category': 'Nature'}
+    dropped = cache.invalidate_where(
+        lambda key: key[0] == 'list' and key[2] == "Plus téléchargé" and key[1][1] in ("Tous", asset['category']))
+    assert dropped == 1
+    assert cache.get(('list', ('', 'Nature', 'Tous', False), "Plus téléchargé", None, 24)) is MISS
+    assert cache.get(('list', ('', 'Art', 'Tous', False), "Plus téléchargé", None, 24)) == [2]
+    assert cache.get(('count', ('', 'Nature', 'Tous', False))) == 10
+    assert cache.stats()['invalidations'] == 1
+
+
+def test_image_cache_respects_byte_budget():
+    cache = ImageCache(max_bytes=10)
+    cache.get_or_load('a', lambda: b'x' * 6)
+    cache.get_or_load('b', lambda: b'y' * 6)
+    assert cache.stats()['entries'] == 1 and cache.stats()['resident_bytes'] == 6
+    # Plus gros que le budget : servi mais pas gardé
+    assert cache.get_or_load('c', lambda: b'z' * 11) == b'z' * 11
+    assert cache.get_or_load('b', lambda: b'') == b'y' * 6
+
+
+def test_last_good_cache_reports_age(clock):
+    cache = LastGoodCache(max_entries=1, clock=clock)
+    assert cache.get('stats') is MISS
+    cache.put('stats', {'total': 3})
+    clock.now = 42
+    assert cache.get('stats') == ({'total': 3}, 42)
+    cache.put('other', 1)
+    assert cache.get('stats') is MISS
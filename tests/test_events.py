@@ -0,0 +1,97 @@
+import sqlite3
+from collections import Counter
+
+from postgrest.exceptions import APIError, generate_default_error_message
+
+from events import EventAggregator, write_batch
+from resilience import CircuitOpen, is_row_error
+
+
+class Table:
+    """Écritures tout-ou-rien, refusées si le lot contient une ligne de `bad`."""
+
+    def __init__(self, bad=(), error=None):
+        self.bad = set(bad)
+        self.error = error
+        self.rows = []
+        self.calls = 0
+
+    def write(self, batch):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        keys = list(batch)
+        if self.bad.intersection(keys):
+            raise APIError({'code': '23503', 'message': "violates foreign key constraint"})
+        self.rows.extend(keys)
+
+
+class Response:
+    status_code = 503
+    content = b"<html>503 Service Temporarily Unavailable</html>"
+
+
+def test_row_errors_are_split_until_isolated():
+    table = Table(bad={(1, 13), (2, 7)})
+    downloads = [(1, asset_id) for asset_id in range(20)] + [(2, 7)]
+    assert write_batch(table.write, downloads, "téléchargement(s)") is None
+    assert table.rows == [row for row in downloads if row not in table.bad]
+
+
+def test_row_errors_split_counters():
+    table = Table(bad={5})
+    views = Counter({asset_id: asset_id + 1 for asset_id in range(8)})
+    assert write_batch(table.write, views, "compteur(s) de vues") is None
+    assert sorted(table.rows) == [0, 1, 2, 3, 4, 6, 7]
+
+
+def test_outages_requeue_the_whole_batch():
+    downloads = [(1, asset_id) for asset_id in range(10)]
+    for error in (APIError(generate_default_error_message(Response())), CircuitOpen(5),
+                  ConnectionError("reset"), RuntimeError("bogue"), APIError({'code': '42883'})):
+        table = Table(error=error)
+        assert write_batch(table.write, downloads, "téléchargement(s)") == downloads
+        # Un seul appel : le lot n'est pas découpé
+        assert table.calls == 1
+
+
+def test_transient_error_in_a_half_keeps_only_that_half():
+    downloads = [(1, asset_id) for asset_id in range(8)]
+
+    def write(batch):
+        if (1, 0) in batch and len(batch) > 1:
+            raise APIError({'code': '23505'})
+        if (1, 7) in batch:
+            raise TimeoutError()
+
+    assert write_batch(write, downloads, "téléchargement(s)") == downloads[4:]
+
+
+def test_is_row_error():
+    assert is_row_error(APIError({'code': '23505'}))
+    assert is_row_error(APIError({'code': '22P02'}))
+    assert is_row_error(sqlite3.IntegrityError("FOREIGN KEY constraint failed"))
+    assert not is_row_error(APIError({'code': 503}))
+    assert not is_row_error(APIError({'code': 'PGRST000'}))
+    assert not is_row_error(APIError({'code': '42P01'}))
+    assert not is_row_error(ValueError("23505"))
+
+
+def test_aggregator_requeues_failed_flush():
+    table = Table(error=ConnectionError("reset"))
+    views = Table()
+    aggregator = EventAggregator(views.write, table.write, flush_interval=3600)
+    try:
+        aggregator.record_download(1, 10)
+        aggregator.record_view(10)
+        aggregator.record_view(10)
+        aggregator.flush()
+        assert aggregator.pending() == 1 and views.rows == [10]
+        table.error = None
+        aggregator.record_download(1, 11)
+        aggregator.flush()
+        assert aggregator.pending() == 0
+        # Le lot reporté reste devant les nouveaux téléchargements
+        assert table.rows == [(1, 10), (1, 11)]
+    finally:
+        aggregator.close()
@@ -0,0 +1,36 @@
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from images import DERIVATIVE_FORMAT, FORMAT_EXTENSIONS, PREVIEW_SIZE, THUMBNAIL_SIZE, build_derivatives
+
+
+def encode(image, **options):
+    buffered = BytesIO()
+    image.save(buffered, **options)
+    return buffered.getvalue()
+
+
+def test_derivatives_are_downscaled_and_original_kept():
+    data = encode(Image.new("RGB", (2400, 1600), "teal"), format="PNG")
+    derivatives = build_derivatives(data)
+    assert derivatives['original'] == (data, "png")
+    for name, size in (('preview', PREVIEW_SIZE), ('thumbnail', THUMBNAIL_SIZE)):
+        encoded, ext = derivatives[name]
+        assert ext == FORMAT_EXTENSIONS[DERIVATIVE_FORMAT]
+        assert max(Image.open(BytesIO(encoded)).size) == size
+    assert set(derivatives['hashes']) == {'phash', 'dhash', 'ahash'}
+
+
+def test_multi_picture_jpeg_is_stored_as_jpg():
+    # Photo de téléphone : image principale suivie d'un aperçu, lue par Pillow en "MPO"
+    frames = [Image.new("RGB", (640, 480), "orange"), Image.new("RGB", (160, 120), "orange")]
+    data = encode(frames[0], format="MPO", save_all=True, append_images=frames[1:])
+    assert Image.open(BytesIO(data)).format == "MPO"
+    assert build_derivatives(data)['original'] == (data, "jpg")
+
+
+def test_unsupported_format_is_rejected():
+    with pytest.raises(ValueError, match="BMP"):
+        build_derivatives(encode(Image.new("RGB", (10, 10)), format="BMP"))
@@ -0,0 +1,60 @@
+import io
+import random
+
+from PIL import Image, ImageFilter
+
+from perceptual import HashIndex, hamming, image_hashes, to_signed, to_unsigned
+
+
+def brute_force(hashes, phash, radius):
+    return sorted(asset_id for asset_id, other in hashes.items() if hamming(phash, other) <= radius)
+
+
+def test_index_matches_brute_force():
+    rng = random.Random(7)
+    base = [rng.getrandbits(64) for _ in range(20)]
+    hashes = {}
+    index = HashIndex()
+    for asset_id in range(2000):
+        # Des grappes de voisins proches autour de quelques empreintes, plus du bruit
+        value = base[asset_id % 20]
+        for bit in rng.sample(range(64), rng.randint(0, 20)):
+            value ^= 1 << bit
+        hashes[asset_id] = value
+        index.add(asset_id, value)
+    for radius in (0, 4, 9, 14):
+        for probe in base[:5] + [rng.getrandbits(64)]:
+            found = index.query(probe, radius)
+            assert sorted(asset_id for _, asset_id in found) == brute_force(hashes, probe, radius)
+            assert [distance for distance, _ in found] == sorted(distance for distance, _ in found)
+
+
+def test_remove_and_similar():
+    index = HashIndex()
+    index.add(1, 0b1111)
+    index.add(2, 0b1110)
+    index.add(3, ~0 & (2 ** 64 - 1))
+    assert index.similar(1) == [2]
+    index.remove(2)
+    assert index.similar(1) == []
+    assert len(index) == 2
+
+
+def test_signed_round_trip():
+    for value in (0, 1, 2 ** 63 - 1, 2 ** 63, 2 ** 64 - 1):
+        assert to_unsigned(to_signed(value)) == value
+        assert -2 ** 63 <= to_signed(value) < 2 ** 63
+
+
+def test_recompressed_image_is_a_duplicate():
+    rng = random.Random(1)
+    image = Image.new("RGB", (320, 240))
+    image.putdata([(rng.randrange(256), rng.randrange(256), rng.randrange(256)) for _ in range(320 * 240)])
+    image = image.filter(ImageFilter.GaussianBlur(8))
+    buffered = io.BytesIO()
+    image.resize((160, 120)).save(buffered, "JPEG", quality=60)
+    index = HashIndex()
+    hashes = image_hashes(image)
+    index.add(42, hashes['phash'], hashes['dhash'], hashes['ahash'])
+    assert index.find_duplicate(image_hashes(Image.open(buffered))) == 42
+    assert index.find_duplicate(image_hashes(image.transpose(Image.FLIP_LEFT_RIGHT))) is None
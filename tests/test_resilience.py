@@ -0,0 +1,155 @@
+import sqlite3
+import time
+
+import pytest
+from postgrest.exceptions import APIError, generate_default_error_message
+
+from resilience import CircuitBreaker, CircuitOpen, Overloaded, ResilientRepository, backoff_delays, is_transient
+
+
+class Backend:
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def _next(self):
+        self.calls += 1
+        outcome = self.outcomes.pop(0) if self.outcomes else "ok"
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    def list_assets(self):
+        return self._next()
+
+    def set_like(self):
+        return self._next()
+
+    def iter_assets(self):
+        yield from ()
+
+
+def make(backend, threshold=3, clock=time.monotonic, **options):
+    breaker = CircuitBreaker(failure_threshold=threshold, reset_timeout=10, clock=clock)
+    return ResilientRepository(backend, breaker, sleep=lambda seconds: None, **options)
+
+
+def test_transient_errors():
+    assert is_transient(TimeoutError())
+    assert is_transient(sqlite3.OperationalError("database is locked"))
+    assert not is_transient(sqlite3.OperationalError("no such table: assets"))
+    assert not is_transient(ValueError("bad column"))
+
+
+class GatewayResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.content = b"<html>Bad Gateway</html>"
+
+
+def test_postgrest_outages_are_transient():
+    # Erreurs telles que postgrest les lève : codes PGRST00x, ou statut HTTP (entier)
+    # quand la réponse n'est pas du JSON
+    for code in ('PGRST000', 'PGRST001', 'PGRST002', 'PGRST003', '57014', '08006'):
+        assert is_transient(APIError({'code': code, 'message': "indisponible"}))
+    for status in (429, 500, 502, 503, 504):
+        assert is_transient(APIError(generate_default_error_message(GatewayResponse(status))))
+    for code in ('PGRST116', '42P01', '23505', None):
+        assert not is_transient(APIError({'code': code}))
+    assert not is_transient(APIError(generate_default_error_message(GatewayResponse(404))))
+
+
+def test_postgrest_outage_is_retried_and_opens_the_breaker():
+    outage = APIError(generate_default_error_message(GatewayResponse(503)))
+    backend = Backend(outage, APIError({'code': 'PGRST003'}), "rows", *[outage] * 3)
+    repo = make(backend)
+    assert repo.list_assets() == "rows"
+    assert repo.stats()['retries'] == 2
+    with pytest.raises(APIError):
+        repo.list_assets()
+    assert repo.breaker.state == CircuitBreaker.OPEN
+
+
+def test_reads_are_retried_on_transient_errors():
+    backend = Backend(TimeoutError(), TimeoutError(), "rows")
+    repo = make(backend)
+    assert repo.list_assets() == "rows"
+    assert backend.calls == 3 and repo.stats()['retries'] == 2
+
+
+def test_permanent_errors_and_writes_are_not_retried():
+    backend = Backend(ValueError("bad"), TimeoutError())
+    repo = make(backend)
+    with pytest.raises(ValueError):
+        repo.list_assets()
+    with pytest.raises(TimeoutError):
+        repo.set_like()
+    assert backend.calls == 2
+    # Une erreur permanente ne compte pas comme une panne
+    assert repo.breaker.stats()['consecutive_failures'] == 1
+
+
+def test_breaker_opens_then_lets_one_probe_through(clock):
+    backend = Backend(*[TimeoutError()] * 3)
+    repo = make(backend, attempts=1, clock=clock)
+    for _ in range(3):
+        with pytest.raises(TimeoutError):
+            repo.list_assets()
+    assert repo.breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpen):
+        repo.list_assets()
+    assert backend.calls == 3
+
+    clock.now = 10
+    assert repo.breaker.state == CircuitBreaker.HALF_OPEN
+    repo.breaker.allow()  # appel d'essai pris par quelqu'un d'autre
+    with pytest.raises(CircuitOpen):
+        repo.list_assets()
+    repo.breaker.record_success()
+    assert repo.list_assets() == "ok"
+    assert repo.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_failed_probe_reopens_the_breaker(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+    clock.now = 10
+    breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.stats()['opens'] == 2
+
+
+def test_retries_stop_at_the_deadline(clock):
+
+    class SlowBackend(Backend):
+        def list_assets(self):
+            clock.now += 1.0  # chaque tentative dure une seconde avant d'échouer
+            return self._next()
+
+    backend = SlowBackend(*[TimeoutError()] * 5)
+    repo = ResilientRepository(backend, CircuitBreaker(failure_threshold=10, clock=clock), attempts=5,
+                               base_delay=0.1, deadline=1.5, sleep=lambda seconds: None, clock=clock)
+    with pytest.raises(TimeoutError):
+        repo.list_assets()
+    # La deuxième tentative commence avant l'échéance, la troisième l'aurait dépassée
+    assert backend.calls == 2
+
+
+def test_bounded_concurrency():
+    repo = make(Backend(), max_concurrent=1, acquire_timeout=0)
+    repo._slots.acquire()
+    with pytest.raises(Overloaded):
+        repo.list_assets()
+    repo._slots.release()
+    assert repo.list_assets() == "ok"
+
+
+def test_other_methods_pass_through():
+    backend = Backend()
+    repo = make(backend)
+    assert list(repo.iter_assets()) == []
+
+
+def test_backoff_delays_are_capped():
+    assert backoff_delays(5, base_delay=0.1, max_delay=0.3, rng=lambda: 1.0) == [0.1, 0.2, 0.3, 0.3]
@@ -0,0 +1,99 @@
+import pytest
+
+from search import InvertedIndex, MemorySearch, fold, matches_query, to_tsquery, tokenize
+
+ASSETS = [
+    {'id': 1, 'title': "Coucher de soleil", 'author': "Marie", 'tags': "plage, été",
+     'category': "Nature", 'asset_type': "Photo", 'is_premium': False},
+    {'id': 2, 'title': "Plage déserte", 'author': "Soleil Studio", 'tags': "mer",
+     'category': "Voyage", 'asset_type': "Photo", 'is_premium': True},
+    {'id': 3, 'title': "Logo", 'author': "Paul", 'tags': "soleil",
+     'category': "Nature", 'asset_type': "Vecteur", 'is_premium': False},
+    {'id': 4, 'title': "Bureau moderne", 'author': "Anne", 'tags': "business, soleil levant",
+     'category': "Business", 'asset_type': "Photo", 'is_premium': False},
+]
+
+
+@pytest.fixture
+def index():
+    index = InvertedIndex()
+    for asset in ASSETS:
+        index.add(asset)
+    return index
+
+
+def test_tokenize_folds_accents_and_drops_stopwords():
+    assert fold("Été à Montréal") == "ete a montreal"
+    assert tokenize("Le Coucher de SOLEIL, à l'été") == ["coucher", "soleil", "ete"]
+    assert to_tsquery(["coucher", "sol"]) == "coucher & sol:*"
+    assert to_tsquery([]) == ""
+
+
+def test_ligatures_are_spelled_out_like_unaccent():
+    assert tokenize("Œuvre du cœur") == ["oeuvre", "coeur"]
+    assert tokenize("Ex æquo, Straße") == ["ex", "aequo", "strasse"]
+    index = InvertedIndex()
+    index.add({**ASSETS[0], 'id': 5, 'title': "Chef-d'œuvre"})
+    assert index.search("oeuvre") == index.search("œuvre") == [5]
+
+
+def test_tag_match_ranks_above_title_and_author(index):
+    # 3 : étiquette exacte (bonus) ; 4 : étiquette "soleil levant" ; 1 : titre ; 2 : auteur
+    assert index.search("soleil") == [3, 4, 1, 2]
+
+
+def test_search_is_accent_insensitive(index):
+    assert index.search("ÉTÉ") == index.search("ete") == [1]
+
+
+def test_last_word_is_a_prefix_and_other_words_must_match(index):
+    assert index.search("coucher sol") == [1]
+    # Seul le dernier mot est un préfixe
+    assert index.search("sol coucher") == []
+    assert index.search("soleil inconnu") == []
+    # Un préfixe compte moins que le mot complet
+    assert index.search("plag") == [1, 2]
+
+
+def test_filters(index):
+    assert index.search("soleil", category="Nature") == [3, 1]
+    assert index.search("soleil", asset_type="Photo") == [4, 1, 2]
+    assert index.search("soleil", premium_only=True) == [2]
+    assert index.search("soleil", category="Art") == []
+
+
+def test_remove_and_readd(index):
+    index.remove(3)
+    assert 3 not in index.search("soleil")
+    index.add({**ASSETS[2], 'tags': "lune"})
+    assert index.search("lune") == [3]
+    assert 3 not in index.search("soleil")
+    assert len(index) == len(ASSETS)
+
+
+def test_empty_query(index):
+    assert index.search("") == []
+    assert index.search("le de la") == []
+
+
+def test_memory_search_pages_and_counts():
+    rows = {asset['id']: asset for asset in ASSETS}
+    fetched = []
+
+    def fetch_rows(ids, columns):
+        fetched.append(list(ids))
+        return [rows[asset_id] for asset_id in ids]
+
+    search = MemorySearch(fetch_rows, ASSETS)
+    assert search.count("soleil") == 4
+    page = search.search("soleil", offset=1, limit=2)
+    assert [row['id'] for row in page] == [4, 1]
+    # Seules les lignes de la page sont chargées
+    assert fetched == [[4, 1]]
+    assert search.search("introuvable") == []
+
+
+def test_matches_query_agrees_with_index(index):
+    for query in ("soleil", "coucher sol", "plag", "ete", "mer soleil", ""):
+        found = set(index.search(query)) if tokenize(query) else {asset['id'] for asset in ASSETS}
+        assert {asset['id'] for asset in ASSETS if matches_query(asset, query)} == found